@@ -0,0 +1,114 @@
+"""
+Compares cohort queries over test results run as Python loops over every patient's record with the same queries run
+over the NumPy columns of analytics.ResultColumns, and measures the cost of keeping the columns up to date.
+
+Run from the repository root with: python3 -m benchmarks.bench_analytics [number of patients]
+"""
+import datetime
+import random
+import sys
+import time
+
+from src.analytics import ResultColumns
+from src.health_records_system import ConflictPolicy, HealthRecordsSystem, Patient
+
+DEFAULT_PATIENTS = 100000
+RESULTS_PER_PATIENT = 10
+REPEAT = 3
+FIRST_DAY = datetime.date(2021, 1, 1)
+
+
+def _populate(n):
+    random.seed(0)
+    patients = []
+    for i in range(n):
+        patient = Patient(i, f"Patient {i}", random.randrange(18, 95), 5550000 + i)
+        dates = [(FIRST_DAY + datetime.timedelta(days=day)).strftime("%d/%m/%Y") for day in range(RESULTS_PER_PATIENT)]
+        patient.add_test_results_bulk((test, date, str(round(random.gauss(mean, 15), 1)))
+                                      for date in dates for test, mean in (("creatinine", 90), ("glucose", 100)))
+        patients.append(patient)
+    return patients
+
+
+def _parse(date):
+    day, month, year = date.split("/")
+    return datetime.date(int(year), int(month), int(day))
+
+
+def naive_mean_by_age(system, test):
+    sums, counts = {}, {}
+    for patient in system.patients():
+        band = patient.age // 10 * 10
+        for (name, date), result in patient.test_results.items():
+            if name == test:
+                sums[band] = sums.get(band, 0) + float(result)
+                counts[band] = counts.get(band, 0) + 1
+    return {band: sums[band] / counts[band] for band in sums}
+
+
+def naive_rising(system, test, fraction):
+    rising = []
+    for patient in system.patients():
+        results = sorted((_parse(date), float(result)) for (name, date), result in patient.test_results.items()
+                         if name == test)
+        if len(results) >= 2 and results[-2][1] > 0 and results[-1][1] - results[-2][1] > fraction * results[-2][1]:
+            rising.append(patient.id)
+    return rising
+
+
+def best(function, *args):
+    """
+    :return: (result, fastest time in milliseconds of several repeats)
+    """
+    fastest = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = function(*args)
+        fastest = min(fastest, time.perf_counter() - start)
+    return result, fastest * 1e3
+
+
+def bench_updates(system, patients, columns):
+    """
+    :return: microseconds per added test result, with and without the columns observing the system
+    """
+    times = []
+    for attached, date in ((False, "01/06/2021"), (True, "02/06/2021")):
+        if not attached:
+            system.detach(columns)
+        start = time.perf_counter()
+        for patient in patients:
+            patient.insert_test_results("HbA1c", date, "48", ConflictPolicy.ERROR)
+        times.append((time.perf_counter() - start) / len(patients) * 1e6)
+        if not attached:
+            system.attach(columns)
+    return times
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATIENTS
+    system = HealthRecordsSystem.get_instance()
+    patients = _populate(n)
+    system.add_patients_bulk(patients)
+    start = time.perf_counter()
+    columns = ResultColumns(system)
+    print(f"{n:,} patients, {len(columns):,} numeric test results loaded into columns in "
+          f"{time.perf_counter() - start:.2f} s")
+
+    print(f"{'query':>26} {'loop (ms)':>10} {'columns (ms)':>13} {'speedup':>8}")
+    for name, naive, vectorized in [
+            ("mean creatinine by age", lambda: naive_mean_by_age(system, "creatinine"),
+             lambda: columns.aggregate("creatinine")),
+            ("creatinine rising by 30%", lambda: sorted(naive_rising(system, "creatinine", 0.3)),
+             lambda: sorted(columns.rising("creatinine", 0.3)))]:
+        expected, naive_time = best(naive)
+        result, vectorized_time = best(vectorized)
+        assert expected.keys() == result.keys() if isinstance(expected, dict) else expected == result
+        print(f"{name:>26} {naive_time:>10.1f} {vectorized_time:>13.1f} {naive_time / vectorized_time:>7.0f}x")
+
+    without, with_columns = bench_updates(system, patients, columns)
+    print(f"Adding a test result: {without:.2f} us without columns, {with_columns:.2f} us with columns")
+
+
+if __name__ == "__main__":
+    main()
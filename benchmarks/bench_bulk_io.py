@@ -0,0 +1,72 @@
+"""
+Measures the throughput of importing and exporting patients and test results as CSV and JSON Lines files, and checks
+that exporting does not use memory in proportion to the size of the file. Also measures how parallel imports scale
+with the number of worker processes.
+
+Run from the repository root with: python3 -m benchmarks.bench_bulk_io [number of patients]
+"""
+import os
+import sys
+import tempfile
+
+from src.bulk_io import export, import_parallel, import_patients, import_test_results
+from src.health_records_system import HealthRecordsSystem
+
+DEFAULT_PATIENTS = 1000000
+RESULTS_PER_PATIENT = 2
+WORKER_COUNTS = [1, 2, 4, 8]
+
+
+def _rss():
+    """
+    :return: resident set size of the process in bytes, as reported by Linux
+    """
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _write_files(directory, n):
+    patients_path = os.path.join(directory, "patients.csv")
+    with open(patients_path, "w") as output:
+        output.write("id,name,age,phone_number\n")
+        for i in range(n):
+            output.write(f"{i},Patient {i},{20 + i % 80},{5550000 + i}\n")
+    results_path = os.path.join(directory, "test_results.csv")
+    with open(results_path, "w") as output:
+        output.write("patient_id,name,date,result\n")
+        for i in range(n):
+            for day in range(1, RESULTS_PER_PATIENT + 1):
+                output.write(f"{i},glucose,{day:02}/01/2021,5.4\n")
+    return patients_path, results_path
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATIENTS
+    system = HealthRecordsSystem.get_instance()
+    with tempfile.TemporaryDirectory() as directory:
+        patients_path, results_path = _write_files(directory, n)
+        print(f"{n:,} patients, {n * RESULTS_PER_PATIENT:,} test results")
+        print(f"Import patients (CSV):      {import_patients(system, patients_path)}")
+        print(f"Import test results (CSV):  {import_test_results(system, results_path)}")
+
+        for kind, name in [("patients", "patients.jsonl"), ("patients", "patients.csv"),
+                           ("test_results", "test_results.csv")]:
+            path = os.path.join(directory, "export-" + name)
+            rss = _rss()
+            report = export(system, kind, path)
+            print(f"Export {kind} ({name.split('.')[1].upper()}): {report}, "
+                  f"{os.path.getsize(path) / 1e6:,.0f} MB written, RSS +{(_rss() - rss) / 1e6:,.1f} MB")
+
+        jsonl_path = os.path.join(directory, "export-patients.jsonl")
+        HealthRecordsSystem._reset()
+        system = HealthRecordsSystem.get_instance()
+        print(f"Import patients (JSONL):    {import_patients(system, jsonl_path)}")
+        print(f"Parallel import of patients (JSONL) on {os.cpu_count()} processors:")
+        for workers in WORKER_COUNTS:
+            HealthRecordsSystem._reset()
+            system = HealthRecordsSystem.get_instance()
+            print(f"{workers:>3} workers: {import_parallel(system, 'patients', jsonl_path, workers=workers)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Measures how long it takes to load a large population through the non-interactive bulk API, with no console I/O.
+
+Run from the repository root with: python3 -m benchmarks.bench_bulk_load [number of patients]
+"""
+import sys
+import time
+
+from src.health_records_system import HealthRecordsSystem, Patient, WriteResult
+
+DEFAULT_PATIENTS = 1000000
+TESTS_PER_PATIENT = 5
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATIENTS
+    system = HealthRecordsSystem.get_instance()
+
+    start = time.perf_counter()
+    counts = system.add_patients_bulk(Patient(i, f"Patient {i}", 20 + i % 80, 5550000 + i) for i in range(n))
+    load_time = time.perf_counter() - start
+    print(f"Loaded {counts[WriteResult.ADDED]} patients in {load_time:.2f}s ({n / load_time:,.0f} patients/s)")
+
+    start = time.perf_counter()
+    for i in range(0, n, 10):
+        system.get_patient(i).add_test_results_bulk(
+            ("glucose", f"{day + 1:02d}/01/2021", "5.4") for day in range(TESTS_PER_PATIENT))
+    load_time = time.perf_counter() - start
+    total = len(range(0, n, 10)) * TESTS_PER_PATIENT
+    print(f"Loaded {total} test results in {load_time:.2f}s ({total / load_time:,.0f} results/s)")
+
+
+if __name__ == "__main__":
+    main()
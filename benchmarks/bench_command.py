@@ -0,0 +1,55 @@
+"""
+Measures the per-call cost of AddMedicationCommand.execute and AddTestResultsCommand.execute as the patient's record
+grows. With delta-based undo state the cost per add should stay flat regardless of record size.
+
+Run from the repository root with: python3 -m benchmarks.bench_command
+"""
+import contextlib
+import os
+import timeit
+
+from src.command import AddMedicationCommand, AddTestResultsCommand
+from src.health_records_system import HealthRecordsSystem, Patient, Medication
+
+RECORD_SIZES = [10, 100, 1000, 10000]
+ADDS_PER_SIZE = 1000
+
+
+def _patient_with_records(size):
+    patient = Patient(1, "Jane", 20, 123)
+    for i in range(size):
+        patient.insert_medication(Medication(f"med-{i}", "1 tablet", "once a day"))
+    patient.add_test_results_bulk(("glucose", f"day-{i}", str(i)) for i in range(size))
+    return patient
+
+
+def bench_add_medication(system, size):
+    command = AddMedicationCommand(system)
+    patient = _patient_with_records(size)
+    meds = [Medication(f"new-med-{i}", "1 tablet", "once a day") for i in range(ADDS_PER_SIZE)]
+    meds_iter = iter(meds)
+    return timeit.timeit(lambda: command.execute(patient, next(meds_iter)), number=ADDS_PER_SIZE) / ADDS_PER_SIZE
+
+
+def bench_add_test_results(system, size):
+    command = AddTestResultsCommand(system)
+    patient = _patient_with_records(size)
+    dates = iter([f"new-day-{i}" for i in range(ADDS_PER_SIZE)])
+    return timeit.timeit(lambda: command.execute(patient, "glucose", next(dates), "5.4"),
+                         number=ADDS_PER_SIZE) / ADDS_PER_SIZE
+
+
+def main():
+    system = HealthRecordsSystem.get_instance()
+    rows = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for size in RECORD_SIZES:
+            rows.append((size, bench_add_medication(system, size), bench_add_test_results(system, size)))
+
+    print(f"{'record size':>12} {'add medication (us)':>20} {'add test results (us)':>22}")
+    for size, med_time, test_time in rows:
+        print(f"{size:>12} {med_time * 1e6:>20.2f} {test_time * 1e6:>22.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Stress test of the Health Records System shared between threads. Each thread acts as a clinician with their own
+Invoker session, looking up random patients and adding test results to them through AddTestResultsCommand. Reports
+the total throughput as the number of threads grows, and checks that no change was lost.
+
+Run from the repository root with: python3 -m benchmarks.bench_concurrency [operations per thread]
+"""
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+
+from src.command import AddTestResultsCommand, Invoker
+from src.health_records_system import HealthRecordsSystem, Patient
+
+PATIENTS = 10000
+THREAD_COUNTS = [1, 2, 4, 8, 16]
+DEFAULT_OPERATIONS = 20000
+WRITE_RATIO = 0.2
+
+
+def clinician(system, invoker, command, thread, operations, writes):
+    rng = random.Random(thread)
+    for i in range(operations):
+        patient = system.find_patient(rng.randrange(PATIENTS))
+        if rng.random() < WRITE_RATIO:
+            # every thread writes its own test, so no write conflicts with another
+            invoker.execute(command, patient, f"test-{thread}", f"run-{i}", "5.4")
+            writes[thread] += 1
+        else:
+            patient.latest("glucose")
+
+
+def bench(thread_count, operations):
+    """
+    :return: (operations per second, number of test results written, number of test results lost)
+    """
+    HealthRecordsSystem._reset()
+    system = HealthRecordsSystem()
+    system.add_patients_bulk(Patient(i, f"Patient {i}", 20 + i % 80, 5550000 + i) for i in range(PATIENTS))
+    command = AddTestResultsCommand(system)
+    invoker = Invoker()
+    invoker.register(command)
+
+    writes = [0] * thread_count
+    threads = [threading.Thread(target=clinician, args=(system, invoker.session(), command, i, operations, writes))
+               for i in range(thread_count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    written = sum(len(patient.test_results) for patient in system.patients())
+    return thread_count * operations / elapsed, written, sum(writes) - written
+
+
+def main():
+    operations = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_OPERATIONS
+    rows = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for thread_count in THREAD_COUNTS:
+            rows.append((thread_count,) + bench(thread_count, operations))
+
+    print(f"{'threads':>8} {'operations/s':>14} {'results written':>16} {'results lost':>13}")
+    for thread_count, rate, written, lost in rows:
+        print(f"{thread_count:>8} {rate:>14,.0f} {written:>16,} {lost:>13,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Compares the memory retained by the in-memory command history with a DiskHistory as a session grows, and the time
+taken to execute and undo commands with each. Every command removes a patient with a full record, which the in-memory
+history keeps alive.
+
+Run from the repository root with: python3 -m benchmarks.bench_history [number of commands]
+"""
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from src.command import AddPatientCommand, Invoker, RemovePatientCommand
+from src.disk_history import DiskHistory
+from src.health_records_system import ConflictPolicy, HealthRecordsSystem, Medication, Patient
+
+DEFAULT_COMMANDS = 20000
+CHECKPOINTS = 4
+
+
+def _patient(i):
+    patient = Patient(i, f"Patient {i}", 20 + i % 80, 5550000 + i)
+    for j in range(5):
+        patient.insert_medication(Medication(f"Drug {j}", "1 tablet", "once a day"))
+    patient.add_test_results_bulk(("glucose", f"{day:02}/01/2021", "5.4") for day in range(1, 21))
+    return patient
+
+
+def bench(commands, directory):
+    """
+    :return: list of (commands executed, MB retained) at each checkpoint, microseconds per execute and per undo
+    """
+    HealthRecordsSystem._reset()
+    system = HealthRecordsSystem()
+    add, remove = AddPatientCommand(system, ConflictPolicy.ERROR), RemovePatientCommand(system, ConflictPolicy.ERROR)
+    invoker = Invoker(verbose=False)
+    invoker.register(add)
+    invoker.register(remove)
+    if directory is not None:
+        invoker.use_history(DiskHistory(directory, system, max_entries=commands))
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    retained = []
+    elapsed = 0
+    for i in range(commands):
+        patient = _patient(i)
+        system.insert_patient(patient)
+        start = time.perf_counter()
+        invoker.execute(remove, patient)
+        elapsed += time.perf_counter() - start
+        del patient
+        if (i + 1) % (commands // CHECKPOINTS) == 0:
+            retained.append((i + 1, (tracemalloc.get_traced_memory()[0] - baseline) / 1e6))
+    tracemalloc.stop()
+
+    undo_count = min(commands, 1000)
+    start = time.perf_counter()
+    for _ in range(undo_count):
+        invoker.undo()
+    return retained, elapsed / commands * 1e6, (time.perf_counter() - start) / undo_count * 1e6
+
+
+def main():
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COMMANDS
+    with tempfile.TemporaryDirectory() as directory:
+        for name, history_directory in (("in memory", None), ("on disk", directory)):
+            retained, execute_time, undo_time = bench(commands, history_directory)
+            print(f"History {name}: {execute_time:.1f} us per execute, {undo_time:.1f} us per undo")
+            for executed, megabytes in retained:
+                print(f"  {executed:>8,} commands: {megabytes:>7.1f} MB retained")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Measures the startup time and memory of a system whose patients are memory-mapped from a store file, against loading
+every patient into memory. Startup of the mapped store should not depend on the number of patients, and its memory
+should track the patients that are used rather than all patients in the file.
+
+Run from the repository root with: python3 -m benchmarks.bench_mapped_store [number of patients]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from src.health_records_system import HealthRecordsSystem, Patient
+from src.mapped_store import MappedPatients, write_store
+
+DEFAULT_PATIENTS = 1000000
+WORKING_SET = 1000
+LOOKUPS = 100000
+
+
+def _records(n):
+    for i in range(n):
+        record = {"id": i, "name": f"Patient {i}", "age": 20 + i % 80, "phone_number": 5550000 + i,
+                  "medication": [{"name": "Advil", "dosage": "1 tablet", "frequency": "once a day"}],
+                  "test_results": [["glucose", "01/01/2021", "5.4"], ["glucose", "01/02/2021", "5.6"]]}
+        yield i, json.dumps(record).encode()
+
+
+def _new_system():
+    HealthRecordsSystem._reset()
+    return HealthRecordsSystem()
+
+
+def _rss():
+    """
+    :return: resident set size of the process in bytes, as reported by Linux
+    """
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def bench_eager(path):
+    """
+    :return: seconds to load every patient into memory
+    """
+    system = _new_system()
+    start = time.perf_counter()
+    patients = MappedPatients(path)
+    system.add_patients_bulk(Patient.from_dict(json.loads(record)) for _, record in patients.records())
+    elapsed = time.perf_counter() - start
+    patients.close()
+    return elapsed
+
+
+def bench_mapped(path, n):
+    """
+    :return: (seconds to open the store, lookups per second over the working set)
+    """
+    system = _new_system()
+    ids = random.Random(0).sample(range(n), min(WORKING_SET, n))
+    start = time.perf_counter()
+    system.mount(MappedPatients(path, system))
+    open_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(LOOKUPS):
+        system.find_patient(ids[i % len(ids)])
+    return open_time, LOOKUPS / (time.perf_counter() - start)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATIENTS
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "patients.dat")
+        write_store(path, _records(n))
+        print(f"{n} patients, store file of {os.path.getsize(path) / 1e6:,.1f} MB")
+
+        rss = _rss()
+        open_time, lookup_rate = bench_mapped(path, n)
+        print(f"Mapped: opened in {open_time * 1e3:.2f}ms, {lookup_rate:,.0f} lookups/s over {WORKING_SET} patients, "
+              f"RSS +{(_rss() - rss) / 1e6:,.1f} MB")
+        rss = _rss()
+        load_time = bench_eager(path)
+        print(f"Eager:  loaded in {load_time:.2f}s, RSS +{(_rss() - rss) / 1e6:,.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
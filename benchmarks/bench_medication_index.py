@@ -0,0 +1,70 @@
+"""
+Measures co-occurrence lookups of the patients taking two medications, e.g. two interacting drugs, through the
+medication index compared with scanning every patient's medication, and the cost the index adds to changing it.
+
+Run from the repository root with: python3 -m benchmarks.bench_medication_index [number of patients]
+"""
+import random
+import sys
+import time
+
+from src.command import AddMedicationCommand, Invoker
+from src.health_records_system import HealthRecordsSystem, Medication, Patient
+
+DEFAULT_PATIENTS = 200000
+MEDICATION = ["Advil", "Amoxicillin", "Atorvastatin", "Lisinopril", "Metformin", "Omeprazole", "Simvastatin",
+              "Levothyroxine", "Amlodipine", "Metoprolol", "Warfarin", "Clopidogrel"]
+PAIRS = [("Warfarin", "Advil"), ("Clopidogrel", "Omeprazole"), ("Simvastatin", "Amlodipine")]
+CHANGES = 20000
+
+
+def best_of(function, repeat=5):
+    """
+    :return: fastest of several runs, in milliseconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1e3)
+    return min(times)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATIENTS
+    random.seed(0)
+    system = HealthRecordsSystem.get_instance()
+    patients = []
+    for i in range(n):
+        patient = Patient(i, f"Patient {i}", 20 + i % 80, 5550000 + i)
+        for med_name in random.sample(MEDICATION, random.randint(0, 3)):
+            patient.insert_medication(Medication(med_name, "1 tablet", "once a day"))
+        patients.append(patient)
+    system.add_patients_bulk(patients)
+    print(f"{n:,} patients")
+
+    print(f"{'pair':>28} {'patients':>9} {'scan (ms)':>10} {'index (ms)':>11}")
+    for first, second in PAIRS:
+        scan = lambda: [patient for patient in system.patients()
+                        if first in patient.medication and second in patient.medication]
+        found = system.find_by_medication(first, second)
+        assert len(found) == len(scan())
+        print(f"{first + ' + ' + second:>28} {len(found):>9,} {best_of(scan):>10.2f} "
+              f"{best_of(lambda: system.find_by_medication(first, second)):>11.2f}")
+
+    invoker = Invoker(verbose=False)
+    command = AddMedicationCommand(system, "overwrite")
+    invoker.register(command)
+    targets = [(random.choice(patients), Medication(random.choice(MEDICATION), "2 tablets", "twice a day"))
+               for _ in range(CHANGES)]
+    start = time.perf_counter()
+    for patient, med in targets:
+        invoker.execute(command, patient, med)
+    while invoker.undo():
+        pass
+    elapsed = time.perf_counter() - start
+    print(f"{CHANGES:,} AddMedicationCommands executed and undone: {elapsed / CHANGES * 1e6:.1f} us per command")
+
+
+if __name__ == "__main__":
+    main()
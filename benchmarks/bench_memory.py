@@ -0,0 +1,99 @@
+"""
+Compares the memory used per patient by the compact Patient and Medication classes against the previous layout,
+where every object had a per-instance __dict__, the age was kept as the string typed by the user and medication
+strings were not shared between patients.
+
+Run from the repository root with: python3 -m benchmarks.bench_memory [number of patients]
+"""
+import sys
+import tracemalloc
+
+from src.health_records_system import Patient, Medication
+
+DEFAULT_PATIENTS = 100000
+MEDICATIONS = [("Advil", "1 tablet", "once a day"), ("Metformin", "500 mg", "twice a day")]
+TESTS = [("glucose", "01/01/2021", "5.4"), ("glucose", "01/02/2021", "5.6"), ("HbA1c", "01/02/2021", "6.1")]
+
+
+class LegacyPatient(object):
+
+    def __init__(self, id, name, age, phone_number):
+        self._id = id
+        self._name = name
+        self._age = age
+        self._phone_number = phone_number
+        self._medication = {}
+        self._test_results = {}
+
+
+class LegacyMedication(object):
+
+    def __init__(self, name, dosage, frequency):
+        self._name = name
+        self._dosage = dosage
+        self._frequency = frequency
+
+
+def _copy(value):
+    """
+    :return: a new string equal to the value, as produced by input()
+    """
+    return "".join(list(value))
+
+
+def build_legacy(n, with_records=True):
+    patients = {}
+    for i in range(n):
+        patient = LegacyPatient(str(i), f"Patient {i}", _copy(str(20 + i % 80)), f"555-{i:07d}")
+        if not with_records:
+            patients[patient._id] = patient
+            continue
+        for name, dosage, frequency in MEDICATIONS:
+            patient._medication[_copy(name)] = LegacyMedication(_copy(name), _copy(dosage), _copy(frequency))
+        for name, date, result in TESTS:
+            patient._test_results[(_copy(name), _copy(date))] = _copy(result)
+        patients[patient._id] = patient
+    return patients
+
+
+def build_compact(n, with_records=True):
+    patients = {}
+    for i in range(n):
+        patient = Patient(str(i), f"Patient {i}", _copy(str(20 + i % 80)), f"555-{i:07d}")
+        if not with_records:
+            patients[patient.id] = patient
+            continue
+        for name, dosage, frequency in MEDICATIONS:
+            patient.insert_medication(Medication(_copy(name), _copy(dosage), _copy(frequency)))
+        patient.add_test_results_bulk((_copy(name), _copy(date), _copy(result)) for name, date, result in TESTS)
+        patients[patient.id] = patient
+    return patients
+
+
+def measure(build, n, with_records=True):
+    """
+    :return: the number of bytes allocated per patient by the build function
+    """
+    tracemalloc.start()
+    patients = build(n, with_records)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del patients
+    return size / n
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATIENTS
+    for with_records in [True, False]:
+        legacy = measure(build_legacy, n, with_records)
+        compact = measure(build_compact, n, with_records)
+        if with_records:
+            print(f"{n} patients with {len(MEDICATIONS)} medications and {len(TESTS)} test results each")
+        else:
+            print(f"{n} patients without medication or test results")
+        print(f"Previous layout: {legacy:,.0f} bytes per patient")
+        print(f"Compact layout:  {compact:,.0f} bytes per patient ({100 * (1 - compact / legacy):.0f}% smaller)")
+
+
+if __name__ == "__main__":
+    main()
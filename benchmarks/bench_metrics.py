@@ -0,0 +1,60 @@
+"""
+Measures the overhead of Invoker metrics on executing and undoing commands: with metrics disabled, enabled, and enabled
+with a sample of the commands profiled.
+
+Run from the repository root with: python3 -m benchmarks.bench_metrics [number of commands]
+"""
+import sys
+import time
+
+from src.command import AddTestResultsCommand, Invoker
+from src.health_records_system import ConflictPolicy, HealthRecordsSystem, Patient
+from src.metrics import InvokerMetrics
+
+DEFAULT_COMMANDS = 100000  # at most 336 per patient, so that every date is different
+REPEAT = 5
+PATIENTS = 1000
+
+
+def bench(metrics, commands):
+    """
+    :return: (microseconds per execute, microseconds per undo), the fastest of several repeats
+    """
+    HealthRecordsSystem._reset()
+    system = HealthRecordsSystem()
+    patients = [Patient(i, f"Patient {i}", 20, 5550000 + i) for i in range(PATIENTS)]
+    system.add_patients_bulk(patients)
+    command = AddTestResultsCommand(system, ConflictPolicy.ERROR)
+    # spread over many patients, so that the time is not dominated by one ever-growing record
+    calls = [(patients[i % PATIENTS], "glucose", f"{i // PATIENTS % 28 + 1:02}/{i // PATIENTS // 28 % 12 + 1:02}/2021")
+             for i in range(commands)]
+    best = (float("inf"), float("inf"))
+    for _ in range(REPEAT):
+        invoker = Invoker(verbose=False, metrics=metrics)
+        invoker.register(command)
+        start = time.perf_counter()
+        for patient, name, date in calls:
+            invoker.execute(command, patient, name, date, "5.4")
+        execute_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(commands):
+            invoker.undo()
+        undo_time = time.perf_counter() - start
+        best = (min(best[0], execute_time / commands * 1e6), min(best[1], undo_time / commands * 1e6))
+    return best
+
+
+def main():
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COMMANDS
+    rows = [("disabled", bench(None, commands)),
+            ("enabled", bench(InvokerMetrics(), commands)),
+            ("slow tracking", bench(InvokerMetrics(slow_threshold=0.01), commands)),
+            ("profile 1 in 1000", bench(InvokerMetrics(slow_threshold=0.01, profile_every=1000), commands))]
+
+    print(f"{'metrics':>18} {'execute (us)':>13} {'undo (us)':>10}")
+    for name, (execute_time, undo_time) in rows:
+        print(f"{name:>18} {execute_time:>13.2f} {undo_time:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
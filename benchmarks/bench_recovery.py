@@ -0,0 +1,67 @@
+"""
+Measures how long the Health Records System takes to recover from its storage: mapping the last snapshot and
+replaying the write-ahead log written after it. Also reports the write throughput of the log for several group commit
+sizes.
+
+Run from the repository root with: python3 -m benchmarks.bench_recovery [number of patients]
+"""
+import sys
+import tempfile
+import time
+
+from src.health_records_system import ConflictPolicy, HealthRecordsSystem, Patient
+from src.storage import Storage
+
+DEFAULT_PATIENTS = 1000000
+LOGGED_CHANGES = 10000
+SYNC_EVERY = [1, 10, 100, 1000]
+
+
+def _new_system():
+    HealthRecordsSystem._reset()
+    return HealthRecordsSystem()
+
+
+def bench_log_throughput(directory, sync_every):
+    """
+    :return: the number of changes logged per second
+    """
+    system = _new_system()
+    storage = Storage(directory, sync_every=sync_every)
+    storage.open(system)
+    start = time.perf_counter()
+    for i in range(LOGGED_CHANGES):
+        system.insert_patient(Patient(f"log-{sync_every}-{i}", f"Patient {i}", 20 + i % 80, 5550000 + i))
+    storage.flush()
+    return LOGGED_CHANGES / (time.perf_counter() - start)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATIENTS
+
+    with tempfile.TemporaryDirectory() as directory:
+        for sync_every in SYNC_EVERY:
+            with tempfile.TemporaryDirectory() as log_directory:
+                rate = bench_log_throughput(log_directory, sync_every)
+            print(f"sync_every={sync_every:>5}: {rate:,.0f} changes/s")
+
+        # build a store with n patients in its snapshot and some changes in its log
+        system = _new_system()
+        storage = Storage(directory, sync_every=1000)
+        storage.open(system)
+        system.add_patients_bulk(Patient(i, f"Patient {i}", 20 + i % 80, 5550000 + i) for i in range(n))
+        storage.checkpoint()
+        for i in range(LOGGED_CHANGES):
+            system.find_patient(i % n).insert_test_results("glucose", f"{i % 28 + 1:02d}/01/2021", "5.4",
+                                                            ConflictPolicy.OVERWRITE)
+        storage.flush()
+
+        system = _new_system()
+        start = time.perf_counter()
+        replayed = Storage(directory).open(system)
+        recovery_time = time.perf_counter() - start
+        print(f"Recovered {n} patients and replayed {replayed} logged changes in {recovery_time:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Measures the memory each reader process needs to read the patients of a Health Records System through a shared memory
+replica, compared with loading its own copy of every patient, and the time to publish a snapshot and look patients up.
+Memory is the growth of each reader's private resident memory (RssAnon), so it requires Linux.
+
+Run from the repository root with: python3 -m benchmarks.bench_replica [number of patients] [number of readers]
+"""
+import multiprocessing
+import os
+import pickle
+import random
+import sys
+import tempfile
+import time
+
+from src.health_records_system import HealthRecordsSystem, Medication, Patient
+from src.replica import ReplicaPublisher, ReplicaReader
+
+DEFAULT_PATIENTS = 200000
+DEFAULT_READERS = 4
+LOOKUPS = 20000
+
+
+def _private_memory():
+    """
+    :return: private resident memory of this process, in bytes
+    """
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("RssAnon:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _replica_reader(name, n, results):
+    before = _private_memory()
+    reader = ReplicaReader(name)
+    ids = [random.randrange(n) for _ in range(LOOKUPS)]
+    start = time.perf_counter()
+    for id in ids:
+        reader.find_patient(id)
+    elapsed = time.perf_counter() - start
+    results.put((_private_memory() - before, elapsed / LOOKUPS))
+    reader.close()
+
+
+def _copying_reader(path, n, results):
+    before = _private_memory()
+    with open(path, "rb") as dump:
+        patients = {patient.id: patient for patient in pickle.load(dump)}
+    ids = [random.randrange(n) for _ in range(LOOKUPS)]
+    start = time.perf_counter()
+    for id in ids:
+        patients.get(id)
+    elapsed = time.perf_counter() - start
+    results.put((_private_memory() - before, elapsed / LOOKUPS))
+
+
+def _run_readers(context, target, argument, n, readers):
+    """
+    :return: (mean memory growth in bytes, mean seconds per lookup) of the readers
+    """
+    results = context.Queue()
+    processes = [context.Process(target=target, args=(argument, n, results)) for _ in range(readers)]
+    for process in processes:
+        process.start()
+    measured = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return sum(memory for memory, _ in measured) / readers, sum(latency for _, latency in measured) / readers
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATIENTS
+    readers = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_READERS
+    random.seed(0)
+    system = HealthRecordsSystem.get_instance()
+    patients = []
+    for i in range(n):
+        patient = Patient(i, f"Patient {i}", 20 + i % 80, 5550000 + i)
+        patient.insert_medication(Medication("Metformin", "500 mg", "twice a day"))
+        for day in range(1, 4):
+            patient.insert_test_results("HbA1c", f"{day:02d}/06/2021", round(random.uniform(4.5, 9.5), 1))
+        patients.append(patient)
+    system.add_patients_bulk(patients)
+
+    publisher = ReplicaPublisher(system, f"bench_replica_{os.getpid()}")
+    start = time.perf_counter()
+    publisher.publish()
+    print(f"{n:,} patients, snapshot published in {time.perf_counter() - start:.2f} s")
+
+    # readers are started afresh rather than forked, so they do not share this process's patients
+    context = multiprocessing.get_context("spawn")
+    print(f"{'reader':>20} {'memory per reader (MB)':>23} {'lookup (us)':>12}")
+    try:
+        memory, latency = _run_readers(context, _replica_reader, publisher.name, n, readers)
+        print(f"{'shared replica':>20} {memory / 2 ** 20:>23.1f} {latency * 1e6:>12.2f}")
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "patients.pickle")
+            with open(path, "wb") as dump:
+                pickle.dump(patients, dump)
+            memory, latency = _run_readers(context, _copying_reader, path, n, readers)
+        print(f"{'own copy':>20} {memory / 2 ** 20:>23.1f} {latency * 1e6:>12.2f}")
+    finally:
+        publisher.close()
+
+
+if __name__ == "__main__":
+    main()
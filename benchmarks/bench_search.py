@@ -0,0 +1,79 @@
+"""
+Measures typeahead search over patient names: the time to build the index, and the latency of prefix and fuzzy queries
+compared with scanning every patient's name.
+
+Run from the repository root with: python3 -m benchmarks.bench_search [number of patients]
+"""
+import random
+import sys
+import time
+
+from src.health_records_system import HealthRecordsSystem, Medication, Patient
+from src.search import SearchIndex
+
+DEFAULT_PATIENTS = 1000000
+SYLLABLES = ["an", "ber", "cal", "da", "el", "fi", "gor", "han", "is", "jo", "ka", "li", "mar", "ne", "o", "pe", "ra",
+             "sa", "tor", "u", "vi", "wen", "xa", "yo", "zel"]
+MEDICATION = ["Advil", "Amoxicillin", "Atorvastatin", "Lisinopril", "Metformin", "Omeprazole", "Simvastatin",
+              "Levothyroxine", "Amlodipine", "Metoprolol"]
+QUERIES = 200
+
+
+def _name():
+    return " ".join("".join(random.choice(SYLLABLES) for _ in range(random.randint(2, 3))).capitalize()
+                    for _ in range(2))
+
+
+def _typo(word):
+    i = random.randrange(len(word) - 1)
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+def best_latency(function, queries):
+    """
+    :return: (median, slowest) milliseconds per query
+    """
+    times = []
+    for query in queries:
+        start = time.perf_counter()
+        function(query)
+        times.append((time.perf_counter() - start) * 1e3)
+    times.sort()
+    return times[len(times) // 2], times[-1]
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATIENTS
+    random.seed(0)
+    system = HealthRecordsSystem.get_instance()
+    patients = []
+    for i in range(n):
+        patient = Patient(i, _name(), 20 + i % 80, 5550000 + i)
+        patient.insert_medication(Medication(random.choice(MEDICATION), "1 tablet", "once a day"))
+        patients.append(patient)
+    system.add_patients_bulk(patients)
+
+    start = time.perf_counter()
+    search = SearchIndex(system)
+    print(f"{n:,} patients, index built in {time.perf_counter() - start:.1f} s")
+
+    names = [random.choice(patients).name for _ in range(QUERIES)]
+    prefixes = [name.split()[0][:3] for name in names]
+    two_words = [f"{name.split()[0][:3]} {name.split()[1][:2]}" for name in names]
+    typos = [_typo(name.split()[1].lower()) for name in names]
+
+    scan_queries = prefixes[:5]
+    median, slowest = best_latency(lambda prefix: [patient for patient in system.patients() if any(
+        word.startswith(prefix.lower()) for word in patient.name.lower().split())][:10], scan_queries)
+    print(f"{'query':>22} {'median (ms)':>12} {'slowest (ms)':>13}")
+    print(f"{'scan every name':>22} {median:>12.2f} {slowest:>13.2f}")
+    for label, function, queries in [("prefix, 1 word", search.patients, prefixes),
+                                     ("prefix, 2 words", search.patients, two_words),
+                                     ("fuzzy", lambda query: search.patients(query, fuzzy=True), typos),
+                                     ("medication prefix", search.medication, [name[:2] for name in MEDICATION])]:
+        median, slowest = best_latency(function, queries)
+        print(f"{label:>22} {median:>12.2f} {slowest:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Measures the read and write throughput of a ShardedSystem with an increasing number of worker processes, compared with
+one HealthRecordsSystem in this process. Requests are sent in batches, which every shard serves in parallel, so the
+throughput grows with the number of shards up to the number of cores.
+
+Run from the repository root with: python3 -m benchmarks.bench_sharding [number of patients] [largest shard count]
+"""
+import os
+import random
+import sys
+import time
+
+from src.command import AddPatientCommand, AddTestResultsCommand, Invoker
+from src.health_records_system import HealthRecordsSystem, Patient
+from src.sharding import ShardedSystem
+
+DEFAULT_PATIENTS = 100000
+BATCH = 2000  # requests sent at once
+READS = 200000
+WRITES = 100000
+
+
+def _patients(n):
+    return [Patient(i, f"Patient {i}", 20 + i % 80, 5550000 + i) for i in range(n)]
+
+
+def _results(n, count):
+    return [(random.randrange(n), "HbA1c", f"{1 + i % 28:02d}/{1 + i % 12:02d}/2021", str(5 + i % 30 / 10))
+            for i in range(count)]
+
+
+def _rate(count, function):
+    start = time.perf_counter()
+    function()
+    return count / (time.perf_counter() - start)
+
+
+def run_local(n):
+    system = HealthRecordsSystem.get_instance()
+    invoker = Invoker(max_history=100, verbose=False)
+    add_patient, add_results = AddPatientCommand(system, "error"), AddTestResultsCommand(system, "overwrite")
+    invoker.register(add_patient)
+    invoker.register(add_results)
+    for patient in _patients(n):
+        invoker.execute(add_patient, patient)
+    ids = [random.randrange(n) for _ in range(READS)]
+    results = _results(n, WRITES)
+    reads = _rate(READS, lambda: [system.find_patient(id).to_dict() for id in ids])
+    writes = _rate(WRITES, lambda: [invoker.execute(add_results, system.find_patient(id), *result)
+                                    for id, *result in results])
+    HealthRecordsSystem._reset()
+    return reads, writes
+
+
+def run_sharded(n, shards):
+    with ShardedSystem(shards) as system:
+        patients = [(patient,) for patient in _patients(n)]
+        for start in range(0, n, BATCH):
+            system.execute_many(AddPatientCommand, patients[start:start + BATCH])
+        ids = [random.randrange(n) for _ in range(READS)]
+        results = _results(n, WRITES)
+        reads = _rate(READS, lambda: [system.find_patients(ids[start:start + BATCH])
+                                      for start in range(0, READS, BATCH)])
+        writes = _rate(WRITES, lambda: [system.execute_many(AddTestResultsCommand, results[start:start + BATCH],
+                                                            "overwrite")
+                                        for start in range(0, WRITES, BATCH)])
+    return reads, writes
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATIENTS
+    most = int(sys.argv[2]) if len(sys.argv) > 2 else max(4, os.cpu_count() or 1)
+    random.seed(0)
+    print(f"{n:,} patients, {os.cpu_count()} cores, batches of {BATCH:,}")
+    print(f"{'system':>18} {'reads/s':>10} {'writes/s':>10}")
+    reads, writes = run_local(n)
+    print(f"{'in process':>18} {reads:>10,.0f} {writes:>10,.0f}")
+    shards = 1
+    while shards <= most:
+        reads, writes = run_sharded(n, shards)
+        print(f"{f'{shards} shards':>18} {reads:>10,.0f} {writes:>10,.0f}")
+        shards *= 2
+
+
+if __name__ == "__main__":
+    main()
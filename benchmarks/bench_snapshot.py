@@ -0,0 +1,69 @@
+"""
+Measures point-in-time snapshots of the system: the time to take one compared with deep-copying every patient, the
+time to iterate it, and the memory it retains as a growing share of the patients is changed after it is taken.
+
+Run from the repository root with: python3 -m benchmarks.bench_snapshot [number of patients]
+"""
+import copy
+import sys
+import time
+import tracemalloc
+
+from src.health_records_system import HealthRecordsSystem, Medication, Patient
+
+DEFAULT_PATIENTS = 100000
+CHANGED_FRACTIONS = [0.0, 0.01, 0.1, 0.5]
+
+
+def _populate(system, n):
+    patients = []
+    for i in range(n):
+        patient = Patient(i, f"Patient {i}", 20 + i % 80, 5550000 + i)
+        patient.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        patient.add_test_results_bulk(("glucose", f"{day:02}/01/2021", "5.4") for day in range(1, 11))
+        patients.append(patient)
+    system.add_patients_bulk(patients)
+    return patients
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATIENTS
+    system = HealthRecordsSystem.get_instance()
+    patients = _populate(system, n)
+    print(f"{n:,} patients with 11 entries each")
+
+    start = time.perf_counter()
+    copied = {patient.id: copy.deepcopy(patient) for patient in system.patients()}
+    print(f"Deep copy of every patient: {time.perf_counter() - start:.3f} s")
+    del copied
+
+    start = time.perf_counter()
+    snapshot = system.snapshot()
+    print(f"Take snapshot:              {(time.perf_counter() - start) * 1e6:.0f} us")
+    start = time.perf_counter()
+    count = sum(1 for _ in snapshot.patients())
+    print(f"Iterate snapshot:           {time.perf_counter() - start:.3f} s for {count:,} patients")
+    start = time.perf_counter()
+    sum(1 for _ in system.patients())
+    print(f"Iterate system:             {time.perf_counter() - start:.3f} s")
+    snapshot.close()
+
+    print(f"{'changed':>8} {'retained (MB)':>14} {'us per first change':>20}")
+    for day, fraction in enumerate(CHANGED_FRACTIONS, 11):
+        changed = patients[:int(n * fraction)]
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        snapshot = system.snapshot()
+        start = time.perf_counter()
+        for patient in changed:
+            patient.insert_test_results("glucose", f"{day:02}/01/2021", "5.4")
+        elapsed = time.perf_counter() - start
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        snapshot.close()
+        per_change = elapsed / len(changed) * 1e6 if changed else 0
+        print(f"{fraction:>8.0%} {retained / 1e6:>14.1f} {per_change:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
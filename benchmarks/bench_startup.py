@@ -0,0 +1,76 @@
+"""
+Measures the startup of the console program: the time to import main.py, as reported by python -X importtime, and the
+time until its App is ready, restoring the saved patients either by replaying the log (cold) or by mapping the snapshot
+written when the program was last closed (warm).
+
+Run from the repository root with: python3 -m benchmarks.bench_startup [number of patients]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SOURCE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+DEFAULT_PATIENTS = 20000
+RUNS = 7
+# bytecode is cached, as it is for an installed program, so the numbers do not include compiling the modules
+ENVIRONMENT = dict({key: value for key, value in os.environ.items() if key != "PYTHONDONTWRITEBYTECODE"},
+                   PYTHONPATH=SOURCE)
+
+FILL = """
+import main
+from health_records_system import Patient
+main.app().system.add_patients_bulk([Patient(i, f"Patient {{i}}", 20 + i % 80, 5550000 + i) for i in range({n})])
+main.app().storage.flush()
+"""
+CLOSE = "import main; main.app().storage.close()"
+READY = "import time; start = time.perf_counter(); import main; main.app(); print(time.perf_counter() - start)"
+
+
+def _run(code, directory):
+    return subprocess.run([sys.executable, "-c", code], cwd=directory, env=ENVIRONMENT, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+
+
+def import_times(code, directory):
+    """
+    :return: dictionary of the cumulative import time of each top-level module imported by the code, in milliseconds,
+             from its python -X importtime report
+    """
+    report = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=directory, env=ENVIRONMENT,
+                            check=True, stderr=subprocess.PIPE, universal_newlines=True).stderr
+    times = {}
+    for line in report.splitlines():
+        fields = line.split("|")
+        if len(fields) == 3 and fields[1].strip().isdigit() and not fields[2].startswith("  "):
+            times[fields[2].strip()] = int(fields[1]) / 1e3
+    return times
+
+
+def median_import_time(module, code, directory):
+    import_times(code, directory)  # caches the bytecode
+    return statistics.median(import_times(code, directory).get(module, 0) for _ in range(RUNS))
+
+
+def median_ready_time(directory):
+    return statistics.median(float(_run(READY, directory).stdout) for _ in range(RUNS)) * 1e3
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PATIENTS
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"import main: {median_import_time('main', 'import main', directory):.1f} ms")
+        slowest = sorted(import_times("import main; main.app()", directory).items(), key=lambda item: -item[1])[:8]
+        print("slowest imports once the App is built: " + ", ".join(f"{name} {ms:.1f} ms" for name, ms in slowest))
+
+        _run(FILL.format(n=n), directory)  # the program exits without closing, leaving the changes in the log
+        print(f"{n:,} patients, App ready after (median of {RUNS} runs):")
+        # restoring the log does not take a snapshot, so every run replays it
+        print(f"  cold, replaying the log: {median_ready_time(directory):>8.1f} ms")
+        _run(CLOSE, directory)
+        print(f"  warm, from the snapshot: {median_ready_time(directory):>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
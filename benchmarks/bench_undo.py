@@ -0,0 +1,68 @@
+"""
+Measures undo/redo latency through the Invoker and checks that repeated undo/redo cycles do not leak file
+descriptors or touch the filesystem.
+
+Run from the repository root with: python3 -m benchmarks.bench_undo [number of cycles]
+"""
+import contextlib
+import os
+import sys
+import time
+
+from src.command import Invoker, AddMedicationCommand, AddTestResultsCommand
+from src.health_records_system import HealthRecordsSystem, Patient, Medication
+
+DEFAULT_CYCLES = 100000
+
+
+def _open_fds():
+    """
+    :return: the number of file descriptors currently open by this process, or None if it cannot be determined
+    """
+    for fd_dir in ("/proc/self/fd", "/dev/fd"):
+        if os.path.isdir(fd_dir):
+            return len(os.listdir(fd_dir))
+    return None
+
+
+def _time_cycles(invoker, cycles):
+    undo_time = redo_time = 0.0
+    for _ in range(cycles):
+        start = time.perf_counter()
+        invoker.undo()
+        undo_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        invoker.redo()
+        redo_time += time.perf_counter() - start
+    return undo_time / cycles, redo_time / cycles
+
+
+def main():
+    cycles = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_CYCLES
+    system = HealthRecordsSystem.get_instance()
+    add_meds = AddMedicationCommand(system)
+    add_test_results = AddTestResultsCommand(system)
+    invoker = Invoker()
+    invoker.register(add_meds)
+    invoker.register(add_test_results)
+    patient = Patient(1, "Jane", 20, 123)
+    fds_before = _open_fds()
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        invoker.execute(add_meds, patient, Medication("Advil", "1 tablet", "once a day"))
+        med_times = _time_cycles(invoker, cycles)
+        invoker.execute(add_test_results, patient, "glucose", "01/01/2021", "5.4")
+        test_times = _time_cycles(invoker, cycles)
+
+    fds_after = _open_fds()
+    print(f"{cycles} undo/redo cycles per command")
+    print(f"AddMedicationCommand:  undo {med_times[0] * 1e6:.2f} us, redo {med_times[1] * 1e6:.2f} us")
+    print(f"AddTestResultsCommand: undo {test_times[0] * 1e6:.2f} us, redo {test_times[1] * 1e6:.2f} us")
+    print(f"Open file descriptors: {fds_before} before, {fds_after} after")
+    if fds_before != fds_after:
+        sys.exit("File descriptors leaked during undo/redo cycles")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares rendering patient views from scratch with reading them through a ViewCache, under a skewed read load where a
+few patients are read most of the time and one request in a hundred changes a patient.
+
+Run from the repository root with: python3 -m benchmarks.bench_views [number of requests]
+"""
+import random
+import sys
+import time
+
+from src.health_records_system import ConflictPolicy, HealthRecordsSystem, Medication, Patient
+from src.views import VIEWS, ViewCache
+
+DEFAULT_REQUESTS = 200000
+PATIENTS = 10000
+WRITE_EVERY = 100
+CACHE_SIZE = 3000
+
+
+def _populate(system):
+    random.seed(0)
+    patients = []
+    for i in range(PATIENTS):
+        patient = Patient(i, f"Patient {i}", 20 + i % 80, 5550000 + i)
+        for j in range(5):
+            patient.insert_medication(Medication(f"Drug {j}", "1 tablet", "once a day"))
+        patient.add_test_results_bulk(("glucose", f"{day:02}/{month:02}/2021", "5.4")
+                                      for month in range(1, 4) for day in range(1, 11))
+        patients.append(patient)
+    system.add_patients_bulk(patients)
+    return patients
+
+
+def _requests(n):
+    """
+    :return: list of (patient ID, view), with IDs following a Pareto distribution so that a few are read most
+    """
+    views = list(VIEWS)
+    return [(min(int(random.paretovariate(1.2)) - 1, PATIENTS - 1), random.choice(views)) for _ in range(n)]
+
+
+def run(system, patients, requests, read):
+    start = time.perf_counter()
+    for i, (id, view) in enumerate(requests):
+        if i % WRITE_EVERY == 0:
+            patients[id].insert_test_results("glucose", "01/06/2021", str(i), ConflictPolicy.OVERWRITE)
+        read(id, view)
+    return (time.perf_counter() - start) / len(requests) * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REQUESTS
+    system = HealthRecordsSystem.get_instance()
+    patients = _populate(system)
+    requests = _requests(n)
+
+    uncached = run(system, patients, requests, lambda id, view: VIEWS[view](system.find_patient(id)))
+    cache = ViewCache(system, CACHE_SIZE)
+    cached = run(system, patients, requests, cache.get)
+    stats = cache.stats()
+    print(f"{n:,} requests over {PATIENTS:,} patients, 1 in {WRITE_EVERY} changing a patient")
+    print(f"Render every time: {uncached:.2f} us per request")
+    print(f"ViewCache:         {cached:.2f} us per request, hit rate {stats['hits'] / n:.1%}, "
+          f"{stats['evictions']:,} evictions")
+
+
+if __name__ == "__main__":
+    main()
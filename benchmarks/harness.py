@@ -0,0 +1,343 @@
+"""
+Reproducible benchmark suite for the hot paths of the Health Records System and of every command.
+
+"run" generates a synthetic population of each size. Test-result counts are drawn from a Pareto distribution, so
+most patients have few results and a few have very many. It then times get_patient, add_patient, remove_patient,
+execute and undo of every command, and Invoker.redo. Commands use the ERROR conflict policy, so that they run
+without console I/O and fail loudly if a benchmark ever hits a conflict. Each operation is timed over many calls,
+keeping the fastest of several repeats, and the peak memory it allocates is traced in a separate pass. Results are
+written as JSON.
+
+"compare" reads two result files and flags every benchmark whose time or peak memory grew by more than a threshold.
+It exits with status 1 if any did, so it can gate a change.
+
+Run from the repository root with:
+    python3 -m benchmarks.harness run [--sizes 10000,100000,1000000] [--output results.json]
+    python3 -m benchmarks.harness compare baseline.json results.json [--threshold 0.1]
+"""
+import argparse
+import contextlib
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+from src.command import (AddMedicationCommand, AddPatientCommand, AddTestResultsCommand, Invoker,
+                         RemoveMedicationCommand, RemovePatientCommand)
+from src.health_records_system import ConflictPolicy, HealthRecordsSystem, Medication, Patient
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+DEFAULT_OPERATIONS = 10000
+DEFAULT_REPEAT = 5
+DEFAULT_SKEW = 1.5  # Pareto shape of the number of test results per patient; lower is more skewed
+MAX_TEST_RESULTS = 1000
+BENCH_MEDICATION = Medication("Benchmarkol", "1 tablet", "once a day")  # a medication no patient takes
+FIRST_DATE = datetime.date(1900, 1, 1)
+MEDICATIONS = [Medication(name, "1 tablet", "once a day") for name in ("Advil", "Tylenol", "Aspirin", "Lipitor")]
+
+
+def _date(days):
+    """
+    :return: the date the given number of days after FIRST_DATE, in the DD/MM/YYYY format of test results
+    """
+    return (FIRST_DATE + datetime.timedelta(days=days)).strftime("%d/%m/%Y")
+
+
+class Population(object):
+    """
+    A system filled with synthetic patients, and a source of random patients and new records for benchmarks to use
+    """
+
+    def __init__(self, size, seed, skew):
+        """
+        :param size: number of patients, with IDs 0 to size - 1
+        :param seed: seed of the random number generator, so that the same arguments produce the same population
+        :param skew: Pareto shape of the number of test results per patient
+        """
+        HealthRecordsSystem._reset()
+        self.system = HealthRecordsSystem()
+        self.size = size
+        self.rng = random.Random(seed)
+        self._next_id = size
+        self._next_date = 0
+        self.system.add_patients_bulk(self._patient(id, skew) for id in range(size))
+
+    def _patient(self, id, skew):
+        patient = Patient(id, f"Patient {id}", 20 + id % 80, 5550000 + id)
+        for med in self.rng.sample(MEDICATIONS, self.rng.randrange(len(MEDICATIONS))):
+            patient.insert_medication(med)
+        count = min(int(self.rng.paretovariate(skew)) - 1, MAX_TEST_RESULTS)
+        patient.add_test_results_bulk(("glucose", _date(i), "5.4") for i in range(count))
+        return patient
+
+    def sample(self, n):
+        """
+        :return: n different patients in the system
+        """
+        return [self.system.find_patient(id) for id in self.rng.sample(range(self.size), n)]
+
+    def new_patients(self, n):
+        """
+        :return: n patients with IDs that are not in the system
+        """
+        patients = [Patient(id, f"Patient {id}", 20 + id % 80, 5550000 + id)
+                    for id in range(self._next_id, self._next_id + n)]
+        self._next_id += n
+        return patients
+
+    def new_date(self):
+        """
+        :return: a test date that has not been used before, so that adding a result never conflicts with one
+        """
+        self._next_date += 1
+        return _date(MAX_TEST_RESULTS + self._next_date)
+
+
+class Clock(object):
+    """
+    Measures the sections of a benchmark, recording either their time or the peak memory they allocate
+    """
+
+    def __init__(self, trace=False):
+        """
+        :param trace: whether to trace memory allocations instead of timing, since tracing slows every call down
+        """
+        self.trace = trace
+        self.measurements = {}  # name of the section: seconds taken, or peak bytes allocated
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        if self.trace:
+            tracemalloc.start()
+            try:
+                yield
+            finally:
+                self.measurements[name] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        else:
+            # like timeit, collect garbage outside the timed section so that collections do not add noise
+            gc.collect()
+            gc.disable()
+            try:
+                start = time.perf_counter()
+                yield
+                self.measurements[name] = time.perf_counter() - start
+            finally:
+                gc.enable()
+
+    def call(self, name, function, calls):
+        """
+        Measures calling the function with every argument tuple in calls
+        """
+        with self.measure(name):
+            for args in calls:
+                function(*args)
+
+    def execute_and_undo(self, name, command, calls):
+        """
+        Measures executing the command with every argument tuple in calls, then undoing every execution in reverse
+        order
+        """
+        states = []
+        with self.measure(f"{name}.execute"):
+            for args in calls:
+                states.append(command.execute(*args))
+        calls.reverse()
+        states.reverse()
+        with self.measure(f"{name}.undo"):
+            for args, state in zip(calls, states):
+                command.undo(*args, state=state)
+
+
+def bench_get_patient(clock, population, n):
+    clock.call("get_patient", population.system.get_patient, [(patient.id,) for patient in population.sample(n)])
+
+
+def bench_add_patient(clock, population, n):
+    patients = population.new_patients(n)
+    clock.call("add_patient", population.system.add_patient, [(patient,) for patient in patients])
+    for patient in patients:
+        population.system.delete_patient(patient.id)
+
+
+def bench_remove_patient(clock, population, n):
+    patients = population.sample(n)
+    clock.call("remove_patient", population.system.remove_patient, [(patient.id,) for patient in patients])
+    population.system.add_patients_bulk(patients)
+
+
+def bench_add_patient_command(clock, population, n):
+    command = AddPatientCommand(population.system, ConflictPolicy.ERROR)
+    clock.execute_and_undo("AddPatientCommand", command, [(patient,) for patient in population.new_patients(n)])
+
+
+def bench_remove_patient_command(clock, population, n):
+    command = RemovePatientCommand(population.system, ConflictPolicy.ERROR)
+    clock.execute_and_undo("RemovePatientCommand", command, [(patient,) for patient in population.sample(n)])
+
+
+def bench_add_medication_command(clock, population, n):
+    command = AddMedicationCommand(population.system, ConflictPolicy.ERROR)
+    calls = [(patient, BENCH_MEDICATION) for patient in population.sample(n)]
+    clock.execute_and_undo("AddMedicationCommand", command, calls)
+
+
+def bench_remove_medication_command(clock, population, n):
+    command = RemoveMedicationCommand(population.system, ConflictPolicy.ERROR)
+    calls = [(patient, BENCH_MEDICATION) for patient in population.sample(n)]
+    for patient, med in calls:
+        patient.insert_medication(med)
+    clock.execute_and_undo("RemoveMedicationCommand", command, calls)
+    for patient, med in calls:
+        patient.delete_medication(med.name)
+
+
+def bench_add_test_results_command(clock, population, n):
+    command = AddTestResultsCommand(population.system, ConflictPolicy.ERROR)
+    calls = [(patient, "glucose", population.new_date(), "5.4") for patient in population.sample(n)]
+    clock.execute_and_undo("AddTestResultsCommand", command, calls)
+
+
+def bench_invoker_redo(clock, population, n):
+    command = AddTestResultsCommand(population.system, ConflictPolicy.ERROR)
+    invoker = Invoker(verbose=False)
+    invoker.register(command)
+    for patient in population.sample(n):
+        invoker.execute(command, patient, "glucose", population.new_date(), "5.4")
+    for _ in range(n):
+        invoker.undo()
+    with clock.measure("Invoker.redo"):
+        for _ in range(n):
+            invoker.redo()
+    for _ in range(n):
+        invoker.undo()
+
+
+BENCHMARKS = [bench_get_patient, bench_add_patient, bench_remove_patient, bench_add_patient_command,
+              bench_remove_patient_command, bench_add_medication_command, bench_remove_medication_command,
+              bench_add_test_results_command, bench_invoker_redo]
+
+
+def _peak_rss():
+    """
+    :return: the largest resident set size the process has had so far, in bytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_size(size, operations, repeat, seed, skew):
+    """
+    Benchmarks every operation against a population of the given size
+    :return: list of result dictionaries
+    """
+    start = time.perf_counter()
+    population = Population(size, seed, skew)
+    results = [{"benchmark": "populate", "patients": size, "operations": size,
+                "ns_per_op": (time.perf_counter() - start) / size * 1e9, "peak_bytes": _peak_rss()}]
+    n = min(operations, size)
+
+    for bench in BENCHMARKS:
+        best = {}
+        for _ in range(repeat):
+            clock = Clock()
+            bench(clock, population, n)
+            for name, elapsed in clock.measurements.items():
+                best[name] = min(best.get(name, elapsed), elapsed)
+        clock = Clock(trace=True)
+        bench(clock, population, n)
+
+        for name, elapsed in best.items():
+            results.append({"benchmark": name, "patients": size, "operations": n, "ns_per_op": elapsed / n * 1e9,
+                            "peak_bytes": clock.measurements[name]})
+    return results
+
+
+def run(args):
+    sizes = [int(float(size)) for size in args.sizes.split(",")]
+    report = {"python": platform.python_version(), "platform": platform.platform(), "time": time.time(),
+              "operations": args.operations, "repeat": args.repeat, "seed": args.seed, "skew": args.skew,
+              "results": []}
+    # sizes run from smallest to largest so that the peak RSS recorded after populating each is its own
+    for size in sorted(sizes):
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results = run_size(size, args.operations, args.repeat, args.seed, args.skew)
+        report["results"].extend(results)
+        for result in results:
+            print(f"{result['benchmark']:>30} {size:>10,} patients {result['ns_per_op']:>12,.0f} ns/op "
+                  f"{result['peak_bytes'] / 1e6:>10,.2f} MB peak", flush=True)
+
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {args.output}")
+
+
+def compare_results(baseline, current, threshold):
+    """
+    Compares two benchmark reports
+    :param threshold: largest allowed relative increase, e.g. 0.1 for 10%
+    :return: list of (benchmark, patients, metric, baseline value, current value, whether it is a regression) for
+             every benchmark in both reports
+    """
+    baseline_results = {(result["benchmark"], result["patients"]): result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        key = (result["benchmark"], result["patients"])
+        if key not in baseline_results:
+            continue
+        for metric in ("ns_per_op", "peak_bytes"):
+            old, new = baseline_results[key][metric], result[metric]
+            rows.append(key + (metric, old, new, new > old * (1 + threshold)))
+    return rows
+
+
+def compare(args):
+    with open(args.baseline) as baseline, open(args.current) as current:
+        rows = compare_results(json.load(baseline), json.load(current), args.threshold)
+
+    regressions = 0
+    for benchmark, patients, metric, old, new, regression in rows:
+        change = (new - old) / old * 100 if old else 0.0
+        flag = "REGRESSION" if regression else ""
+        regressions += regression
+        print(f"{benchmark:>30} {patients:>10,} {metric:>10} {old:>16,.0f} {new:>16,.0f} {change:>+8.1f}% {flag}")
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    if regressions:
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite for the Health Records System.")
+    subparsers = parser.add_subparsers(dest="mode")
+    subparsers.required = True
+
+    run_parser = subparsers.add_parser("run", help="run the benchmarks and write the results as JSON")
+    run_parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                            help="comma-separated population sizes, e.g. 10000,1e6,1e7")
+    run_parser.add_argument("--operations", type=int, default=DEFAULT_OPERATIONS, help="calls timed per operation")
+    run_parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="timing repeats, the fastest is kept")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--skew", type=float, default=DEFAULT_SKEW,
+                            help="Pareto shape of the number of test results per patient")
+    run_parser.add_argument("--output", default="benchmark_results.json")
+    run_parser.set_defaults(function=run)
+
+    compare_parser = subparsers.add_parser("compare", help="flag regressions between two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="largest allowed relative increase, e.g. 0.1 for 10%%")
+    compare_parser.set_defaults(function=compare)
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
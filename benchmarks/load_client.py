@@ -0,0 +1,121 @@
+"""
+Load generator for the socket server. Opens many concurrent connections, each sending a stream of requests one at a time
+(mostly patient lookups, with some test results added), and reports the latency percentiles and the total number of
+requests per second.
+
+Starts its own server unless the address of a running one is given.
+Run from the repository root with: python3 -m benchmarks.load_client [connections] [requests per connection]
+                                                                      [--address HOST:PORT | --unix PATH]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from src.server import raise_open_file_limit
+
+PATIENTS = 10000
+WRITE_RATIO = 0.2
+
+
+async def _send(reader, writer, request):
+    writer.write(json.dumps(request).encode() + b"\n")
+    await writer.drain()
+    response = json.loads(await reader.readline())
+    if not response["ok"]:
+        raise RuntimeError(response["error"])
+    return response
+
+
+async def _connect(args):
+    if args.unix is not None:
+        return await asyncio.open_unix_connection(args.unix)
+    host, port = args.address.rsplit(":", 1)
+    return await asyncio.open_connection(host, int(port))
+
+
+async def _seed(args):
+    reader, writer = await _connect(args)
+    for i in range(PATIENTS):
+        patient = {"id": i, "name": f"Patient {i}", "age": 20 + i % 80, "phone_number": 5550000 + i}
+        await _send(reader, writer, {"op": "add_patient", "patient": patient, "on_conflict": "overwrite"})
+    writer.close()
+
+
+async def _client(args, number, start, latencies):
+    rng = random.Random(number)
+    reader, writer = await _connect(args)
+    await start.wait()
+    for i in range(args.requests):
+        patient_id = rng.randrange(PATIENTS)
+        if rng.random() < WRITE_RATIO:
+            request = {"op": "add_test_results", "id": patient_id, "name": f"test-{number}", "date": f"run-{i}",
+                       "result": "5.4", "on_conflict": "overwrite"}
+        else:
+            request = {"op": "get_patient", "id": patient_id}
+        sent = time.perf_counter()
+        await _send(reader, writer, request)
+        latencies.append(time.perf_counter() - sent)
+    writer.close()
+
+
+async def _run(args):
+    await _seed(args)
+    start = asyncio.Event()
+    latencies = []
+    clients = []
+    for number in range(args.connections):  # connect every client before any starts sending requests
+        clients.append(asyncio.ensure_future(_client(args, number, start, latencies)))
+        await asyncio.sleep(0)
+    await asyncio.sleep(0.5)
+
+    began = time.perf_counter()
+    start.set()
+    await asyncio.gather(*clients)
+    elapsed = time.perf_counter() - began
+
+    latencies.sort()
+    print(f"{args.connections} connections, {len(latencies):,} requests in {elapsed:.2f}s: "
+          f"{len(latencies) / elapsed:,.0f} requests/s, "
+          f"p50 {latencies[len(latencies) // 2] * 1e3:.2f}ms, p99 {latencies[len(latencies) * 99 // 100] * 1e3:.2f}ms")
+
+
+def _start_server():
+    """
+    :return: (the server process, the address it is listening on)
+    """
+    server = subprocess.Popen([sys.executable, "-m", "src.server", "--port", "0"], stdout=subprocess.PIPE,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    line = server.stdout.readline().decode()
+    if not line.startswith("Listening on "):
+        server.kill()
+        raise RuntimeError("The server did not start.")
+    return server, line[len("Listening on "):].strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the socket server.")
+    parser.add_argument("connections", type=int, nargs="?", default=1000)
+    parser.add_argument("requests", type=int, nargs="?", default=100, help="requests sent by each connection")
+    parser.add_argument("--address", help="HOST:PORT of a running server")
+    parser.add_argument("--unix", help="path of the Unix domain socket of a running server")
+    args = parser.parse_args()
+
+    raise_open_file_limit()
+    server = None
+    if args.address is None and args.unix is None:
+        server, args.address = _start_server()
+    try:
+        asyncio.run(_run(args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+"""
+Population analytics over the numeric test results of every patient in the system, held in NumPy column arrays.
+
+ResultColumns observes the system and keeps one row per numeric test result, with the patient, the test, the date
+and the value in parallel arrays, so that cohort queries run as vectorized operations over the arrays instead of
+Python loops over every patient. Results whose value is not a number, or whose date is not a DD/MM/YYYY date, are not
+included.
+
+NumPy is an optional dependency, only needed by this module: pip install numpy
+"""
+import datetime
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from health_records_system import Event, IObserver
+except ImportError:
+    from src.health_records_system import Event, IObserver
+
+AGGREGATES = ("count", "sum", "mean", "min", "max")
+_INITIAL_CAPACITY = 1024
+
+
+def _ordinal(date):
+    """
+    :param date: date in the format DD/MM/YYYY, or a date object
+    :return: the proleptic Gregorian ordinal of the date, or None if it is not a valid date
+    """
+    if isinstance(date, datetime.date):
+        return date.toordinal()
+    try:
+        day, month, year = date.split("/")
+        return datetime.date(int(year), int(month), int(day)).toordinal()
+    except (AttributeError, ValueError):
+        return None
+
+
+def _number(result):
+    """
+    :return: the test result as a float, or None if it is not a number
+    """
+    try:
+        return float(result)
+    except (TypeError, ValueError):
+        return None
+
+
+class ResultColumns(IObserver):
+    """
+    Columns of the numeric test results in a Health Records System, kept up to date as results are added, changed and
+    removed. Queries return copies, so they are unaffected by later changes.
+    """
+
+    def __init__(self, system):
+        """
+        Loads the test results of every patient in the system and observes it for changes
+        :param system: the Health Records System
+        :raises ImportError: if NumPy is not installed
+        """
+        if numpy is None:
+            raise ImportError("Analytics over test results require NumPy: pip install numpy")
+        self._lock = threading.Lock()  # guards the columns, which are changed from the threads changing patients
+        self._patient_rows = {}  # patient ID: row of the patient in the patient columns
+        self._patient_ids = []  # ID of the patient in each row of the patient columns
+        self._ages = numpy.zeros(_INITIAL_CAPACITY, dtype=numpy.int32)  # age of the patient in each row
+        self._test_codes = {}  # name of a test: its code in the test column
+        self._test_names = []  # name of the test of each code
+        self._rows = {}  # (patient row, test name, date): row of the result in the result columns
+        self._row_keys = []  # (patient row, test name, date) of each row of the result columns
+        self._patient = numpy.zeros(_INITIAL_CAPACITY, dtype=numpy.int32)
+        self._test = numpy.zeros(_INITIAL_CAPACITY, dtype=numpy.int32)
+        self._date = numpy.zeros(_INITIAL_CAPACITY, dtype=numpy.int32)
+        self._value = numpy.zeros(_INITIAL_CAPACITY, dtype=numpy.float64)
+        self._size = 0  # number of rows in use in the result columns
+
+        with system.exclusive():
+            for patient in system.patients():
+                self._add_patient(patient)
+            system.attach(self)
+
+    def __len__(self):
+        return self._size
+
+    def update(self, event, patient, *args):
+        with self._lock:
+            if event == Event.TEST_RESULTS_SET:
+                self._set(self._patient_row(patient), *args)
+            elif event == Event.TEST_RESULTS_REMOVED:
+                self._remove(self._patient_row(patient), *args)
+            elif event == Event.PATIENT_ADDED:
+                self._add_patient(patient)
+            elif event in (Event.PATIENT_REMOVED, Event.TEST_RESULTS_CLEARED):
+                self._remove_patient(patient)
+
+    def _patient_row(self, patient):
+        row = self._patient_rows.get(patient.id)
+        if row is None:
+            row = self._patient_rows[patient.id] = len(self._patient_ids)
+            self._patient_ids.append(patient.id)
+            if row == len(self._ages):
+                self._ages = numpy.resize(self._ages, 2 * row)
+        self._ages[row] = patient.age
+        return row
+
+    def _add_patient(self, patient):
+        patient_row = self._patient_row(patient)
+        for (name, date), result in patient.test_results.items():
+            self._set(patient_row, name, date, result)
+
+    def _remove_patient(self, patient):
+        patient_row = self._patient_rows.get(patient.id)
+        if patient_row is not None:
+            for name, date in patient.test_results:
+                self._remove(patient_row, name, date)
+
+    def _set(self, patient_row, name, date, result):
+        key = (patient_row, name, date)
+        value, ordinal = _number(result), _ordinal(date)
+        row = self._rows.get(key)
+        if value is None or ordinal is None:
+            if row is not None:
+                self._remove(patient_row, name, date)
+            return
+        if row is not None:
+            self._value[row] = value
+            return
+
+        row = self._size
+        if row == len(self._value):
+            for column in ("_patient", "_test", "_date", "_value"):
+                setattr(self, column, numpy.resize(getattr(self, column), 2 * row))
+        code = self._test_codes.get(name)
+        if code is None:
+            code = self._test_codes[name] = len(self._test_names)
+            self._test_names.append(name)
+        self._patient[row], self._test[row], self._date[row], self._value[row] = patient_row, code, ordinal, value
+        self._rows[key] = row
+        self._row_keys.append(key)
+        self._size += 1
+
+    def _remove(self, patient_row, name, date):
+        """
+        Removes a result by moving the last row into its place
+        """
+        row = self._rows.pop((patient_row, name, date), None)
+        if row is None:
+            return
+        last = self._size - 1
+        last_key = self._row_keys.pop()
+        if row != last:
+            for column in (self._patient, self._test, self._date, self._value):
+                column[row] = column[last]
+            self._row_keys[row] = last_key
+            self._rows[last_key] = row
+        self._size = last
+
+    def _select(self, test, start=None, end=None):
+        """
+        :return: (patient rows, date ordinals, values, ages of the patient rows) of the results of a test between two
+                 dates, inclusive, copied from the columns
+        """
+        with self._lock:
+            code = self._test_codes.get(test)
+            n = self._size
+            mask = self._test[:n] == (-1 if code is None else code)
+            if start is not None:
+                mask &= self._date[:n] >= _ordinal(start)
+            if end is not None:
+                mask &= self._date[:n] <= _ordinal(end)
+            patients = self._patient[:n][mask]
+            return patients, self._date[:n][mask], self._value[:n][mask], self._ages[:len(self._patient_ids)].copy()
+
+    def _ids(self, patient_rows):
+        with self._lock:
+            return [self._patient_ids[row] for row in patient_rows.tolist()]
+
+    def values(self, test, start=None, end=None):
+        """
+        Retrieves the results of a test
+        :param test: name of the test
+        :param start: earliest date included, as DD/MM/YYYY or a date object, or None for no limit
+        :param end: latest date included, or None for no limit
+        :return: (list of patient IDs, array of date ordinals, array of values), in no particular order
+        """
+        patients, dates, values, _ = self._select(test, start, end)
+        return self._ids(patients), dates, values
+
+    def aggregate(self, test, by="age", function="mean", band=10, start=None, end=None):
+        """
+        Aggregates the results of a test in groups of patients, e.g. the mean HbA1c by 10-year age band
+        :param test: name of the test
+        :param by: "age" to group patients by age band, or "patient" to group each patient's results
+        :param function: one of AGGREGATES
+        :param band: width of the age bands, each named by its lowest age
+        :param start: earliest date included, or None for no limit
+        :param end: latest date included, or None for no limit
+        :return: dictionary of the aggregate value of each group with results
+        """
+        if function not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate: {function}")
+        patients, _, values, ages = self._select(test, start, end)
+        if by == "age":
+            keys = ages[patients] // band * band
+        elif by == "patient":
+            keys = patients
+        else:
+            raise ValueError(f"Unknown grouping: {by}")
+
+        groups, inverse = numpy.unique(keys, return_inverse=True)
+        if function in ("min", "max"):
+            order = numpy.argsort(inverse, kind="stable")
+            starts = numpy.flatnonzero(numpy.r_[True, numpy.diff(inverse[order]) != 0]) if len(order) else order
+            reduce = numpy.minimum if function == "min" else numpy.maximum
+            result = reduce.reduceat(values[order], starts) if len(order) else values
+        else:
+            counts = numpy.bincount(inverse, minlength=len(groups))
+            if function == "count":
+                result = counts
+            else:
+                result = numpy.bincount(inverse, weights=values, minlength=len(groups))
+                if function == "mean":
+                    result = result / counts
+
+        if by == "patient":
+            groups = self._ids(groups)
+        else:
+            groups = groups.tolist()
+        return dict(zip(groups, result.tolist()))
+
+    def _last_two(self, test):
+        """
+        :return: (patient rows, previous values, last values) of the patients with at least two results of the test,
+                 by date
+        """
+        patients, dates, values, _ = self._select(test)
+        order = numpy.lexsort((dates, patients))
+        patients, values = patients[order], values[order]
+        # the last result of a patient is followed by another patient's, and has a previous result of the same patient
+        last = numpy.flatnonzero(numpy.r_[patients[1:] != patients[:-1], True]) if len(patients) else order
+        last = last[last > 0]
+        last = last[patients[last - 1] == patients[last]]
+        return patients[last], values[last - 1], values[last]
+
+    def rising(self, test, fraction):
+        """
+        Finds the patients whose last result of a test rose by more than a fraction of their previous result, e.g.
+        creatinine rising by more than 30% with fraction 0.3
+        :param test: name of the test
+        :param fraction: minimum rise, relative to the previous result, which must be positive
+        :return: list of the patient IDs
+        """
+        patients, previous, last = self._last_two(test)
+        rose = (previous > 0) & (last - previous > fraction * previous)
+        return self._ids(patients[rose])
+
+    def patients_where(self, test, lo=None, hi=None, start=None, end=None):
+        """
+        Finds the patients with a result of a test between two values, inclusive
+        :param test: name of the test
+        :param lo: minimum value, or None for no limit
+        :param hi: maximum value, or None for no limit
+        :param start: earliest date included, or None for no limit
+        :param end: latest date included, or None for no limit
+        :return: list of the patient IDs
+        """
+        patients, _, values, _ = self._select(test, start, end)
+        mask = numpy.ones(len(values), dtype=bool)
+        if lo is not None:
+            mask &= values >= lo
+        if hi is not None:
+            mask &= values <= hi
+        return self._ids(numpy.unique(patients[mask]))
@@ -0,0 +1,495 @@
+"""
+Streaming import and export of patients, medication and test results as CSV or JSON Lines files, without any console
+input.
+
+Each kind of record has its own columns, which are the fields of its JSON objects:
+
+    patients        id, name, age, phone_number
+    medication      patient_id, name, dosage, frequency
+    test_results    patient_id, name, date, result
+
+Patients in JSON Lines files may also carry their whole record, with the "medication" and "test_results" lists produced
+by Patient.to_dict. The format of a file is chosen by its extension: .csv for CSV, anything else for JSON Lines.
+Values read from CSV files are strings, as they are when typed at the menu of main.py.
+
+Files are read and written a row at a time, and imported in chunks, so neither depends on the size of the file.
+import_parallel (--workers) parses and validates the rows in a pool of processes instead.
+
+Run from the src directory with:
+    python3 bulk_io.py [--data DIRECTORY] import {patients,medication,test_results} FILE [--on-conflict POLICY]
+                                                                                         [--workers N]
+    python3 bulk_io.py [--data DIRECTORY] export {patients,medication,test_results} FILE
+"""
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import csv
+import datetime
+import io
+import itertools
+import json
+import os
+import time
+
+try:
+    from health_records_system import *
+    from storage import Storage
+except ImportError:
+    from src.health_records_system import *
+    from src.storage import Storage
+
+COLUMNS = {
+    "patients": ("id", "name", "age", "phone_number"),
+    "medication": ("patient_id", "name", "dosage", "frequency"),
+    "test_results": ("patient_id", "name", "date", "result"),
+}
+DEFAULT_CHUNK_SIZE = 10000
+DEFAULT_SHARD_SIZE = 4 << 20  # bytes of a file parsed by a worker process at a time, in import_parallel
+MAX_ERRORS = 100  # number of rejected rows whose errors are kept in an ImportReport
+
+
+class ImportReport(object):
+    """
+    Outcome of an import
+    """
+
+    def __init__(self):
+        self.rows = 0  # number of rows read
+        self.counts = {WriteResult.ADDED: 0, WriteResult.UPDATED: 0, WriteResult.SKIPPED: 0}
+        self.rejected = 0  # number of invalid rows, which were not imported
+        self.errors = []  # (line number, message) of the first MAX_ERRORS rejected rows
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def _reject(self, line, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append((line, message))
+
+    def _merge_rejected(self, rejected, errors, line_offset):
+        """
+        Adds the rows rejected while parsing part of a file, whose line numbers start after line_offset
+        """
+        self.rejected += rejected
+        for line, message in errors[:MAX_ERRORS - len(self.errors)]:
+            self.errors.append((line_offset + line, message))
+
+    def _count(self, counts):
+        for result, count in counts.items():
+            self.counts[result] += count
+
+    def __str__(self):
+        counts = ", ".join(f"{count} {result}" for result, count in self.counts.items())
+        return (f"{self.rows} rows imported in {self.seconds:.2f}s ({self.rows_per_second:,.0f} rows/s): {counts}, "
+                f"{self.rejected} rejected")
+
+
+class ExportReport(object):
+    """
+    Outcome of an export
+    """
+
+    def __init__(self):
+        self.rows = 0  # number of rows written
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return f"{self.rows} rows exported in {self.seconds:.2f}s ({self.rows_per_second:,.0f} rows/s)"
+
+
+def _is_csv(path):
+    return path.lower().endswith(".csv")
+
+
+def _read_header(source, path, kind):
+    """
+    Reads the header row of a CSV file
+    :return: the column names, or None if the file is empty
+    :raises ValueError: if a column of the kind of record is missing
+    """
+    line = source.readline()
+    if not line:
+        return None
+    fieldnames = next(csv.reader([line]))
+    missing = set(COLUMNS[kind]) - set(fieldnames)
+    if missing:
+        raise ValueError(f"{path} is missing the columns: {', '.join(sorted(missing))}")
+    return fieldnames
+
+
+def _read_rows(source, fieldnames=None):
+    """
+    Reads rows one at a time
+    :param source: text stream of JSON Lines, or of CSV rows after the header
+    :param fieldnames: column names of CSV rows, or None for JSON Lines
+    :return: iterator of (line number within the stream, row dictionary, or None if the line is not a valid row)
+    """
+    if fieldnames is not None:
+        reader = csv.DictReader(source, fieldnames)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            yield line_number, row if isinstance(row, dict) else None
+
+
+def _parse_rows(rows, parse, report):
+    """
+    Parses rows, rejecting the invalid ones
+    :param rows: iterable of (line number, row dictionary)
+    :return: list of (line number, parsed row)
+    """
+    parsed = []
+    for line_number, row in rows:
+        report.rows += 1
+        try:
+            parsed.append((line_number, parse(row)))
+        except (KeyError, TypeError, ValueError, RecordConflictError) as error:
+            report._reject(line_number, str(error))
+    return parsed
+
+
+def _check_row(row, kind):
+    """
+    :raises ValueError: if the row is not a dictionary with a value for every column of its kind
+    """
+    if row is None:
+        raise ValueError("The line is not a valid row.")
+    for column in COLUMNS[kind]:
+        if row.get(column) in (None, ""):
+            raise ValueError(f"The {column} is missing.")
+
+
+def _check_date(date):
+    """
+    :raises ValueError: if the date is not a valid date in the format DD/MM/YYYY
+    """
+    try:
+        day, month, year = date.split("/")
+        datetime.date(int(year), int(month), int(day))
+    except (AttributeError, ValueError):
+        raise ValueError(f"{date!r} is not a date in the format DD/MM/YYYY.") from None
+
+
+def _parse_patient(row):
+    _check_row(row, "patients")
+    patient = Patient(row["id"], row["name"], row["age"], row["phone_number"])
+    for med in row.get("medication") or ():
+        patient.insert_medication(Medication.from_dict(med))
+    results = row.get("test_results")
+    if results:
+        for name, date, _ in results:
+            _check_date(date)
+        patient.add_test_results_bulk(results)
+    return patient
+
+
+def _parse_medication(row):
+    _check_row(row, "medication")
+    return row["patient_id"], Medication(row["name"], row["dosage"], row["frequency"])
+
+
+def _parse_test_result(row):
+    _check_row(row, "test_results")
+    _check_date(row["date"])
+    return row["patient_id"], (row["name"], row["date"], row["result"])
+
+
+def _load_patients(system, chunk, on_conflict, report):
+    report._count(system.add_patients_bulk((patient for _, patient in chunk), on_conflict))
+
+
+def _load_medication(system, chunk, on_conflict, report):
+    for line_number, (patient_id, med) in chunk:
+        patient = system.find_patient(patient_id)
+        if patient is None:
+            report._reject(line_number, f"Patient #{patient_id} does not exist in the system.")
+        else:
+            report.counts[patient.insert_medication(med, on_conflict)] += 1
+
+
+def _load_test_results(system, chunk, on_conflict, report):
+    results = {}  # patient ID: list of (line number, test result)
+    for line_number, (patient_id, result) in chunk:
+        results.setdefault(patient_id, []).append((line_number, result))
+    for patient_id, patient_results in results.items():
+        patient = system.find_patient(patient_id)
+        if patient is None:
+            for line_number, _ in patient_results:
+                report._reject(line_number, f"Patient #{patient_id} does not exist in the system.")
+        else:
+            report._count(patient.add_test_results_bulk((result for _, result in patient_results), on_conflict))
+
+
+# kind of record: (function parsing a row, function adding a chunk of parsed rows to the system)
+_FORMATS = {
+    "patients": (_parse_patient, _load_patients),
+    "medication": (_parse_medication, _load_medication),
+    "test_results": (_parse_test_result, _load_test_results),
+}
+
+
+def _import(system, kind, path, on_conflict, chunk_size):
+    parse, load = _FORMATS[kind]
+    report = ImportReport()
+    start = time.perf_counter()
+    with open(path, newline="" if _is_csv(path) else None, encoding="utf-8") as source:
+        fieldnames = None
+        line_offset = 0
+        if _is_csv(path):
+            fieldnames = _read_header(source, path, kind)
+            if fieldnames is None:
+                return report
+            line_offset = 1
+        rows = ((line_offset + line_number, row) for line_number, row in _read_rows(source, fieldnames))
+        while True:
+            read = report.rows
+            chunk = _parse_rows(itertools.islice(rows, chunk_size), parse, report)
+            if chunk:
+                load(system, chunk, on_conflict, report)
+            if report.rows - read < chunk_size:  # the file is exhausted
+                break
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def import_patients(system, path, on_conflict=ConflictPolicy.ERROR, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Adds the patients in a file to the system, a chunk at a time.
+    Under the ERROR policy, a patient that already exists raises a RecordConflictError and stops the import; the
+    chunks before the one containing it have been added.
+    :param path: path of a CSV or JSON Lines file of patients
+    :param on_conflict: ConflictPolicy applied to patients whose ID already exists
+    :param chunk_size: number of rows added to the system together
+    :return: the ImportReport
+    """
+    return _import(system, "patients", path, on_conflict, chunk_size)
+
+
+def import_medication(system, path, on_conflict=ConflictPolicy.ERROR, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Adds the medication in a file to the records of patients in the system. Rows of patients that do not exist are
+    rejected.
+    Under the ERROR policy, a medication the patient is already taking raises a RecordConflictError and stops the
+    import.
+    :param path: path of a CSV or JSON Lines file of medication
+    :param on_conflict: ConflictPolicy applied to medication the patient is already taking
+    :param chunk_size: number of rows read together
+    :return: the ImportReport
+    """
+    return _import(system, "medication", path, on_conflict, chunk_size)
+
+
+def import_test_results(system, path, on_conflict=ConflictPolicy.ERROR, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Adds the test results in a file to the records of patients in the system, adding the results of each patient in
+    a chunk together. Rows of patients that do not exist are rejected.
+    Under the ERROR policy, a result that has already been recorded raises a RecordConflictError and stops the import.
+    :param path: path of a CSV or JSON Lines file of test results
+    :param on_conflict: ConflictPolicy applied to results whose test name and date already exist
+    :param chunk_size: number of rows read together
+    :return: the ImportReport
+    """
+    return _import(system, "test_results", path, on_conflict, chunk_size)
+
+
+def _shards(path, start, shard_size):
+    """
+    Splits a file into parts at line boundaries
+    :param start: offset of the first byte to include
+    :param shard_size: approximate number of bytes in each part
+    :return: list of (start, end) byte offsets of each part
+    """
+    size = os.path.getsize(path)
+    shards = []
+    with open(path, "rb") as source:
+        while start < size:
+            end = start + shard_size
+            if end < size:
+                source.seek(end)
+                source.readline()
+                end = source.tell()
+            else:
+                end = size
+            shards.append((start, end))
+            start = end
+    return shards
+
+
+def _parse_shard(path, kind, fieldnames, start, end):
+    """
+    Parses and validates part of a file, in a worker process
+    :param fieldnames: column names of a CSV file, or None for JSON Lines
+    :param start: offset of the first byte of the part, at the start of a line
+    :param end: offset after the last byte of the part, at the end of a line
+    :return: (number of lines in the part, list of (line number, parsed row), number of rows read, number of rows
+             rejected, list of (line number, message) of the first rejected rows), with line numbers counted from the
+             start of the part
+    """
+    with open(path, "rb") as source:
+        source.seek(start)
+        text = source.read(end - start).decode("utf-8")
+    report = ImportReport()
+    parsed = _parse_rows(_read_rows(io.StringIO(text, newline=""), fieldnames), _FORMATS[kind][0], report)
+    return text.count("\n"), parsed, report.rows, report.rejected, report.errors
+
+
+def import_parallel(system, kind, path, on_conflict=ConflictPolicy.ERROR, workers=None,
+                    shard_size=DEFAULT_SHARD_SIZE):
+    """
+    Imports a file like import_patients, import_medication or import_test_results, but parses and validates its rows in
+    a pool of worker processes. The file is split into parts at line boundaries, so rows of CSV files must not contain
+    line breaks within quoted values.
+    The parsed parts are added to the system in the order of the file, as they would be by a sequential import, so the
+    outcome of conflicts does not depend on which worker finishes first.
+    :param kind: "patients", "medication" or "test_results"
+    :param path: path of a CSV or JSON Lines file
+    :param on_conflict: ConflictPolicy applied to records that already exist
+    :param workers: number of worker processes, or None for the number of processors
+    :param shard_size: approximate number of bytes parsed by a worker at a time, and added to the system together
+    :return: the ImportReport
+    """
+    load = _FORMATS[kind][1]
+    report = ImportReport()
+    start = time.perf_counter()
+    fieldnames = None
+    offset = line_offset = 0
+    if _is_csv(path):
+        with open(path, newline="", encoding="utf-8") as source:
+            fieldnames = _read_header(source, path, kind)
+        if fieldnames is None:
+            return report
+        with open(path, "rb") as source:
+            offset = len(source.readline())
+        line_offset = 1
+
+    def merge(future):
+        lines, parsed, rows, rejected, errors = future.result()
+        report.rows += rows
+        report._merge_rejected(rejected, errors, line_offset)
+        if parsed:
+            load(system, [(line_offset + line, row) for line, row in parsed], on_conflict, report)
+        return line_offset + lines
+
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()  # parts being parsed, in the order of the file
+        for shard in _shards(path, offset, shard_size):
+            pending.append(pool.submit(_parse_shard, path, kind, fieldnames, *shard))
+            if len(pending) >= 2 * workers:  # bounds the parsed rows waiting to be added
+                line_offset = merge(pending.popleft())
+        while pending:
+            line_offset = merge(pending.popleft())
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def _patient_rows(system, whole_records):
+    for patient in system.patients():
+        if whole_records:
+            yield patient.to_dict()
+        else:
+            yield {"id": patient.id, "name": patient.name, "age": patient.age, "phone_number": patient.phone_number}
+
+
+def _medication_rows(system):
+    for patient in system.patients():
+        for med in patient.medication.values():
+            yield {"patient_id": patient.id, "name": med.name, "dosage": med.dosage, "frequency": med.frequency}
+
+
+def _test_result_rows(system):
+    for patient in system.patients():
+        for (name, date), result in patient.test_results.items():
+            yield {"patient_id": patient.id, "name": name, "date": date, "result": result}
+
+
+def export(system, kind, path):
+    """
+    Writes the records of every patient in the system to a file, a row at a time.
+    Patients exported as JSON Lines carry their whole record; as CSV, only the patient columns.
+    :param kind: "patients", "medication" or "test_results"
+    :param path: path of the CSV or JSON Lines file to write
+    :return: the ExportReport
+    """
+    if kind == "patients":
+        rows = _patient_rows(system, whole_records=not _is_csv(path))
+    elif kind == "medication":
+        rows = _medication_rows(system)
+    elif kind == "test_results":
+        rows = _test_result_rows(system)
+    else:
+        raise ValueError(f"Unknown kind of record: {kind}")
+
+    report = ExportReport()
+    start = time.perf_counter()
+    with open(path, "w", newline="" if _is_csv(path) else None, encoding="utf-8") as output:
+        if _is_csv(path):
+            writer = csv.DictWriter(output, COLUMNS[kind], extrasaction="ignore")
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                report.rows += 1
+        else:
+            for row in rows:
+                output.write(json.dumps(row))
+                output.write("\n")
+                report.rows += 1
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+IMPORTERS = {"patients": import_patients, "medication": import_medication, "test_results": import_test_results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Imports and exports patient records as CSV or JSON Lines files.")
+    parser.add_argument("--data", default="health_records_data", help="directory the patient records are stored in")
+    subparsers = parser.add_subparsers(dest="mode")
+    subparsers.required = True
+    import_parser = subparsers.add_parser("import", help="add the records in a file to the system")
+    import_parser.add_argument("kind", choices=sorted(COLUMNS))
+    import_parser.add_argument("path")
+    import_parser.add_argument("--on-conflict", default=ConflictPolicy.ERROR,
+                               choices=[ConflictPolicy.OVERWRITE, ConflictPolicy.SKIP, ConflictPolicy.ERROR])
+    import_parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    import_parser.add_argument("--workers", type=int,
+                               help="number of processes parsing the file in parallel, or parse it in this process")
+    export_parser = subparsers.add_parser("export", help="write the records in the system to a file")
+    export_parser.add_argument("kind", choices=sorted(COLUMNS))
+    export_parser.add_argument("path")
+    args = parser.parse_args()
+
+    system = HealthRecordsSystem.get_instance()
+    storage = Storage(args.data, sync_every=DEFAULT_CHUNK_SIZE)
+    storage.open(system)
+    try:
+        if args.mode == "import":
+            if args.workers is None:
+                report = IMPORTERS[args.kind](system, args.path, args.on_conflict, args.chunk_size)
+            else:
+                report = import_parallel(system, args.kind, args.path, args.on_conflict, args.workers)
+            print(report)
+            for line_number, message in report.errors:
+                print(f"Line {line_number}: {message}")
+        else:
+            print(export(system, args.kind, args.path))
+    finally:
+        storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,184 @@
 from abc import ABCMeta, abstractmethod
-import copy
 import sys
+import threading
+
+try:
+    from health_records_system import ConflictPolicy, Patient
+except ImportError:
+    from src.health_records_system import ConflictPolicy, Patient
+
+_ABSENT = object()  # marks a record entry that did not exist before a command was executed
+_UNCHANGED = object()  # marks an execution that left the system unchanged, so there is nothing to undo
+
 
 class ICommand(metaclass=ABCMeta):
     """
-    Defines the command interface as part of the Command Design Pattern
+    Defines the command interface as part of the Command Design Pattern.
+    Commands hold no per-invocation state themselves: anything needed to undo an execution is returned by execute and
+    handed back to undo through the state keyword by the Invoker.
     """
 
     @staticmethod
     @abstractmethod
     def execute(*args):
-        """ Execution of the command """
+        """ Execution of the command, returns the state required to undo it (or None) """
 
     @staticmethod
     @abstractmethod
-    def undo(*args):
-        """ Undo the command """
+    def undo(*args, state=None):
+        """ Undo the command, given the state returned by the execution being undone """
 
 
 class Invoker(metaclass=ABCMeta):
     """
-    Passes requests to the Health Records System by executing commands
+    Passes requests to the Health Records System by executing commands.
+    An Invoker can be shared between threads, but every user should normally have their own, created with session(), so
+    that undo and redo only affect the user's own commands.
     """
 
-    def __init__(self):
+    def __init__(self, max_history=None, max_history_bytes=None, verbose=True, metrics=None):
+        """
+        :param max_history: maximum number of commands kept in the history, unlimited if None
+        :param max_history_bytes: approximate maximum number of bytes retained by the history, unlimited if None. This
+                                  includes the records of patients that only the history keeps alive, such as removed
+                                  patients, measured when each entry is recorded.
+        When a limit is exceeded, the oldest commands are evicted first and can no longer be undone.
+        :param verbose: whether to print the outcome of undo and redo to the console
+        :param metrics: InvokerMetrics recording every command executed, undone and redone, or None to record nothing
+        """
         self._commands = []
-        self._history = []
+        self._history = []  # (command, args, undo state) entries
+        self._history_sizes = []  # approximate number of bytes retained by each history entry
         self._position = -1  # position in command history
+        self._max_history = max_history
+        self._max_history_bytes = max_history_bytes
+        self._history_bytes = 0
+        self._verbose = verbose
+        self._metrics = metrics
+        if metrics is not None:
+            metrics.track(self)
+        self._lock = threading.RLock()  # guards the history and the position in it
+        self._batch = None  # (command, args, undo state) of the commands executed in the current transaction, if any
+        self._stored = False  # whether the history is a DiskHistory
 
     @property
     def history(self):
         return self._history
 
+    @property
+    def history_bytes(self):
+        return self._history_bytes
+
     def register(self, command):
         """
         Adds a command to the list of recognized commands
         :param command: the command to add
         """
-        self._commands.append(command)
+        with self._lock:
+            self._commands.append(command)
+
+    def session(self):
+        """
+        Creates an Invoker for one user, with the same registered commands, history limits and metrics but a history of
+        its own.
+        Undoing a command restores the values it replaced, even if another user has changed them since.
+        :return: the new Invoker
+        """
+        invoker = Invoker(self._max_history, self._max_history_bytes, self._verbose, self._metrics)
+        with self._lock:
+            invoker._commands = list(self._commands)
+        return invoker
+
+    def use_history(self, history):
+        """
+        Keeps the command history in a DiskHistory from now on, continuing from the position it was saved at, so that
+        commands executed before a restart can still be undone and redone. The commands in the current history can no
+        longer be undone. The history limits of the Invoker do not apply to a DiskHistory, which has its own.
+        :param history: the DiskHistory
+        """
+        with self._lock:
+            self._history = history
+            self._history_sizes = []
+            self._history_bytes = 0
+            self._position = history.position
+            self._stored = True
+
+    def transaction(self):
+        """
+        Groups the commands executed by this thread while the returned context manager is held into one entry of the
+        command history, so that they are undone and redone together. If a command or the code in the block raises an
+        exception, the commands already executed in the transaction are undone before the exception propagates.
+        Other threads using this Invoker wait until the transaction ends. A transaction started inside another one is
+        part of the outer transaction.
+        :return: context manager for the transaction
+        """
+        return _Transaction(self)
 
     def execute(self, command, *args):
         """
-        Executes the command and adds it to the command history
+        Executes the command and adds it to the command history, or to the current transaction
         :param command: a subtype of the ICommand interface, the command to be executed
         :param args: any additional arguments that the Receiver (the Health Records System) requires to execute the command
         """
-        if command in self._commands:
-            self._position += 1
-            command.execute(*args)
-
-            if len(self._history) == self._position:  # nothing has been undone or all undone commands have been redone
-                self._history.append((command, args))
-
-            else:  # some commands have been undone before this command was executed
-                self._history = self._history[:self._position]  # erase history that occurs after the current position
-                self._history.append((command, args))
-
-        else:
-            print(f"You must register command {command} before executing it.")
+        with self._lock:
+            if command in self._commands:
+                if self._metrics is None:
+                    state = command.execute(*args)
+                else:
+                    state = self._metrics.measure("execute", command, command.execute, *args)
+
+                if self._batch is None:
+                    self._record((command, args, state))
+                else:
+                    self._batch.append((command, args, state))
+
+            elif self._verbose:
+                print(f"You must register command {command} before executing it.")
+
+    def _record(self, entry):
+        """
+        Adds an executed command to the command history
+        :param entry: (command, args, undo state) tuple
+        """
+        if self._stored:
+            self._history.append(entry)
+            self._position = self._history.position
+            return
+
+        # erase history that occurs after the current position, if some commands have been undone before this one
+        self._history_bytes -= sum(self._history_sizes[self._position+1:])
+        del self._history[self._position+1:]
+        del self._history_sizes[self._position+1:]
+
+        self._history.append(entry)
+        self._history_sizes.append(_entry_size(entry))
+        self._history_bytes += self._history_sizes[-1]
+        self._position += 1
+        self._evict()
 
     def undo(self):
         """
         Undoes the last performed action based on the current position in the command history.
         If all actions have already been undone, there are no effects.
+        :return: True if an action was undone, otherwise False
         """
-        if self._position > -1:
-            command_to_undo = self._history[self._position]  # (command, args)
-            command_to_undo[0].undo(*command_to_undo[1])
-            self._position -= 1
-            print("The last action has been undone.")
-        else:
-            print("No commands have been performed yet or all commands have already been undone.")
+        with self._lock:
+            if self._position > -1:
+                command, args, state = self._history[self._position]
+                if self._metrics is None:
+                    command.undo(*args, state=state)
+                else:
+                    self._metrics.measure("undo", command, command.undo, *args, state=state)
+                if self._stored:
+                    self._history.undone(self._position, (command, args, state))
+                self._position -= 1
+                if self._verbose:
+                    print("The last action has been undone.")
+                return True
+            else:
+                if self._verbose:
+                    print("No commands have been performed yet or all commands have already been undone.")
+                return False
 
     def redo(self):
         """
@@ -79,143 +187,350 @@ class Invoker(metaclass=ABCMeta):
         Otherwise, if the current position is at the end of the command history, the last performed command is performed
         again.
         If no commands have been performed yet, there are no effects.
+        :return: True if an action was redone, otherwise False
+        """
+        with self._lock:
+            if len(self._history) == 0:  # no commands have been performed
+                if self._verbose:
+                    print("There are no commands to redo.")
+                return False
+
+            if self._position < len(self._history)-1:  # redo the last undone command
+                self._position += 1
+            # otherwise redo the last performed action
+
+            command, args, _ = self._history[self._position]
+            if self._metrics is None:
+                entry = (command, args, command.execute(*args))
+            else:
+                entry = (command, args, self._metrics.measure("redo", command, command.execute, *args))
+            if self._stored:
+                self._history.redone(self._position, entry)
+            else:
+                self._history[self._position] = entry
+                size = _entry_size(entry)
+                self._history_bytes += size - self._history_sizes[self._position]
+                self._history_sizes[self._position] = size
+                self._evict()
+            if self._verbose:
+                print("The last action has been redone.")
+            return True
+
+    def _evict(self):
+        """
+        Evicts the oldest commands from the history until it is within the configured limits
         """
-        if self._position == -1:  # no commands have been performed
-            print("There are no commands to redo.")
+        evicted = 0
+        while evicted < len(self._history) and (
+                (self._max_history is not None and len(self._history) - evicted > self._max_history) or
+                (self._max_history_bytes is not None and self._history_bytes > self._max_history_bytes)):
+            self._history_bytes -= self._history_sizes[evicted]
+            evicted += 1
 
-        elif self._position < len(self._history)-1:  # redo the last undone command
-            self._position += 1
-            command_to_redo = self._history[self._position]  # (command, args)
-            command_to_redo[0].execute(*command_to_redo[1])
-            print("The last action has been redone.")
+        if evicted:
+            del self._history[:evicted]
+            del self._history_sizes[:evicted]
+            self._position = max(self._position - evicted, -1)
 
-        else:  # redo the last performed action
-            command_to_redo = self._history[self._position]  # (command, args)
-            command_to_redo[0].execute(*command_to_redo[1])
-            print("The last action has been redone.")
+
+class _Transaction:
+    """
+    Context manager of Invoker.transaction
+    """
+
+    def __init__(self, invoker):
+        self._invoker = invoker
+        self._outer = False
+
+    def __enter__(self):
+        invoker = self._invoker
+        invoker._lock.acquire()
+        self._outer = invoker._batch is None
+        if self._outer:
+            invoker._batch = []
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        invoker = self._invoker
+        try:
+            if not self._outer:
+                return
+            batch, invoker._batch = invoker._batch, None
+            if exc_type is not None:
+                COMPOSITE.undo(*((command, args) for command, args, _ in batch),
+                               state=tuple(state for _, _, state in batch))
+            elif batch:
+                invoker._record((COMPOSITE, tuple((command, args) for command, args, _ in batch),
+                                 tuple(state for _, _, state in batch)))
+        finally:
+            invoker._lock.release()
+
+
+def _entry_size(entry):
+    """
+    Approximates the number of bytes retained by a history entry. Patients that are stored in the system are shared
+    with it and are not counted, but the whole record of a patient that only the history refers to is.
+    :param entry: (command, args, state) tuple
+    :return: size in bytes
+    """
+    command, args, state = entry
+    size = sys.getsizeof(entry) + sys.getsizeof(args) + sys.getsizeof(state)
+    if isinstance(command, CompositeCommand):
+        return size + sum(_entry_size((step, step_args, step_state))
+                          for (step, step_args), step_state in zip(args, state))
+    if isinstance(state, tuple):
+        size += sum(sys.getsizeof(item) for item in state)
+    for arg in args:
+        if isinstance(arg, Patient) and arg._system is None:
+            size += _record_size(arg)
+    return size
+
+
+def _record_size(patient):
+    """
+    Approximates the number of bytes used by a patient's record
+    :param patient: the Patient object
+    :return: size in bytes
+    """
+    size = sys.getsizeof(patient) + sys.getsizeof(patient._medication) + sys.getsizeof(patient._test_results)
+    for med in patient.medication.values():
+        size += sys.getsizeof(med) + sys.getsizeof(med.dosage)
+    for (name, date), result in patient.test_results.items():
+        size += sys.getsizeof((name, date)) + sys.getsizeof(result)
+    return size
 
 
 class AddPatientCommand(ICommand):
 
-    def __init__(self, system):
+    def __init__(self, system, on_conflict=None):
+        """
+        :param system: the Health Records System
+        :param on_conflict: ConflictPolicy applied without any console input or output if the patient already exists,
+                            or None to ask the user
+        """
         self._system = system
+        self._on_conflict = on_conflict
 
     def execute(self, *args):
         """
         Adds a patient to the system
         :param args: requires one argument; the Patient object to be added
+        :return: the patient it replaced, None if there was none, or a marker that the patient was not added
         """
         patient = args[0]
-        self._system.add_patient(patient)
-
-    def undo(self, *args):
+        with self._system.lock_patient(patient.id):
+            orig_patient = self._system.find_patient(patient.id)
+            if self._on_conflict is None:
+                self._system.add_patient(patient)
+            else:
+                self._system.insert_patient(patient, self._on_conflict)
+            return orig_patient if self._system.find_patient(patient.id) is patient else _UNCHANGED
+
+    def undo(self, *args, state=None):
         """
-        Undoes the action by removing the patient from the system
+        Undoes the action by removing the patient from the system and restoring the patient it replaced, if any
         :param args: requires one argument; the Patient object to be removed
+        :param state: the value returned by the execution being undone
         """
+        if state is _UNCHANGED:
+            return
         patient = args[0]
-        self._system.remove_patient(patient.id)
+        if self._on_conflict is None:
+            self._system.remove_patient(patient.id)
+        else:
+            self._system.delete_patient(patient.id)
+        if state is not None:
+            self._system.insert_patient(state, ConflictPolicy.OVERWRITE)
 
 
 class RemovePatientCommand(ICommand):
 
-    def __init__(self, system):
+    def __init__(self, system, on_conflict=None):
+        """
+        :param system: the Health Records System
+        :param on_conflict: ConflictPolicy applied without any console input or output if a patient with the same ID
+                            has been added by the time the removal is undone, or None to ask the user
+        """
         self._system = system
+        self._on_conflict = on_conflict
 
     def execute(self, *args):
         """
         Removes a patient from the system
         :param args: requires one argument; the Patient object to be removed
+        :return: a marker that no patient was removed, if the patient did not exist
         """
-        self._system.remove_patient(args[0].id)
+        if self._on_conflict is None:
+            removed = self._system.remove_patient(args[0].id)
+        else:
+            removed = self._system.delete_patient(args[0].id)
+        return _UNCHANGED if removed is None else None
 
-    def undo(self, *args):
+    def undo(self, *args, state=None):
         """
         Undoes the action by adding the patient back to the system
         :param args: requires one argument; the Patient object to be added
+        :param state: the value returned by the execution being undone
         """
-        self._system.add_patient(args[0])
+        if state is _UNCHANGED:
+            return
+        if self._on_conflict is None:
+            self._system.add_patient(args[0])
+        else:
+            self._system.insert_patient(args[0], self._on_conflict)
 
 
 class AddMedicationCommand(ICommand):
 
-    def __init__(self, system):
+    def __init__(self, system, on_conflict=None):
+        """
+        :param system: the Health Records System
+        :param on_conflict: ConflictPolicy applied without any console input or output if the patient is already
+                            taking the medication, or None to ask the user
+        """
         self._system = system
-        self._orig_medication = {}  # stores the previous state of the patient's medication record
+        self._on_conflict = on_conflict
 
     def execute(self, *args):
         """
         Adds a medication to a patient's record
         :param args: requires two arguments; the Patient object and the Medication object to be added
+        :return: the name of the medication and its previous value, in case it needs to be recovered later
         """
-        self._orig_medication = copy.deepcopy(args[0].medication)  # store the previous medication in case it needs to be recovered later
-        args[0].add_medication(args[1])
-
-    def undo(self, *args):
+        patient, med = args[0], args[1]
+        with self._system.lock_patient(patient.id):
+            orig_medication = (med.name, patient.medication.get(med.name, _ABSENT))
+            if self._on_conflict is None:
+                patient.add_medication(med)
+            else:
+                patient.insert_medication(med, self._on_conflict)
+        return orig_medication
+
+    def undo(self, *args, state=None):
         """
-        Undoes the last addition to the patient's medication record by recovering the previous state of the medication
+        Undoes an addition to the patient's medication record by recovering the previous value of the changed
+        medication, or removing it if it was not in the record before
         :param args: requires one argument; the Patient object
+        :param state: the value returned by the execution being undone
         """
         patient = args[0]
-        patient.clear_medication()
-
-        # suppress console output from add_medication function
-        save_stdout = sys.stdout
-        sys.stdout = open('trash', 'w')
+        med_name, orig_med = state
 
-        for med in self._orig_medication.values():
-            patient.add_medication(med)
-
-        sys.stdout = save_stdout  # restore console output
+        if orig_med is _ABSENT:
+            patient.delete_medication(med_name)
+        else:
+            patient.insert_medication(orig_med, ConflictPolicy.OVERWRITE)
 
 
 class RemoveMedicationCommand(ICommand):
 
-    def __init__(self, system):
+    def __init__(self, system, on_conflict=None):
+        """
+        :param system: the Health Records System
+        :param on_conflict: ConflictPolicy applied without any console input or output if the patient is taking a
+                            medication with the same name by the time the removal is undone, or None to ask the user
+        """
         self._system = system
+        self._on_conflict = on_conflict
 
     def execute(self, *args):
         """
         Removes a medication from a patient's record
         :param args: requires two arguments; the Patient object and the Medication object to be removed
+        :return: a marker that no medication was removed, if the patient was not taking it
         """
-        args[0].remove_medication(args[1].name)
+        if self._on_conflict is None:
+            removed = args[0].remove_medication(args[1].name)
+        else:
+            removed = args[0].delete_medication(args[1].name)
+        return _UNCHANGED if removed is None else None
 
-    def undo(self, *args):
+    def undo(self, *args, state=None):
         """
         Undoes the removal of a medication by adding it back to a patient's record
         :param args: requires two arguments; the Patient object and the Medication object to be added back
+        :param state: the value returned by the execution being undone
         """
-        args[0].add_medication(args[1])
+        if state is _UNCHANGED:
+            return
+        if self._on_conflict is None:
+            args[0].add_medication(args[1])
+        else:
+            args[0].insert_medication(args[1], self._on_conflict)
 
 
 class AddTestResultsCommand(ICommand):
 
-    def __init__(self, system):
+    def __init__(self, system, on_conflict=None):
+        """
+        :param system: the Health Records System
+        :param on_conflict: ConflictPolicy applied without any console input or output if a result for the test has
+                            already been recorded on the date, or None to ask the user
+        """
         self._system = system
-        self._orig_test_results = {}  # stores the previous state of the patient's test results record
+        self._on_conflict = on_conflict
 
     def execute(self, *args):
         """
         Adds test results to a patient's record
         :param args: requires four arguments; the Patient object, the name of the test, the date it was performed (DD/MM/YYYY), and the test result
+        :return: the (name, date) key of the test and its previous result, in case it needs to be recovered later
         """
-        self._orig_test_results = copy.deepcopy(args[0].test_results)  # store the previous test results in case they need to be recovered later
-        args[0].add_test_results(args[1], args[2], args[3])
-
-    def undo(self, *args):
+        patient, name, date = args[0], args[1], args[2]
+        with self._system.lock_patient(patient.id):
+            orig_test_results = ((name, date), patient.test_results.get((name, date), _ABSENT))
+            if self._on_conflict is None:
+                patient.add_test_results(name, date, args[3])
+            else:
+                patient.insert_test_results(name, date, args[3], self._on_conflict)
+        return orig_test_results
+
+    def undo(self, *args, state=None):
         """
-        Undoes the last addition to the patient's test results record by recovering the previous state of the test results
+        Undoes an addition to the patient's test results record by recovering the previous result of the changed
+        test, or removing it if it was not in the record before
         :param args: requires one argument; the Patient object
+        :param state: the value returned by the execution being undone
         """
         patient = args[0]
-        patient.clear_test_results()
+        (name, date), orig_result = state
+
+        if orig_result is _ABSENT:
+            patient.delete_test_results(name, date)
+        else:
+            patient.insert_test_results(name, date, orig_result, ConflictPolicy.OVERWRITE)
+
 
-        # suppress console output from add_test_results function
-        save_stdout = sys.stdout
-        sys.stdout = open('trash', 'w')
+class CompositeCommand(ICommand):
+    """
+    Executes several commands as one, e.g. admitting a patient together with their medication and test results.
+    If one of the commands fails, the ones already executed are undone, so either all of them take effect or none.
+    Invoker.transaction records the commands it groups as an execution of COMPOSITE.
+    """
+
+    def execute(self, *args):
+        """
+        Executes the commands in order
+        :param args: (command, args) tuple of each command, with the arguments it requires
+        :return: the states returned by the commands, to undo them later
+        """
+        states = []
+        try:
+            for command, command_args in args:
+                states.append(command.execute(*command_args))
+        except BaseException:
+            self.undo(*args[:len(states)], state=tuple(states))
+            raise
+        return tuple(states)
+
+    def undo(self, *args, state=None):
+        """
+        Undoes the commands in reverse order
+        :param args: (command, args) tuple of each command, as given to the execution being undone
+        :param state: the value returned by the execution being undone
+        """
+        for (command, command_args), command_state in zip(reversed(args), reversed(state)):
+            command.undo(*command_args, state=command_state)
 
-        for (name, date), result in self._orig_test_results.items():
-            patient.add_test_results(name, date, result)
 
-        sys.stdout = save_stdout  # restore console output
+COMPOSITE = CompositeCommand()
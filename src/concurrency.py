@@ -0,0 +1,42 @@
+import threading
+
+
+class StripedLock(object):
+    """
+    Fixed set of reentrant locks shared out between keys by their hash, so that operations on the same key are
+    serialized while operations on most other keys can proceed in parallel
+    """
+
+    def __init__(self, stripes=64):
+        """
+        :param stripes: number of locks
+        """
+        self._locks = [threading.RLock() for _ in range(stripes)]
+
+    def __call__(self, key):
+        """
+        :param key: a hashable value
+        :return: the lock of the key
+        """
+        return self._locks[hash(key) % len(self._locks)]
+
+    def acquire_all(self):
+        """
+        Acquires every lock, always in the same order, to stop all operations on every key.
+        A thread must not call this while it holds the lock of a single key, since it could wait forever for a thread
+        that is itself acquiring every lock.
+        """
+        for lock in self._locks:
+            lock.acquire()
+
+    def release_all(self):
+        for lock in reversed(self._locks):
+            lock.release()
+
+
+class HeldLocks(threading.local):
+    """
+    Counts the locks of a StripedLock held by the current thread
+    """
+    depth = 0  # number of times the thread has acquired a lock, including every lock at once
+    all = 0  # number of times the thread has acquired every lock at once
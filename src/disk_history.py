@@ -0,0 +1,299 @@
+"""
+Command history kept on disk, so that commands can be undone and redone after the program restarts and a long session
+does not keep every removed patient in memory.
+"""
+import array
+import collections
+import json
+import os
+
+try:
+    from command import (_ABSENT, _UNCHANGED, COMPOSITE, AddMedicationCommand, AddPatientCommand,
+                         AddTestResultsCommand, CompositeCommand, RemoveMedicationCommand, RemovePatientCommand)
+    from health_records_system import Medication, Patient
+except ImportError:
+    from src.command import (_ABSENT, _UNCHANGED, COMPOSITE, AddMedicationCommand, AddPatientCommand,
+                             AddTestResultsCommand, CompositeCommand, RemoveMedicationCommand, RemovePatientCommand)
+    from src.health_records_system import Medication, Patient
+
+_COMMANDS = {cls.__name__: cls for cls in (AddPatientCommand, RemovePatientCommand, AddMedicationCommand,
+                                           RemoveMedicationCommand, AddTestResultsCommand)}
+# commands whose patient argument is stored as a whole record, since the patient is not in the system when it is redone
+# or undone
+_RECORD_COMMANDS = (AddPatientCommand, RemovePatientCommand)
+_COMPACT_SLACK = 1000  # number of superseded records the log may hold beyond twice the number of entries
+
+
+class DiskHistory(object):
+    """
+    Command history of an Invoker, stored as a log of one JSON line per executed, undone or redone command, of which
+    only the file offsets of the latest line of each entry and a few recently used lines are kept in memory.
+    Patients in the system are referred to by ID, and patients outside it, such as removed patients, by their record,
+    so undoing a command after a restart acts on the patients recovered by Storage.
+    When there are more than max_entries entries, the oldest are evicted, and the log is compacted into the current
+    entries once most of its lines have been superseded.
+    Only the built-in commands and CompositeCommand can be stored. A DiskHistory is used by one Invoker, which guards it
+    with its lock, through Invoker.use_history.
+    """
+
+    LOG_FILE = "history.jsonl"
+
+    def __init__(self, directory, system, max_entries=10000, cache_size=64, sync=False):
+        """
+        Opens the history saved in a directory, or starts an empty one
+        :param directory: directory holding the history file, created if it does not exist
+        :param system: the Health Records System that the commands act on
+        :param max_entries: maximum number of commands kept in the history
+        :param cache_size: number of recently used entries kept in memory
+        :param sync: whether every change to the history is synced to disk, rather than left to the operating system
+        """
+        self._system = system
+        self._max_entries = max_entries
+        self._cache_size = cache_size
+        self._sync = sync
+        self._commands = {}  # (command class name, conflict policy): command used to undo and redo entries
+        self._offsets = array.array("q")  # offset in the log of the latest line of each entry
+        self._first = 0  # number of the oldest entry, counting every entry since the log was created
+        self._position = -1  # number of the last entry that has not been undone
+        self._lines = 0  # number of lines in the log
+        self._cache = collections.OrderedDict()  # entry number: latest line of the entry, least recently used first
+
+        os.makedirs(directory, exist_ok=True)
+        self._path = os.path.join(directory, self.LOG_FILE)
+        self._log = open(self._path, "a+b")
+        self._replay()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def position(self):
+        """
+        :return: position of the last command that has not been undone, or -1 if there is none
+        """
+        return max(self._position - self._first, -1)
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __getitem__(self, index):
+        """
+        :param index: position of the entry in the history
+        :return: (command, args, undo state) tuple of the entry
+        """
+        if index < 0:
+            index += len(self._offsets)
+        if not 0 <= index < len(self._offsets):
+            raise IndexError("history index out of range")
+        number = self._first + index
+        line = self._cache.get(number)
+        if line is None:
+            self._log.seek(self._offsets[index])
+            line = self._log.readline()
+            self._cache_line(number, line)
+        else:
+            self._cache.move_to_end(number)
+        return self._decode_entry(json.loads(line)["entry"])
+
+    def append(self, entry):
+        """
+        Adds an executed command after the current position, dropping the commands undone before it
+        :param entry: (command, args, undo state) tuple
+        """
+        number = self._position + 1
+        self._write("execute", number, entry)
+        self._compact_if_needed()
+
+    def redone(self, index, entry):
+        """
+        Replaces an entry with its state after being redone, which makes it the current position
+        :param index: position of the entry in the history
+        :param entry: (command, args, undo state) tuple
+        """
+        self._write("redo", self._first + index, entry)
+        self._compact_if_needed()
+
+    def undone(self, index, entry):
+        """
+        Replaces an entry with its state after being undone, which moves the current position before it
+        :param index: position of the entry in the history
+        :param entry: (command, args, undo state) tuple, whose patients are stored as they are after the undo
+        """
+        self._write("undo", self._first + index, entry)
+        self._compact_if_needed()
+
+    def close(self):
+        self._log.close()
+
+    def _write(self, op, number, entry):
+        record = {"op": op, "number": number, "entry": self._encode_entry(*entry)}
+        line = (json.dumps(record) + "\n").encode()
+        self._log.seek(0, os.SEEK_END)
+        offset = self._log.tell()
+        self._log.write(line)
+        self._log.flush()
+        if self._sync:
+            os.fsync(self._log.fileno())
+        self._apply(op, number, offset)
+        self._cache_line(number, line)
+
+    def _apply(self, op, number, offset):
+        """
+        Updates the entries in memory with a line of the log
+        """
+        self._lines += 1
+        if op == "execute":
+            if not self._offsets:
+                self._first = number
+            del self._offsets[number - self._first:]
+            self._offsets.append(offset)
+            self._position = number
+            for dropped in [cached for cached in self._cache if cached >= number]:
+                del self._cache[dropped]
+            while len(self._offsets) > self._max_entries:
+                self._cache.pop(self._first, None)
+                del self._offsets[0]
+                self._first += 1
+        else:
+            self._offsets[number - self._first] = offset
+            self._position = number if op == "redo" else number - 1
+
+    def _cache_line(self, number, line):
+        self._cache[number] = line
+        self._cache.move_to_end(number)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _replay(self):
+        """
+        Reads the entries from the log, discarding a partially written last line
+        """
+        self._log.seek(0)
+        offset = 0
+        for line in self._log:
+            try:
+                record = json.loads(line) if line.endswith(b"\n") else None
+            except ValueError:
+                record = None
+            if record is None:
+                self._log.truncate(offset)
+                break
+            self._apply(record["op"], record["number"], offset)
+            offset += len(line)
+        self._cache.clear()
+
+    def _compact_if_needed(self):
+        if self._lines > 2 * len(self._offsets) + _COMPACT_SLACK:
+            self._compact()
+
+    def _compact(self):
+        """
+        Rewrites the log with only the latest line of each entry, followed by a line that restores the position
+        """
+        temp_path = self._path + ".tmp"
+        offsets = array.array("q")
+        with open(temp_path, "wb") as output:
+            lines = [self._read(index) for index in range(len(self._offsets))]
+            for number, line in enumerate(lines, self._first):
+                record = json.loads(line)
+                record["op"], record["number"] = "execute", number
+                offsets.append(output.tell())
+                output.write((json.dumps(record) + "\n").encode())
+            position = self.position
+            if position + 1 < len(lines):  # the entries after the position have been undone
+                record = json.loads(lines[position + 1])
+                record["op"], record["number"] = "undo", self._first + position + 1
+                output.write((json.dumps(record) + "\n").encode())
+            output.flush()
+            os.fsync(output.fileno())
+        self._log.close()
+        os.replace(temp_path, self._path)
+        self._log = open(self._path, "a+b")
+        self._offsets = offsets
+        self._lines = len(offsets) + (position + 1 < len(offsets))
+        self._cache.clear()
+
+    def _read(self, index):
+        self._log.seek(self._offsets[index])
+        return self._log.readline()
+
+    def _encode_entry(self, command, args, state):
+        """
+        :return: JSON-serializable list of the command's class and conflict policy, arguments and undo state
+        """
+        if isinstance(command, CompositeCommand):
+            return [CompositeCommand.__name__, None,
+                    [self._encode_entry(step, step_args, step_state)
+                     for (step, step_args), step_state in zip(args, state)], None]
+        if type(command).__name__ not in _COMMANDS:
+            raise TypeError(f"Command {command} cannot be stored in a DiskHistory.")
+        patients = "record" if isinstance(command, _RECORD_COMMANDS) else "id"
+        return [type(command).__name__, command._on_conflict, [self._encode(arg, patients) for arg in args],
+                self._encode(state, "copy")]
+
+    def _decode_entry(self, encoded, resolved=None):
+        """
+        :param resolved: dictionary of the patients decoded so far from the entry, by ID
+        :return: (command, args, undo state) tuple
+        """
+        name, on_conflict, args, state = encoded
+        if resolved is None:
+            resolved = {}
+        if name == CompositeCommand.__name__:
+            steps = [self._decode_entry(step, resolved) for step in args]
+            return COMPOSITE, tuple((step, step_args) for step, step_args, _ in steps), \
+                tuple(step_state for _, _, step_state in steps)
+        command = self._commands.get((name, on_conflict))
+        if command is None:
+            command = self._commands[(name, on_conflict)] = _COMMANDS[name](self._system, on_conflict)
+        return command, tuple(self._decode(arg, resolved) for arg in args), self._decode(state, resolved)
+
+    def _encode(self, value, patients):
+        """
+        :param patients: how patients are stored: "id" to refer to the patient in the system, "record" for a whole
+                         record that stands for the patient with the same ID in the system, if there is one when it is
+                         decoded, or "copy" for a whole record decoded as a patient of its own
+        :return: the value as JSON-serializable values
+        """
+        if isinstance(value, Patient):
+            return {"id": value.id} if patients == "id" else {patients: value.to_dict()}
+        if isinstance(value, Medication):
+            return {"medication": value.to_dict()}
+        if isinstance(value, tuple):
+            return {"tuple": [self._encode(item, patients) for item in value]}
+        if value is _ABSENT:
+            return {"absent": True}
+        if value is _UNCHANGED:
+            return {"unchanged": True}
+        if value is None or isinstance(value, (str, int, float)):
+            return value
+        raise TypeError(f"{value!r} cannot be stored in a DiskHistory.")
+
+    def _decode(self, value, resolved):
+        """
+        :param resolved: dictionary of the patients decoded so far from the entry, by ID, which later references to the
+                         same ID resolve to
+        :return: the value encoded by _encode
+        """
+        if not isinstance(value, dict):
+            return value
+        if "tuple" in value:
+            return tuple(self._decode(item, resolved) for item in value["tuple"])
+        if "record" in value or "id" in value:
+            id = value["record"]["id"] if "record" in value else value["id"]
+            patient = resolved.get(id)
+            if patient is None:
+                # the patient is used as it is in the system, if it is there, since later commands may have changed it
+                patient = self._system.find_patient(id)
+            if patient is None:
+                if "id" in value:
+                    raise LookupError(f"Patient {id} of the command is no longer in the system.")
+                patient = Patient.from_dict(value["record"])
+            resolved[id] = patient
+            return patient
+        if "copy" in value:
+            return Patient.from_dict(value["copy"])
+        if "medication" in value:
+            return Medication.from_dict(value["medication"])
+        return _ABSENT if "absent" in value else _UNCHANGED
@@ -1,4 +1,89 @@
-import copy
+from abc import ABCMeta, abstractmethod
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from contextlib import nullcontext
+import datetime
+import sys
+import threading
+from types import MappingProxyType
+
+try:
+    from concurrency import HeldLocks, StripedLock
+    from indexes import HashIndex, SortedIndex
+except ImportError:
+    from src.concurrency import HeldLocks, StripedLock
+    from src.indexes import HashIndex, SortedIndex
+
+
+class ConflictPolicy(object):
+    """
+    Policies for non-interactive writes to an entry that already exists in the system or in a patient's record
+    """
+    OVERWRITE = "overwrite"  # replace the existing entry
+    SKIP = "skip"  # keep the existing entry and ignore the write
+    ERROR = "error"  # raise a RecordConflictError
+
+
+class WriteResult(object):
+    """
+    Outcomes of a non-interactive write
+    """
+    ADDED = "added"
+    UPDATED = "updated"
+    SKIPPED = "skipped"
+
+
+class RecordConflictError(Exception):
+    """
+    Raised by a non-interactive write under the ERROR conflict policy when the entry already exists
+    """
+
+
+class Event(object):
+    """
+    Changes to the system or a patient's record that observers of the Health Records System are notified of.
+    Each event is sent with the patient it concerns, followed by the listed arguments.
+    Observers are notified before the change is applied, so an observer that raises an exception prevents the change.
+    """
+    PATIENT_ADDED = "patient_added"  # no arguments
+    PATIENT_REMOVED = "patient_removed"  # no arguments
+    MEDICATION_SET = "medication_set"  # the Medication object
+    MEDICATION_REMOVED = "medication_removed"  # the name of the medication
+    MEDICATION_CLEARED = "medication_cleared"  # no arguments
+    TEST_RESULTS_SET = "test_results_set"  # the name of the test, the date and the result
+    TEST_RESULTS_REMOVED = "test_results_removed"  # the name of the test and the date
+    TEST_RESULTS_CLEARED = "test_results_cleared"  # no arguments
+
+
+class IObserver(metaclass=ABCMeta):
+    """
+    Defines the observer interface as part of the Observer Design Pattern
+    """
+
+    @abstractmethod
+    def update(self, event, patient, *args):
+        """
+        Receives a change about to be made to the system or to the record of a patient in the system
+        :param event: one of the Event values
+        :param patient: the patient the change concerns
+        :param args: the arguments of the event
+        """
+
+
+def _overwrite_on_conflict(on_conflict, message):
+    """
+    Applies a conflict policy to a write whose entry already exists.
+    :param on_conflict: one of the ConflictPolicy values
+    :param message: description of the conflict, used if an error is raised
+    :return: True if the existing entry should be overwritten, False if the write should be skipped
+    """
+    if on_conflict == ConflictPolicy.OVERWRITE:
+        return True
+    if on_conflict == ConflictPolicy.SKIP:
+        return False
+    if on_conflict == ConflictPolicy.ERROR:
+        raise RecordConflictError(message)
+    raise ValueError(f"Unknown conflict policy: {on_conflict}")
 
 
 class HealthRecordsSystem(object):
@@ -6,6 +91,10 @@ class HealthRecordsSystem(object):
     Implements an Electronic Health Records System that stores patient information.
     Adheres to the Singleton Design Pattern such that only one instantiation of this class is possible.
     Assumes the role of Receiver as part of the Command Design Pattern.
+    Assumes the role of Subject as part of the Observer Design Pattern: observers are notified of every change to the
+    patients in the system, including changes to their records.
+    The system can be shared between threads. Looking up patients takes no lock, changes to the same patient are
+    serialized by a lock striped by patient ID, and changes to patients with different locks are made in parallel.
     """
 
     __instance = None
@@ -23,6 +112,17 @@ class HealthRecordsSystem(object):
         if HealthRecordsSystem.__instance is None:
             HealthRecordsSystem.__instance = self
             self._patients = {}  # stores patients in a dictionary of ID:patient pairs
+            # secondary indexes of patient IDs, kept up to date whenever a patient is added or removed
+            self._name_index = HashIndex()
+            self._phone_number_index = HashIndex()
+            self._age_index = SortedIndex()
+            self._medication_index = HashIndex()  # kept up to date whenever a patient's medication changes as well
+            self._indexed = True  # False until the secondary indexes of mounted patients are built
+            self._observers = []
+            self._patient_locks = StripedLock()  # serializes the changes to each patient
+            self._held = HeldLocks()  # patient locks held by the current thread
+            self._index_lock = threading.RLock()  # guards the patient dictionary and the secondary indexes together
+            self._deferred = deque()  # actions run once the thread making a change holds no lock of the system
         else:
             raise Exception("HealthRecordsSystem class is a Singleton.")
 
@@ -33,6 +133,86 @@ class HealthRecordsSystem(object):
         """
         HealthRecordsSystem.__instance = None
 
+    def mount(self, patients):
+        """
+        Stores the patients of the system in a MappedPatients store that loads each patient when it is first used.
+        The store is attached as an observer so that it keeps changed patients in memory. The secondary indexes are
+        built the first time they are queried.
+        :param patients: the MappedPatients store
+        """
+        with self.exclusive():
+            if self._patients:
+                raise Exception("Patients can only be mounted into an empty system.")
+            with self._index_lock:
+                self._patients = patients
+                self._name_index = HashIndex()
+                self._phone_number_index = HashIndex()
+                self._age_index = SortedIndex()
+                self._medication_index = HashIndex()
+                self._indexed = False
+            self.attach(patients)
+
+    def lock_patient(self, id):
+        """
+        Serializes the changes made while the returned context manager is held with all other changes to the patient.
+        Every change to the system or a patient's record already does this on its own; holding the lock is only needed
+        to make several reads and changes to a patient appear as one.
+        :param id: ID number of the patient
+        :return: context manager holding the patient's lock
+        """
+        return _Change(self, self._patient_locks(id))
+
+    def exclusive(self):
+        """
+        Stops all other changes to the system while the returned context manager is held. It cannot be entered while
+        the thread holds the lock of a single patient.
+        :return: context manager holding the lock of every patient
+        """
+        return _Change(self, None)
+
+    def defer(self, action):
+        """
+        Runs an action once the current thread has finished the change it is making and holds no lock of the system,
+        which allows an observer to act on the system as a whole after being notified of a change
+        :param action: function taking no arguments
+        """
+        if self._held.depth:
+            self._deferred.append(action)
+        else:
+            action()
+
+    def _run_deferred(self):
+        while True:
+            try:
+                action = self._deferred.popleft()
+            except IndexError:
+                return
+            action()
+
+    def attach(self, observer):
+        """
+        Registers an observer to be notified of every change to the patients in the system
+        :param observer: a subtype of the IObserver interface
+        """
+        self._observers.append(observer)
+
+    def detach(self, observer):
+        """
+        Stops notifying an observer of changes
+        :param observer: a previously attached observer
+        """
+        self._observers.remove(observer)
+
+    def notify(self, event, patient, *args):
+        """
+        Notifies all observers of a change
+        :param event: one of the Event values
+        :param patient: the patient the change concerns
+        :param args: the arguments of the event
+        """
+        for observer in self._observers:
+            observer.update(event, patient, *args)
+
     def get_patient(self, id):
         """
         Retrieves patient by their ID number.
@@ -45,6 +225,81 @@ class HealthRecordsSystem(object):
             print(f"Patient #{id} does not exist in the System.")
             return None
 
+    def find_patient(self, id):
+        """
+        Retrieves patient by their ID number without any console output.
+        :param id: unique number given to patient upon creation
+        :return: patient corresponding to the ID if it exists in the system, otherwise returns None
+        """
+        return self._patients.get(id)
+
+    def patients(self):
+        """
+        Iterates over every patient in the system when the iteration starts, skipping those removed during it.
+        :return: iterator of Patient objects
+        """
+        with self._index_lock:
+            ids = list(self._patients)
+        return (patient for patient in map(self._patients.get, ids) if patient is not None)
+
+    def snapshot(self):
+        """
+        Takes a point-in-time snapshot of the system that can be read while the system keeps changing.
+        Taking it only waits for the changes in progress to finish: a patient's record is copied the first time the
+        patient is read from the snapshot or changed in the system after it, and records share their dictionaries with
+        the copies until they change, so the memory used grows with the number of patients changed.
+        The snapshot should be closed once it is no longer needed, which the with statement does.
+        :return: the Snapshot
+        """
+        return Snapshot(self)
+
+    def find_by_name(self, name):
+        """
+        Retrieves all patients with exactly the given name.
+        :param name: the patient's name
+        :return: list of the patients with the name
+        """
+        with self._index_lock:
+            self._build_indexes()
+            return [self._patients[id] for id in self._name_index.get(name)]
+
+    def find_by_phone(self, phone_number):
+        """
+        Retrieves all patients with exactly the given phone number.
+        :param phone_number: the patient's phone number
+        :return: list of the patients with the phone number
+        """
+        with self._index_lock:
+            self._build_indexes()
+            return [self._patients[id] for id in self._phone_number_index.get(phone_number)]
+
+    def patients_in_age_range(self, lo, hi):
+        """
+        Retrieves all patients whose age is between lo and hi, inclusive.
+        :param lo: minimum age
+        :param hi: maximum age
+        :return: list of the patients in the age range, sorted by age
+        """
+        with self._index_lock:
+            self._build_indexes()
+            return [self._patients[id] for id in self._age_index.range(lo, hi)]
+
+    def find_by_medication(self, *med_names):
+        """
+        Retrieves all patients taking every one of the given medications, e.g. to find the patients on both of two
+        interacting drugs. The patients are found by intersecting the sets of patients taking each medication, starting
+        from the smallest, without looking at any other patient.
+        :param med_names: names of the medications
+        :return: list of the patients taking all of the medications, or an empty list if no name is given
+        """
+        with self._index_lock:
+            self._build_indexes()
+            taking = sorted((self._medication_index.get(med_name) for med_name in med_names), key=len)
+            if not taking:
+                return []
+            ids = taking[0].intersection(*taking[1:])
+            return [self._patients[id] for id in ids]
+
     def add_patient(self, patient):
         """
         Adds a patient to the system if the ID does not already exist.
@@ -54,39 +309,392 @@ class HealthRecordsSystem(object):
         if patient.id in self._patients:
             overwrite = input(f"Patient #{patient.id} already exists. Overwrite? Y/N ")
             if overwrite == "Y":
-                self._patients[patient.id] = patient
+                self.insert_patient(patient, ConflictPolicy.OVERWRITE)
                 print(f"Patient #{patient.id} successfully added to the system.")
             else:
                 print(f"Failure: Patient #{patient.id} was not added to the system.")
         else:
-            self._patients[patient.id] = patient
+            self.insert_patient(patient)
             print(f"Patient #{patient.id} successfully added to the system.")
-        
+
+    def insert_patient(self, patient, on_conflict=ConflictPolicy.ERROR):
+        """
+        Adds a patient to the system without any console input or output.
+        :param patient: the new patient to be added to the system
+        :param on_conflict: ConflictPolicy applied if a patient with the same ID already exists
+        :return: the WriteResult of the operation
+        """
+        with self.lock_patient(patient.id):
+            old_patient = self._patients.get(patient.id)
+            if old_patient is not None:
+                if not _overwrite_on_conflict(on_conflict, f"Patient #{patient.id} already exists."):
+                    return WriteResult.SKIPPED
+                self._detach_patient(old_patient)
+                self._attach_patient(patient)
+                return WriteResult.UPDATED
+
+            self._attach_patient(patient)
+            return WriteResult.ADDED
+
+    def add_patients_bulk(self, patients, on_conflict=ConflictPolicy.ERROR):
+        """
+        Adds many patients to the system in one pass without any console input or output.
+        Under the ERROR policy, no patient is added if any of them conflicts with an existing or earlier patient.
+        Patients with the same ID in the batch are counted once, as ADDED or UPDATED depending on whether the ID
+        already existed in the system; under the SKIP policy every later duplicate is counted as SKIPPED.
+        :param patients: iterable of the new patients to be added to the system
+        :param on_conflict: ConflictPolicy applied to patients whose ID already exists
+        :return: dictionary of the number of patients for each WriteResult
+        """
+        with self.exclusive():
+            return self._add_patients_bulk(patients, on_conflict)
+
+    def _add_patients_bulk(self, patients, on_conflict):
+        counts = {WriteResult.ADDED: 0, WriteResult.UPDATED: 0, WriteResult.SKIPPED: 0}
+        staged = {}
+
+        for patient in patients:
+            id = patient.id
+            if id in staged or id in self._patients:
+                if not _overwrite_on_conflict(on_conflict, f"Patient #{id} already exists."):
+                    counts[WriteResult.SKIPPED] += 1
+                    continue
+                if id not in staged:
+                    counts[WriteResult.UPDATED] += 1
+            else:
+                counts[WriteResult.ADDED] += 1
+            staged[id] = patient
+
+        stored = []
+        try:
+            for id, patient in staged.items():
+                old_patient = self._patients.get(id)
+                if old_patient is not None:
+                    self._detach_patient(old_patient)
+                if self._observers:
+                    self.notify(Event.PATIENT_ADDED, patient)
+                with self._index_lock:
+                    self._patients[id] = patient
+                patient._system = self
+                stored.append(patient)
+        finally:
+            # the stored patients are indexed together, even if an observer stopped the batch part way through
+            with self._index_lock:
+                if self._indexed:
+                    self._name_index.add_many((patient._name, patient._id) for patient in stored)
+                    self._phone_number_index.add_many((patient._phone_number, patient._id) for patient in stored)
+                    self._age_index.add_many((patient._age, patient._id) for patient in stored)
+                    self._medication_index.add_many((med_name, patient._id) for patient in stored
+                                                    for med_name in patient._medication)
+        return counts
+
     def remove_patient(self, id):
         """
         Removes a patient from the system if the ID number exists, otherwise does nothing.
         :param id: ID number of the patient to remove
         :return: the removed patient if removal is successful, otherwise returns None
         """
-        try:
-            patient = self._patients[id]
-            del self._patients[id]
+        patient = self.delete_patient(id)
+        if patient is None:
+            print(f"Patient #{id} does not exist in the system.")
+        else:
             print(f"Patient #{id} successfully removed from the system.")
+        return patient
+
+    def delete_patient(self, id):
+        """
+        Removes a patient from the system without any console output.
+        :param id: ID number of the patient to remove
+        :return: the removed patient if removal is successful, otherwise returns None
+        """
+        with self.lock_patient(id):
+            patient = self._patients.get(id)
+            if patient is not None:
+                self._detach_patient(patient)
             return patient
-        except KeyError:
-            print(f"Patient #{id} does not exist in the system.")
-            return None
+
+    def _attach_patient(self, patient):
+        """
+        Notifies observers of a new patient, then stores it in the system and adds it to the secondary indexes
+        """
+        if self._observers:
+            self.notify(Event.PATIENT_ADDED, patient)
+        with self._index_lock:
+            self._patients[patient.id] = patient
+            patient._system = self
+            if self._indexed:
+                self._name_index.add(patient.name, patient.id)
+                self._phone_number_index.add(patient.phone_number, patient.id)
+                self._age_index.add(patient.age, patient.id)
+                for med_name in patient.medication:
+                    self._medication_index.add(med_name, patient.id)
+
+    def _detach_patient(self, patient):
+        """
+        Notifies observers of a removed patient, then removes it from the system and from the secondary indexes
+        """
+        if self._observers:
+            self.notify(Event.PATIENT_REMOVED, patient)
+        with self._index_lock:
+            del self._patients[patient.id]
+            patient._system = None
+            if self._indexed:
+                self._name_index.remove(patient.name, patient.id)
+                self._phone_number_index.remove(patient.phone_number, patient.id)
+                self._age_index.remove(patient.age, patient.id)
+                for med_name in patient.medication:
+                    self._medication_index.remove(med_name, patient.id)
+
+    def _build_indexes(self):
+        """
+        Builds the secondary indexes of mounted patients if they have not been built yet. Requires the index lock.
+        """
+        if self._indexed:
+            return
+        summaries = list(self._patients.summaries())
+        self._name_index.add_many((name, id) for id, name, _, _, _ in summaries)
+        self._phone_number_index.add_many((phone_number, id) for id, _, phone_number, _, _ in summaries)
+        self._age_index.add_many((age, id) for id, _, _, age, _ in summaries)
+        self._medication_index.add_many((med_name, id) for id, _, _, _, med_names in summaries
+                                        for med_name in med_names)
+        self._indexed = True
+
+    def _index_medication(self, id, med_names, taking):
+        """
+        Updates the medication index after a change to a patient's medication
+        :param id: ID number of the patient
+        :param med_names: names of the medications that the patient started or stopped taking
+        :param taking: whether the patient started taking them
+        """
+        with self._index_lock:
+            if self._indexed:
+                for med_name in med_names:
+                    if taking:
+                        self._medication_index.add(med_name, id)
+                    else:
+                        self._medication_index.remove(med_name, id)
+
+
+class Snapshot(IObserver):
+    """
+    Point-in-time view of the patients in a Health Records System, returned by HealthRecordsSystem.snapshot().
+    Patients read from it are frozen copies, which must not be changed.
+    """
+
+    def __init__(self, system):
+        self._system = system
+        # ID: frozen copy of a patient changed in the system since the snapshot, or None if the patient was added
+        self._preserved = {}
+        with system.exclusive():
+            system.attach(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Stops preserving the patients changed in the system, after which the snapshot can no longer be read
+        """
+        if self._preserved is not None:
+            self._system.detach(self)
+            self._preserved = None
+
+    def update(self, event, patient, *args):
+        # called before the change with the patient's lock held, so the patient is still as it was at the snapshot
+        preserved = self._preserved
+        if patient.id in preserved:
+            return
+        if event == Event.PATIENT_ADDED:
+            # the patient replaces one that was removed first, and is therefore already preserved, or is new
+            preserved[patient.id] = None
+        else:
+            preserved[patient.id] = patient._frozen()
+
+    def find_patient(self, id):
+        """
+        Retrieves a patient as it was when the snapshot was taken
+        :param id: unique number given to patient upon creation
+        :return: frozen copy of the patient if it was in the system, otherwise None
+        """
+        preserved = self._preserved
+        if preserved is None:
+            raise ValueError("The snapshot is closed.")
+        with self._system.lock_patient(id):
+            if id in preserved:
+                return preserved[id]
+            patient = self._system.find_patient(id)
+            return None if patient is None else patient._frozen()
+
+    def patients(self):
+        """
+        Iterates over every patient that was in the system when the snapshot was taken
+        :return: iterator of frozen copies of the Patient objects
+        """
+        system = self._system
+        with system._index_lock:
+            ids = list(system._patients)
+        for id in ids:
+            patient = self.find_patient(id)
+            if patient is not None:
+                yield patient
+        current = set(ids)
+        for id, patient in list(self._preserved.items()):
+            if patient is not None and id not in current:
+                yield patient
+
+
+class _Change(object):
+    """
+    Context manager held while changes are made to the system: holds the lock of the patient being changed, or the
+    locks of every patient if there is no patient lock. Runs the actions deferred by observers once the thread no
+    longer holds any patient lock.
+    """
+
+    __slots__ = ("_system", "_patient_lock")
+
+    def __init__(self, system, patient_lock):
+        self._system = system
+        self._patient_lock = patient_lock
+
+    def __enter__(self):
+        held = self._system._held
+        if self._patient_lock is not None:
+            self._patient_lock.acquire()
+        elif held.depth and not held.all:
+            raise RuntimeError("The whole system cannot be locked while holding the lock of a patient.")
+        else:
+            self._system._patient_locks.acquire_all()
+            held.all += 1
+        held.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        system = self._system
+        held = system._held
+        if self._patient_lock is not None:
+            self._patient_lock.release()
+        else:
+            system._patient_locks.release_all()
+            held.all -= 1
+        held.depth -= 1
+        if system._deferred and not held.depth:
+            system._run_deferred()
+
+
+_UNLOCKED = nullcontext()  # used in place of the lock of a patient that is not stored in a system
+_EMPTY = MappingProxyType({})  # shared by every patient without medication or test results, until one is added
+_UNDATED = float("inf")  # sorts test results whose date cannot be parsed after all others
+_MAX_DATE_STRING = "\U0010ffff"  # compares greater than any date string with the same date ordinal
+
+
+def _parse_date(date):
+    """
+    Parses a test result's date
+    :param date: date in the format DD/MM/YYYY
+    :return: the proleptic Gregorian ordinal of the date, or _UNDATED if it is not a valid DD/MM/YYYY date
+    """
+    try:
+        day, month, year = date.split("/")
+        return datetime.date(int(year), int(month), int(day)).toordinal()
+    except (AttributeError, ValueError):
+        return _UNDATED
+
+
+def _date_ordinal(date):
+    """
+    Converts a date bound of a test results query to its ordinal
+    :param date: a date object or a string in the format DD/MM/YYYY
+    :return: the proleptic Gregorian ordinal of the date
+    """
+    if isinstance(date, datetime.date):
+        return date.toordinal()
+    ordinal = _parse_date(date)
+    if ordinal == _UNDATED:
+        raise ValueError(f"{date} is not a date in the format DD/MM/YYYY.")
+    return ordinal
+
+
+def _whole_number(value):
+    """
+    Converts a whole, non-negative number to an int
+    :param value: an int, a float with no fractional part, or a string of decimal digits
+    :return: the value as an int
+    :raises ValueError: if the value is not a whole, non-negative number
+    """
+    if isinstance(value, str) and value.strip().isdecimal():
+        return int(value)
+    if isinstance(value, float) and value.is_integer() and value >= 0:
+        return int(value)
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+        return value
+    raise ValueError(f"{value!r} is not a whole, non-negative number.")
+
+
+def _intern(value):
+    """
+    Interns a string so that equal values share a single copy in memory
+    :param value: the value to intern
+    :return: the interned string, or the value itself if it is not a string
+    """
+    return sys.intern(value) if type(value) is str else value
 
 
 class Patient(object):
 
+    __slots__ = ("_id", "_name", "_age", "_phone_number", "_medication", "_test_results", "_test_dates", "_system",
+                 "_shared")
+
     def __init__(self, id, name, age, phone_number):
+        """
+        :param age: the patient's age as a whole, non-negative number, or a string of one
+        :raises ValueError: if the age is not a whole, non-negative number
+        """
         self._id = id
         self._name = name
-        self._age = age
+        self._age = _whole_number(age)
         self._phone_number = phone_number
-        self._medication = {}
-        self._test_results = {}
+        # the record's dictionaries are only allocated once the first entry is added to them
+        self._medication = _EMPTY
+        self._test_results = _EMPTY
+        self._test_dates = _EMPTY  # test name: sorted list of (date ordinal, date) for each of the test's results
+        self._system = None  # the system storing this patient, which is notified of changes to the record
+        self._shared = False  # whether the record's dictionaries are shared with a frozen copy of the patient
+
+    def __getstate__(self):
+        # the system is not part of the patient's record, so copies and pickles do not carry it along
+        return {slot: getattr(self, slot) for slot in self.__slots__
+                if slot not in ("_system", "_shared") and getattr(self, slot) is not _EMPTY}
+
+    def __setstate__(self, state):
+        self._system = None
+        self._shared = False
+        self._medication = self._test_results = self._test_dates = _EMPTY
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+    def to_dict(self):
+        """
+        :return: the patient's record as a dictionary of JSON-serializable values
+        """
+        return {"id": self._id, "name": self._name, "age": self._age, "phone_number": self._phone_number,
+                "medication": [med.to_dict() for med in self._medication.values()],
+                "test_results": [[name, date, result] for (name, date), result in self._test_results.items()]}
+
+    @staticmethod
+    def from_dict(record):
+        """
+        Creates a patient from a dictionary produced by to_dict
+        :param record: the patient's record
+        :return: the new Patient object
+        """
+        patient = Patient(record["id"], record["name"], record["age"], record["phone_number"])
+        for med in record["medication"]:
+            patient.insert_medication(Medication.from_dict(med))
+        patient.add_test_results_bulk(record["test_results"])
+        return patient
 
     @property
     def id(self):
@@ -106,11 +714,17 @@ class Patient(object):
 
     @property
     def medication(self):
-        return self._medication
+        """
+        :return: read-only view of the patient's medication, keyed by name
+        """
+        return MappingProxyType(self._medication)
 
     @property
     def test_results(self):
-        return self._test_results
+        """
+        :return: read-only view of the patient's test results, keyed by (name, date)
+        """
+        return MappingProxyType(self._test_results)
 
     def get_medication(self, med_name):
         """
@@ -134,34 +748,70 @@ class Patient(object):
         if med.name in self._medication:
             overwrite = input(f"Patient #{self._id} is already taking this medication. Overwrite dosage and frequency? Y/N ")
             if overwrite == "Y":
-                self._medication[med.name] = med  # update the medication information
+                self.insert_medication(med, ConflictPolicy.OVERWRITE)  # update the medication information
                 print(f"Medication successfully updated in patient #{self._id}'s record.")
             else:
                 print(f"Failure: Medication was not updated in patient #{self._id}'s record.")
         else:
-            self._medication[med.name] = med
+            self.insert_medication(med)
             print(f"Medication successfully added to patient #{self._id}'s record.")
 
+    def insert_medication(self, med, on_conflict=ConflictPolicy.ERROR):
+        """
+        Adds a medication to the patient's record without any console input or output.
+        :param med: the new medication to be added to the patient's record
+        :param on_conflict: ConflictPolicy applied if the patient is already taking a medication with the same name
+        :return: the WriteResult of the operation
+        """
+        with self._locked():
+            if med.name in self._medication:
+                if not _overwrite_on_conflict(on_conflict, f"Patient #{self._id} is already taking {med.name}."):
+                    return WriteResult.SKIPPED
+                self._notify(Event.MEDICATION_SET, med)
+                self._medication[med.name] = med
+                return WriteResult.UPDATED
+
+            self._notify(Event.MEDICATION_SET, med)
+            if self._medication is _EMPTY:
+                self._medication = {}
+            self._medication[med.name] = med
+            self._index_medication((med.name,), True)
+            return WriteResult.ADDED
+
     def remove_medication(self, med_name):
         """
         Removes a medication from the patient's record if the name exists, otherwise does nothing.
         :param med_name: name of the medication to remove
         :return: the removed medication if removal is successful, otherwise returns None
         """
-        try:
-            med = self._medication[med_name]
-            del self._medication[med_name]
-            print(f"{med_name} successfully removed from the patient's record.")
-            return med
-        except KeyError:
+        med = self.delete_medication(med_name)
+        if med is None:
             print(f"{med_name} does not exist in the patient's record.")
-            return None
+        else:
+            print(f"{med_name} successfully removed from the patient's record.")
+        return med
+
+    def delete_medication(self, med_name):
+        """
+        Removes a medication from the patient's record without any console output.
+        :param med_name: name of the medication to remove
+        :return: the removed medication if removal is successful, otherwise returns None
+        """
+        with self._locked():
+            if med_name not in self._medication:
+                return None
+            self._notify(Event.MEDICATION_REMOVED, med_name)
+            self._index_medication((med_name,), False)
+            return self._medication.pop(med_name)
 
     def clear_medication(self):
         """
         Clears all medication from the patient's record.
         """
-        self._medication.clear()
+        with self._locked():
+            self._notify(Event.MEDICATION_CLEARED)
+            self._index_medication(list(self._medication), False)
+            self._medication = _EMPTY
 
     def get_test_results(self, name, date):
         """
@@ -184,31 +834,244 @@ class Patient(object):
         :param date: date that the test was performed (DD/MM/YYYY)
         :param result: result of the test
         """
-        if (name, date) in self._test_results.keys():
+        if (name, date) in self._test_results:
             overwrite = input(f"A result for this test on {date} has already been recorded. Overwrite test result? Y/N ")
             if overwrite == "Y":
-                self._test_results[(name, date)] = result
+                self.insert_test_results(name, date, result, ConflictPolicy.OVERWRITE)
                 print(f"Test result successfully updated in patient #{self._id}'s record.")
             else:
                 print(f"Failure: Test result was not updated in patient #{self._id}'s record.")
                 return
         else:
-            self._test_results[(name, date)] = result
+            self.insert_test_results(name, date, result)
             print(f"Test result successfully added to patient #{self._id}'s record.")
 
+    def insert_test_results(self, name, date, result, on_conflict=ConflictPolicy.ERROR):
+        """
+        Adds a test result to the patient's record without any console input or output.
+        :param name: name of the test
+        :param date: date that the test was performed (DD/MM/YYYY)
+        :param result: result of the test
+        :param on_conflict: ConflictPolicy applied if a result for this test already exists on the specified date
+        :return: the WriteResult of the operation
+        """
+        with self._locked():
+            name, date = _intern(name), _intern(date)
+            if (name, date) in self._test_results:
+                message = f"A result for {name} on {date} has already been recorded."
+                if not _overwrite_on_conflict(on_conflict, message):
+                    return WriteResult.SKIPPED
+                self._notify(Event.TEST_RESULTS_SET, name, date, result)
+                self._test_results[(name, date)] = result
+                return WriteResult.UPDATED
+
+            self._notify(Event.TEST_RESULTS_SET, name, date, result)
+            if self._test_results is _EMPTY:
+                self._test_results = {}
+            self._test_results[(name, date)] = result
+            self._index_test_date(name, date)
+            return WriteResult.ADDED
+
+    def add_test_results_bulk(self, results, on_conflict=ConflictPolicy.ERROR):
+        """
+        Adds many test results to the patient's record in one pass without any console input or output.
+        Under the ERROR policy, no result is added if any of them conflicts with an existing or earlier result.
+        Results for the same test and date in the batch are counted once, as ADDED or UPDATED depending on whether the
+        result already existed in the record; under the SKIP policy every later duplicate is counted as SKIPPED.
+        :param results: iterable of (name, date, result) tuples
+        :param on_conflict: ConflictPolicy applied to results whose test name and date already exist
+        :return: dictionary of the number of test results for each WriteResult
+        """
+        with self._locked():
+            counts = {WriteResult.ADDED: 0, WriteResult.UPDATED: 0, WriteResult.SKIPPED: 0}
+            staged = {}
+
+            for name, date, result in results:
+                name, date = _intern(name), _intern(date)
+                if (name, date) in staged or (name, date) in self._test_results:
+                    message = f"A result for {name} on {date} has already been recorded."
+                    if not _overwrite_on_conflict(on_conflict, message):
+                        counts[WriteResult.SKIPPED] += 1
+                        continue
+                    if (name, date) not in staged:
+                        counts[WriteResult.UPDATED] += 1
+                else:
+                    counts[WriteResult.ADDED] += 1
+                staged[(name, date)] = result
+
+            if self._system is not None:
+                for (name, date), result in staged.items():
+                    self._notify(Event.TEST_RESULTS_SET, name, date, result)
+            if self._shared:
+                self._unshare()
+
+            for name, date in staged:
+                if (name, date) not in self._test_results:
+                    self._index_test_date(name, date)
+            if self._test_results is not _EMPTY:
+                self._test_results.update(staged)
+            elif staged:
+                self._test_results = staged
+            return counts
+
+    def remove_test_results(self, name, date):
+        """
+        Removes a test result from the patient's record if the name and date exist, otherwise does nothing.
+        :param name: name of the test
+        :param date: date that the test was performed (DD/MM/YYYY)
+        :return: the removed test result if removal is successful, otherwise returns None
+        """
+        result = self.delete_test_results(name, date)
+        if result is None:
+            print(f"Test for {name} does not exist in the patient's record on {date}.")
+        else:
+            print(f"Test for {name} on {date} successfully removed from the patient's record.")
+        return result
+
+    def delete_test_results(self, name, date):
+        """
+        Removes a test result from the patient's record without any console output.
+        :param name: name of the test
+        :param date: date that the test was performed (DD/MM/YYYY)
+        :return: the removed test result if removal is successful, otherwise returns None
+        """
+        with self._locked():
+            if (name, date) not in self._test_results:
+                return None
+            self._notify(Event.TEST_RESULTS_REMOVED, name, date)
+            self._unindex_test_date(name, date)
+            return self._test_results.pop((name, date))
+
     def clear_test_results(self):
         """
         Clears all tests from the patient's record.
         """
-        self._test_results.clear()
+        with self._locked():
+            self._notify(Event.TEST_RESULTS_CLEARED)
+            self._test_results = _EMPTY
+            self._test_dates = _EMPTY
+
+    def get_test_results_range(self, name, start, end):
+        """
+        Retrieves a patient's results for a test performed between two dates, inclusive.
+        :param name: name of the test
+        :param start: first date of the range, as a date or a DD/MM/YYYY string
+        :param end: last date of the range, as a date or a DD/MM/YYYY string
+        :return: list of (date, result) tuples in chronological order
+        """
+        with self._locked():
+            dates = self._test_dates.get(name, [])
+            lo = bisect_left(dates, (_date_ordinal(start),))
+            hi = bisect_right(dates, (_date_ordinal(end), _MAX_DATE_STRING))
+            return [(date, self._test_results[(name, date)]) for _, date in dates[lo:hi]]
+
+    def latest(self, name, n=1):
+        """
+        Retrieves a patient's most recent results for a test. Results whose date is not in the DD/MM/YYYY format are
+        ignored.
+        :param name: name of the test
+        :param n: maximum number of results to retrieve
+        :return: list of (date, result) tuples, most recent first
+        """
+        with self._locked():
+            dates = self._test_dates.get(name, [])
+            end = bisect_left(dates, (_UNDATED,))
+            return [(date, self._test_results[(name, date)]) for _, date in reversed(dates[max(end - n, 0):end])]
+
+    def sorted_test_results(self):
+        """
+        Iterates over the patient's test results ordered by test name, then chronologically. Results whose date is not
+        in the DD/MM/YYYY format come after the other results for the same test.
+        :return: iterator of (name, date, result) tuples
+        """
+        with self._locked():
+            return iter([(name, date, self._test_results[(name, date)])
+                         for name in sorted(self._test_dates) for _, date in self._test_dates[name]])
+
+    def _locked(self):
+        """
+        :return: context manager holding the lock of the patient in the system storing it, if any
+        """
+        system = self._system
+        return _UNLOCKED if system is None else system.lock_patient(self._id)
+
+    def _index_medication(self, med_names, taking):
+        """
+        Updates the medication index of the system storing this patient, if any
+        """
+        if self._system is not None:
+            self._system._index_medication(self._id, med_names, taking)
+
+    def _notify(self, event, *args):
+        """
+        Notifies the observers of the system storing this patient, if any, of a change to the record, then copies the
+        record's dictionaries if they are shared with a frozen copy, since the change is about to be applied to them
+        """
+        if self._system is not None:
+            self._system.notify(event, self, *args)
+        if self._shared:
+            self._unshare()
+
+    def _frozen(self):
+        """
+        Copies the patient in constant time by sharing the record's dictionaries until either patient is changed.
+        Requires the patient's lock.
+        :return: the new Patient object, outside any system
+        """
+        copy = Patient.__new__(Patient)
+        copy._id, copy._name, copy._age, copy._phone_number = self._id, self._name, self._age, self._phone_number
+        copy._medication, copy._test_results, copy._test_dates = self._medication, self._test_results, self._test_dates
+        copy._system = None
+        copy._shared = self._shared = True
+        return copy
+
+    def _unshare(self):
+        """
+        Gives the patient copies of the record's dictionaries that were shared with a frozen copy
+        """
+        if self._medication is not _EMPTY:
+            self._medication = dict(self._medication)
+        if self._test_results is not _EMPTY:
+            self._test_results = dict(self._test_results)
+        if self._test_dates is not _EMPTY:
+            self._test_dates = {name: list(dates) for name, dates in self._test_dates.items()}
+        self._shared = False
+
+    def _index_test_date(self, name, date):
+        """
+        Adds a test result's date to the sorted dates of its test
+        """
+        if self._test_dates is _EMPTY:
+            self._test_dates = {}
+        dates = self._test_dates.get(name)
+        if dates is None:
+            dates = self._test_dates[name] = []
+        insort(dates, (_parse_date(date), date))
+
+    def _unindex_test_date(self, name, date):
+        """
+        Removes a test result's date from the sorted dates of its test, if it is indexed
+        """
+        dates = self._test_dates.get(name)
+        if dates is None:
+            return
+        entry = (_parse_date(date), date)
+        i = bisect_left(dates, entry)
+        if i < len(dates) and dates[i] == entry:
+            del dates[i]
+            if not dates:
+                del self._test_dates[name]
 
 
 class Medication(object):
 
+    __slots__ = ("_name", "_dosage", "_frequency")
+
     def __init__(self, name, dosage, frequency):
-        self._name = name
+        # names and frequencies repeat across many patients, so they are interned to share one copy of each
+        self._name = _intern(name)
         self._dosage = dosage
-        self._frequency = frequency
+        self._frequency = _intern(frequency)
 
     @property
     def name(self):
@@ -216,7 +1079,7 @@ class Medication(object):
 
     @name.setter
     def name(self, value):
-        self._name = value
+        self._name = _intern(value)
 
     @property
     def dosage(self):
@@ -232,4 +1095,19 @@ class Medication(object):
 
     @frequency.setter
     def frequency(self, value):
-        self._frequency = value
+        self._frequency = _intern(value)
+
+    def to_dict(self):
+        """
+        :return: the medication as a dictionary of JSON-serializable values
+        """
+        return {"name": self._name, "dosage": self._dosage, "frequency": self._frequency}
+
+    @staticmethod
+    def from_dict(record):
+        """
+        Creates a medication from a dictionary produced by to_dict
+        :param record: the medication's information
+        :return: the new Medication object
+        """
+        return Medication(record["name"], record["dosage"], record["frequency"])
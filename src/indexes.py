@@ -0,0 +1,103 @@
+from bisect import bisect_left, bisect_right
+
+
+class HashIndex(object):
+    """
+    Maps exact key values to the IDs of the patients that have them
+    """
+
+    def __init__(self):
+        self._ids = {}  # key: set of patient IDs
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, key, id):
+        """
+        Records that the patient with the given ID has the key value
+        :param key: the indexed value
+        :param id: ID number of the patient
+        """
+        ids = self._ids.get(key)
+        if ids is None:
+            self._ids[key] = {id}
+        else:
+            ids.add(id)
+
+    def add_many(self, items):
+        """
+        Records many key values at once
+        :param items: iterable of (key, patient ID) pairs
+        """
+        ids_by_key = self._ids
+        for key, id in items:
+            ids = ids_by_key.get(key)
+            if ids is None:
+                ids_by_key[key] = {id}
+            else:
+                ids.add(id)
+
+    def remove(self, key, id):
+        """
+        Removes the record that the patient with the given ID has the key value, if it exists
+        :param key: the indexed value
+        :param id: ID number of the patient
+        """
+        ids = self._ids.get(key)
+        if ids is not None:
+            ids.discard(id)
+            if not ids:
+                del self._ids[key]
+
+    def get(self, key):
+        """
+        :param key: the indexed value
+        :return: set of the IDs of the patients with the key value
+        """
+        return self._ids.get(key, frozenset())
+
+
+class SortedIndex(HashIndex):
+    """
+    Hash index that also keeps its distinct keys in sorted order to answer range queries
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._keys = []  # sorted distinct keys
+
+    def add(self, key, id):
+        if key not in self._ids:
+            self._keys.insert(bisect_left(self._keys, key), key)
+        super().add(key, id)
+
+    def add_many(self, items):
+        # new keys are sorted into the key list once, rather than inserted one at a time
+        new_keys = set()
+        ids_by_key = self._ids
+        for key, id in items:
+            ids = ids_by_key.get(key)
+            if ids is None:
+                ids_by_key[key] = {id}
+                new_keys.add(key)
+            else:
+                ids.add(id)
+        if new_keys:
+            self._keys = sorted(self._keys + list(new_keys))
+
+    def remove(self, key, id):
+        super().remove(key, id)
+        if key not in self._ids:
+            i = bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+
+    def range(self, lo, hi):
+        """
+        Retrieves the IDs of all patients whose key lies between lo and hi, inclusive
+        :param lo: lower bound of the key
+        :param hi: upper bound of the key
+        :return: generator of patient IDs, in order of key
+        """
+        for key in self._keys[bisect_left(self._keys, lo):bisect_right(self._keys, hi)]:
+            yield from self._ids[key]
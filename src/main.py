@@ -1,27 +1,110 @@
-from health_records_system import *
-from command import *
-
-# instantiate Receiver and Invoker for Command design pattern
-SYSTEM = HealthRecordsSystem()
-INVOKER = Invoker()
-
-# create commands
-ADD_PATIENT = AddPatientCommand(SYSTEM)
-REMOVE_PATIENT = RemovePatientCommand(SYSTEM)
-ADD_MEDS = AddMedicationCommand(SYSTEM)
-REMOVE_MEDS = RemoveMedicationCommand(SYSTEM)
-ADD_TEST_RESULTS = AddTestResultsCommand(SYSTEM)
+"""
+Console program of the Electronic Health Records System.
+
+Importing this module is cheap: the system, the commands and the modules they need are only built when first used, by
+app(). main() starts building them in the background as soon as it shows the menu, so recovering the saved records
+overlaps with the user reading it.
+"""
+DATA_DIRECTORY = "health_records_data"  # where patient records are kept between runs
+
+# commands used by the menus: name of the command, class of the command in command.py
+COMMANDS = {
+    "add_patient": "AddPatientCommand",
+    "remove_patient": "RemovePatientCommand",
+    "add_medication": "AddMedicationCommand",
+    "remove_medication": "RemoveMedicationCommand",
+    "add_test_results": "AddTestResultsCommand",
+}
+
+
+class App(object):
+    """
+    The Health Records System recovered from a data directory, with the Invoker and commands used by the menus and the
+    views and search index they read from
+    """
+
+    def __init__(self, data_directory=DATA_DIRECTORY):
+        """
+        Recovers the patient records saved by previous runs and saves every change from now on
+        :param data_directory: directory holding the saved records and undo history
+        """
+        import command
+        from disk_history import DiskHistory
+        from health_records_system import HealthRecordsSystem
+        from storage import Storage
+        from views import ViewCache
+
+        # instantiate Receiver and Invoker for Command design pattern
+        self.system = HealthRecordsSystem()
+        self.invoker = command.Invoker()
+
+        # create commands and register them with Invoker
+        self.commands = {name: getattr(command, class_name)(self.system) for name, class_name in COMMANDS.items()}
+        for cmd in self.commands.values():
+            self.invoker.register(cmd)
+
+        self.storage = Storage(data_directory)
+        self.storage.open(self.system)
+        # keep the undo and redo history with the records, so that it also survives restarts
+        self.invoker.use_history(DiskHistory(data_directory, self.system))
+        self.view_cache = ViewCache(self.system)  # rendered records, kept until the patient changes
+        self._search = None
+
+    @property
+    def search(self):
+        """
+        :return: the SearchIndex over patient names, built on first use since it reads every patient's record
+        """
+        if self._search is None:
+            from search import SearchIndex
+            self._search = SearchIndex(self.system)
+        return self._search
+
+
+_loader = None  # thread building the App in the background, once started
+_loaded = {}  # the built App under "app", or the exception raised building it under "error"
+
+
+def _load(data_directory):
+    try:
+        _loaded["app"] = App(data_directory)
+    except BaseException as error:
+        _loaded["error"] = error
+
+
+def preload(data_directory=DATA_DIRECTORY):
+    """
+    Starts building the App in the background, if it has not been started yet
+    :param data_directory: directory holding the saved records and undo history
+    """
+    global _loader
+    if _loader is None:
+        import threading
+        _loader = threading.Thread(target=_load, args=(data_directory,), daemon=True)
+        _loader.start()
+
+
+def app():
+    """
+    :return: the App, built on first use, waiting for it if it is being built in the background
+    """
+    preload()
+    _loader.join()
+    if "error" in _loaded:
+        raise _loaded["error"]
+    return _loaded["app"]
 
 
 def main():
+    preload()
+    try:
+        menu()
+    except (EOFError, KeyboardInterrupt):
+        # the records are saved as a snapshot, so that the next run maps it rather than replaying the log
+        app().storage.close()
 
-    # register commands with Invoker
-    INVOKER.register(ADD_PATIENT)
-    INVOKER.register(REMOVE_PATIENT)
-    INVOKER.register(ADD_MEDS)
-    INVOKER.register(REMOVE_MEDS)
-    INVOKER.register(ADD_TEST_RESULTS)
 
+def menu():
     while True:
         option = input("""
         ----- Electronic Health Records System -----
@@ -39,10 +122,11 @@ def main():
         except ValueError:
             print("Please enter a number between 1 and 6.")
             continue
+        application = app()
 
         if option == 1:
-            id = input("Please input the patient's ID number: ")
-            patient = SYSTEM.get_patient(id)
+            id = input("Please input the patient's ID number or name: ")
+            patient = application.system.find_patient(id) or choose_patient(id)
 
             if patient:
                 view_edit_records(patient)
@@ -52,23 +136,31 @@ def main():
             name = input("Please input the patient's name: ")
             age = input("Please input the patient's age: ")
             phone_number = input("Please input the patient's telephone number: ")
-            patient = Patient(id, name, age, phone_number)
-            INVOKER.execute(ADD_PATIENT, patient)
+
+            from health_records_system import Patient
+            try:
+                patient = Patient(id, name, age, phone_number)
+            except ValueError:
+                print("The age must be a whole number. Please try again.")
+                continue
+
+            application.invoker.execute(application.commands["add_patient"], patient)
 
         elif option == 3:
             id = input("Please input the patient's ID number: ")
-            patient = SYSTEM.get_patient(id)
+            patient = application.system.get_patient(id)
 
             if patient:
-                INVOKER.execute(REMOVE_PATIENT, patient)
+                application.invoker.execute(application.commands["remove_patient"], patient)
 
         elif option == 4:
-            INVOKER.undo()
+            application.invoker.undo()
 
         elif option == 5:
-            INVOKER.redo()
+            application.invoker.redo()
 
         elif option == 6:
+            application.storage.close()
             print("Thank you for using the Electronic Health Records System!")
             exit(0)
 
@@ -76,7 +168,24 @@ def main():
             print("Please enter a number between 1 and 6.")
 
 
+def choose_patient(name):
+    """
+    Lets the user choose among the patients whose name starts with, or is most like, the given name
+    :return: the chosen patient, or None
+    """
+    search = app().search
+    matches = search.patients(name) or search.patients(name, fuzzy=True)
+    if not matches:
+        print(f"No patient has the ID number or a name like {name}.")
+        return None
+    for match in matches:
+        print(f"ID number: {match.id}, Name: {match.name}")
+    return app().system.get_patient(input("Please input the patient's ID number: "))
+
+
 def view_edit_records(patient):
+    from health_records_system import Medication
+    application = app()
     while True:
         option = input("""
         ----- View and Edit Patient Records -----
@@ -99,42 +208,31 @@ def view_edit_records(patient):
             continue
 
         if option == 1:
-            print(f"Name: {patient.name}")
-            print(f"Age: {patient.age}")
-            print(f"Phone number: {patient.phone_number}")
-            print(f"ID number: {patient.id}")
+            print(application.view_cache.get(patient.id, "summary"))
 
         elif option == 2:
-            if len(patient.medication) > 0:
-                for med_name, medication in patient.medication.items():
-                    print(f"Medication: {med_name}, Dosage: {medication.dosage}, Frequency: {medication.frequency}")
-            else:
-                print("This patient is not taking any medication.")
+            print(application.view_cache.get(patient.id, "medication"))
 
         elif option == 3:
             med_name = input("Please input the name of the medication: ")
             dosage = input("Please input the dosage: ")
             frequency = input("Please input the frequency of this dosage: ")
             med = Medication(med_name, dosage, frequency)
-            INVOKER.execute(ADD_MEDS, patient, med)
+            application.invoker.execute(application.commands["add_medication"], patient, med)
 
         elif option == 4:
             med_name = input("Please input the name of the medication: ")
             med = patient.get_medication(med_name)
 
             if med:
-                INVOKER.execute(REMOVE_MEDS, patient, med_name)
+                application.invoker.execute(application.commands["remove_medication"], patient, med)
 
         elif option == 5:
             view_option = input("To view all test results, type \"all\". "
                                 "Otherwise, specify the test name and date that it was performed in the format \"name DD/MM/YYYY\". ")
 
             if view_option == "all":
-                if len(patient.test_results) == 0:
-                    print("This patient has no test results to display.")
-                else:
-                    for (test_name, date), result in patient.test_results.items():
-                        print(f"Test: {test_name}, Date: {date}, Result: {result}\n")
+                print(application.view_cache.get(patient.id, "test_results"))
             else:
                 try:
                     test_name, date = view_option.split(" ")
@@ -148,13 +246,13 @@ def view_edit_records(patient):
             test_name = input("Please input the name of the test: ")
             date = input("Please input the date that the test was performed (DD/MM/YYYY): ")
             result = input("Please input the test result: ")
-            INVOKER.execute(ADD_TEST_RESULTS, patient, test_name, date, result)
+            application.invoker.execute(application.commands["add_test_results"], patient, test_name, date, result)
 
         elif option == 7:
-            INVOKER.undo()
+            application.invoker.undo()
 
         elif option == 8:
-            INVOKER.redo()
+            application.invoker.redo()
 
         elif option == 9:
             return
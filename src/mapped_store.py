@@ -0,0 +1,255 @@
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+
+try:
+    from health_records_system import Event, IObserver, Patient
+except ImportError:
+    from src.health_records_system import Event, IObserver, Patient
+
+# A store file starts with a header, followed by the JSON record of every patient on its own line and an index of
+# (hash of the patient's ID, offset of its record, length of its record) entries sorted by hash.
+_MAGIC = b"HRSMAP1\0"
+_HEADER = struct.Struct("<8sQQ")  # magic, number of patients, offset of the index
+_ENTRY = struct.Struct("<QQI")  # hash of the ID, offset of the record, length of the record
+
+
+def _id_hash(id):
+    """
+    :param id: ID number of a patient
+    :return: 64-bit hash of the ID that is the same in every process
+    """
+    return int.from_bytes(hashlib.blake2b(json.dumps(id).encode(), digest_size=8).digest(), "little")
+
+
+def encode_patient(patient):
+    """
+    :param patient: the Patient object
+    :return: the patient's record as stored in a store file
+    """
+    return json.dumps(patient.to_dict()).encode()
+
+
+def write_store(path, records):
+    """
+    Writes a store file
+    :param path: path of the file to write
+    :param records: iterable of (patient ID, encoded record) pairs, with records as returned by encode_patient
+    :return: the number of patients written
+    """
+    entries = []
+    with open(path, "wb") as store:
+        store.write(_HEADER.pack(_MAGIC, 0, 0))
+        offset = _HEADER.size
+        for id, record in records:
+            store.write(record)
+            store.write(b"\n")
+            entries.append((_id_hash(id), offset, len(record)))
+            offset += len(record) + 1
+
+        entries.sort()
+        store.write(b"".join(_ENTRY.pack(*entry) for entry in entries))
+        store.seek(0)
+        store.write(_HEADER.pack(_MAGIC, len(entries), offset))
+        store.flush()
+        os.fsync(store.fileno())
+    return len(entries)
+
+
+class MappedPatients(MutableMapping, IObserver):
+    """
+    Dictionary of ID:patient pairs backed by a memory-mapped store file.
+    Opening a store only maps the file, so it takes the same time whatever the number of patients. A patient is loaded
+    from the file when it is first looked up and kept in a cache of recently used patients. Patients that are added or
+    changed are kept in memory until the store is reloaded from a file that contains them.
+    Looking up, adding and removing patients is safe from several threads.
+    """
+
+    def __init__(self, path, system=None, cache_size=10000):
+        """
+        :param path: path of a file written by write_store
+        :param system: the Health Records System that loaded patients are stored in, if any
+        :param cache_size: maximum number of unchanged patients kept in memory
+        """
+        self._system = system
+        self._cache_size = cache_size
+        self._cache = OrderedDict()  # ID: unchanged patient loaded from the file, least recently used first
+        self._changed = {}  # ID: patient added or changed since the file was written
+        self._removed = set()  # IDs of patients in the file that have been removed
+        self._lock = threading.RLock()
+        self._file = None
+        self._map = None
+        self._map_file(path)
+
+    def _map_file(self, path):
+        store = open(path, "rb")
+        try:
+            data = mmap.mmap(store.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # an empty file cannot be mapped
+            store.close()
+            raise ValueError(f"{path} is not a patient store.")
+        magic, count, index_offset = _HEADER.unpack_from(data) if len(data) >= _HEADER.size else (None, 0, 0)
+        if magic != _MAGIC or index_offset + count * _ENTRY.size > len(data):
+            data.close()
+            store.close()
+            raise ValueError(f"{path} is not a patient store.")
+
+        self.close()
+        self._file, self._map = store, data
+        self._count, self._index_offset = count, index_offset
+        self._len = count
+
+    def reload(self, path):
+        """
+        Maps a new store file that contains every patient in the store, such as one written from records(). Changed
+        patients become ordinary cached patients.
+        :param path: path of the new file
+        """
+        with self._lock:
+            self._map_file(path)
+            self._cache.update(self._changed)
+            self._changed = {}
+            self._removed = set()
+            self._evict()
+
+    def close(self):
+        """
+        Unmaps the store file. Patients already loaded remain valid.
+        """
+        if self._map is not None:
+            self._map.close()
+            self._file.close()
+            self._map = self._file = None
+
+    def records(self):
+        """
+        Iterates over the records of every patient in the store, copying unchanged records straight from the file
+        :return: generator of (patient ID, encoded record) pairs
+        """
+        for id, start, end in self._file_records():
+            if id not in self._changed and id not in self._removed:
+                yield id, self._map[start:end]
+        for id, patient in self._changed.items():
+            yield id, encode_patient(patient)
+
+    def summaries(self):
+        """
+        Iterates over the fields used by the secondary indexes of the system without loading whole patients
+        :return: generator of (ID, name, phone number, age, list of medication names) tuples
+        """
+        for id, start, end in self._file_records():
+            if id not in self._changed and id not in self._removed:
+                record = json.loads(self._map[start:end])
+                yield id, record["name"], record["phone_number"], record["age"], \
+                    [med["name"] for med in record["medication"]]
+        for id, patient in self._changed.items():
+            yield id, patient.name, patient.phone_number, patient.age, list(patient.medication)
+
+    def update(self, event, patient, *args):
+        """
+        Keeps a patient whose record is about to change in memory, since the file holds its previous record
+        """
+        if event in (Event.PATIENT_ADDED, Event.PATIENT_REMOVED):
+            return  # patients are added and removed through the mapping itself
+        with self._lock:
+            if self._changed.get(patient.id) is not patient:
+                self._cache.pop(patient.id, None)
+                self._changed[patient.id] = patient
+
+    def __getitem__(self, id):
+        with self._lock:
+            patient = self._changed.get(id)
+            if patient is not None:
+                return patient
+            patient = self._cache.get(id)
+            if patient is not None:
+                self._cache.move_to_end(id)
+                return patient
+            if id in self._removed:
+                raise KeyError(id)
+
+            record = self._find(id)
+            if record is None:
+                raise KeyError(id)
+            patient = Patient.from_dict(record)
+            patient._system = self._system
+            self._cache[id] = patient
+            self._evict()
+            return patient
+
+    def __contains__(self, id):
+        with self._lock:
+            if id in self._changed or id in self._cache:
+                return True
+            return id not in self._removed and self._find(id) is not None
+
+    def __setitem__(self, id, patient):
+        with self._lock:
+            if id not in self:
+                self._len += 1
+            self._cache.pop(id, None)
+            self._changed[id] = patient
+
+    def __delitem__(self, id):
+        with self._lock:
+            if id not in self:
+                raise KeyError(id)
+            self._len -= 1
+            self._cache.pop(id, None)
+            self._changed.pop(id, None)
+            if self._find(id) is not None:
+                self._removed.add(id)
+
+    def __iter__(self):
+        for id, _, _ in self._file_records():
+            if id not in self._changed and id not in self._removed:
+                yield id
+        yield from list(self._changed)
+
+    def __len__(self):
+        return self._len
+
+    def _evict(self):
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _find(self, id):
+        """
+        Looks up a patient's record in the file by binary search of the index
+        :param id: ID number of the patient
+        :return: the patient's record as a dictionary, or None if the file does not contain it
+        """
+        key = _id_hash(id)
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _ENTRY.unpack_from(self._map, self._index_offset + mid * _ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        # IDs with the same hash are next to each other in the index
+        for i in range(lo, self._count):
+            entry_key, offset, length = _ENTRY.unpack_from(self._map, self._index_offset + i * _ENTRY.size)
+            if entry_key != key:
+                break
+            record = json.loads(self._map[offset:offset + length])
+            if record["id"] == id:
+                return record
+        return None
+
+    def _file_records(self):
+        """
+        Iterates over the records in the file in the order they were written
+        :return: generator of (patient ID, start offset, end offset) tuples
+        """
+        offset = _HEADER.size
+        while offset < self._index_offset:
+            end = self._map.find(b"\n", offset, self._index_offset)
+            yield json.loads(self._map[offset:end])["id"], offset, end
+            offset = end + 1
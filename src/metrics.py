@@ -0,0 +1,246 @@
+import bisect
+import collections
+import cProfile
+import http.server
+import io
+import os
+import pstats
+import threading
+import time
+import weakref
+
+# upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.1, 1.0)
+
+
+class Histogram(object):
+    """
+    Counts observed values in fixed buckets, in the manner of a Prometheus histogram
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        :param buckets: sorted upper bounds of the buckets; values above the last bound are only counted in the total
+        """
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # number of values in each bucket, not cumulative
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        :return: list of (upper bound, number of values up to the bound) pairs, ending with the bound float("inf")
+        """
+        pairs = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class SlowCommand(object):
+    """
+    Record of an Invoker operation that took at least the slow threshold of InvokerMetrics
+    """
+    __slots__ = ("operation", "command", "seconds", "profile")
+
+    def __init__(self, operation, command, seconds, profile):
+        """
+        :param operation: "execute", "undo" or "redo"
+        :param command: name of the command class
+        :param seconds: time the operation took
+        :param profile: pstats.Stats of the operation if it was profiled, otherwise None
+        """
+        self.operation = operation
+        self.command = command
+        self.seconds = seconds
+        self.profile = profile
+
+    def __repr__(self):
+        return f"SlowCommand({self.operation!r}, {self.command!r}, {self.seconds!r})"
+
+
+class InvokerMetrics(object):
+    """
+    Collects the number, latency and errors of the commands executed, undone and redone by Invokers, and the size of
+    their histories. Pass the same InvokerMetrics to an Invoker to enable them; its sessions share them.
+    Optionally profiles a sample of operations and keeps the profiles of those that turn out to be slow.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, slow_threshold=None, profile_every=0, on_slow=None, max_slow=100):
+        """
+        :param buckets: upper bounds of the latency histogram buckets, in seconds
+        :param slow_threshold: number of seconds from which an operation counts as slow, or None to not track them
+        :param profile_every: profile one in this many operations with cProfile, or 0 to profile none. Profiling
+                              slows the sampled operations down severalfold.
+        :param on_slow: function called with the SlowCommand of every slow operation, e.g. to log it
+        :param max_slow: number of the most recent slow operations kept
+        """
+        self._buckets = tuple(buckets)
+        self._slow_threshold = slow_threshold
+        self._profile_every = profile_every
+        self._on_slow = on_slow
+        self._latency = {}  # (operation, command class name): Histogram
+        self._errors = collections.Counter()  # (operation, command class name): number of operations that raised
+        self._slow_counts = collections.Counter()  # (operation, command class name): number of slow operations
+        self._slow = collections.deque(maxlen=max_slow)
+        self._operations = 0  # number of operations measured, for sampling
+        self._invokers = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    @property
+    def slow(self):
+        """
+        :return: list of the SlowCommand records of the most recent slow operations, oldest first
+        """
+        with self._lock:
+            return list(self._slow)
+
+    def track(self, invoker):
+        """
+        Includes the history of an Invoker in the metrics for as long as the Invoker exists
+        """
+        with self._lock:
+            self._invokers.add(invoker)
+
+    def measure(self, operation, command, function, *args, **kwargs):
+        """
+        Calls a command method and records its latency
+        :param operation: "execute", "undo" or "redo"
+        :param command: the command being called
+        :param function: the method of the command to call with args and kwargs
+        :return: the value returned by the method
+        """
+        profiler = None
+        if self._profile_every:
+            with self._lock:
+                self._operations += 1
+                if self._operations % self._profile_every == 0:
+                    profiler = cProfile.Profile()
+
+        failed = True
+        start = time.perf_counter()
+        try:
+            if profiler is None:
+                result = function(*args, **kwargs)
+            else:
+                result = profiler.runcall(function, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            self._record(operation, type(command).__name__, time.perf_counter() - start, failed, profiler)
+
+    def _record(self, operation, name, seconds, failed, profiler):
+        key = (operation, name)
+        slow = None
+        with self._lock:
+            histogram = self._latency.get(key)
+            if histogram is None:
+                histogram = self._latency[key] = Histogram(self._buckets)
+            histogram.observe(seconds)
+            if failed:
+                self._errors[key] += 1
+            if self._slow_threshold is not None and seconds >= self._slow_threshold:
+                self._slow_counts[key] += 1
+                profile = None
+                if profiler is not None:
+                    profile = pstats.Stats(profiler, stream=io.StringIO())
+                slow = SlowCommand(operation, name, seconds, profile)
+                self._slow.append(slow)
+        if slow is not None and self._on_slow is not None:
+            self._on_slow(slow)
+
+    def snapshot(self):
+        """
+        :return: dictionary of the current metrics, with the keys
+                 "commands": {(operation, command class name): {"count", "errors", "slow", "sum", "buckets"}}, where
+                             buckets is a list of (upper bound, cumulative count) pairs,
+                 "invokers": number of Invokers tracked,
+                 "history_depth": total number of commands in their histories,
+                 "history_bytes": approximate total number of bytes retained by their histories
+        """
+        with self._lock:
+            commands = {key: {"count": histogram.count, "errors": self._errors[key], "slow": self._slow_counts[key],
+                              "sum": histogram.sum, "buckets": histogram.cumulative()}
+                        for key, histogram in self._latency.items()}
+            invokers = list(self._invokers)
+        return {"commands": commands, "invokers": len(invokers),
+                "history_depth": sum(len(invoker.history) for invoker in invokers),
+                "history_bytes": sum(invoker.history_bytes for invoker in invokers)}
+
+    def to_prometheus(self, prefix="health_records"):
+        """
+        :param prefix: prefix of every metric name
+        :return: the current metrics in the Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        commands = sorted(snapshot["commands"].items())
+        lines = []
+
+        def family(name, kind, description):
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        family("command_seconds", "histogram", "Time taken to execute, undo or redo a command.")
+        for (operation, command), values in commands:
+            labels = f'operation="{operation}",command="{command}"'
+            for bound, count in values["buckets"]:
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}_command_seconds_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f"{prefix}_command_seconds_sum{{{labels}}} {values['sum']!r}")
+            lines.append(f"{prefix}_command_seconds_count{{{labels}}} {values['count']}")
+        for name, key, description in (("commands_total", "count", "Commands executed, undone or redone."),
+                                       ("command_errors_total", "errors", "Commands that raised an exception."),
+                                       ("slow_commands_total", "slow", "Commands that took at least the slow "
+                                                                      "threshold.")):
+            family(name, "counter", description)
+            for (operation, command), values in commands:
+                lines.append(f'{prefix}_{name}{{operation="{operation}",command="{command}"}} {values[key]}')
+        for name, key, description in (("invokers", "invokers", "Invokers whose histories are tracked."),
+                                       ("history_depth", "history_depth", "Commands in the undo histories."),
+                                       ("history_bytes", "history_bytes", "Approximate bytes retained by the undo "
+                                                                          "histories.")):
+            family(name, "gauge", description)
+            lines.append(f"{prefix}_{name} {snapshot[key]}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, prefix="health_records"):
+        """
+        Writes the current metrics to a file in the Prometheus text format, replacing it atomically so that a reader
+        such as the node exporter's textfile collector never sees a partial file
+        :param path: path of the file
+        """
+        temp_path = path + ".tmp"
+        with open(temp_path, "w") as output:
+            output.write(self.to_prometheus(prefix))
+        os.replace(temp_path, path)
+
+    def serve(self, host="127.0.0.1", port=9100, prefix="health_records"):
+        """
+        Serves the current metrics in the Prometheus text format over HTTP from a background thread
+        :param port: port to listen on, or 0 for any free port
+        :return: the http.server.HTTPServer, whose server_address holds the address and whose shutdown() stops it
+        """
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.to_prometheus(prefix).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
@@ -0,0 +1,368 @@
+"""
+Read replicas of the patients in a Health Records System, published in shared memory for reporting and dashboard
+processes to read without copying every patient into each of them.
+
+A ReplicaPublisher writes a point-in-time snapshot of every patient's record, with their medication and test results,
+into a new shared memory segment in a compact binary layout, and then bumps the version in a small control segment.
+Published segments are never changed. A ReplicaReader in any process maps the current segment read-only and decodes
+only the records it looks up, so its own memory stays near zero whatever the number of patients, and moves to the
+newest segment when refreshed.
+
+Shared memory segments require Python 3.8 or later.
+"""
+import mmap
+import os
+import struct
+import threading
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+try:
+    import _posixshmem
+except ImportError:
+    _posixshmem = None
+
+try:
+    from health_records_system import IObserver, Medication, Patient
+    from mapped_store import _ENTRY, _id_hash
+except ImportError:
+    from src.health_records_system import IObserver, Medication, Patient
+    from src.mapped_store import _ENTRY, _id_hash
+
+# The control segment holds the version of the current snapshot and the name of its segment, guarded by a sequence
+# number that is odd while they are being changed. A snapshot segment starts with a header, followed by the binary
+# record of every patient and an index of (hash of the patient's ID, offset of its record, length of its record)
+# entries sorted by hash, like a MappedPatients store file.
+_CONTROL_MAGIC = b"HRSCTL1\0"
+_CONTROL = struct.Struct("<8sQQ64s")  # magic, sequence number, version, name of the snapshot segment
+_SEQUENCE = struct.Struct("<Q")
+_MAGIC = b"HRSREP1\0"
+_HEADER = struct.Struct("<8sQQQ")  # magic, version, number of patients, offset of the index
+_COUNT = struct.Struct("<I")
+# a value is a type code followed by the value, or by its length and UTF-8 bytes for a string
+_NONE = b"n"
+_INT = struct.Struct("<cq")
+_FLOAT = struct.Struct("<cd")
+_STRING = struct.Struct("<cI")
+
+
+def _encode_value(value, out):
+    if value is None:
+        out += _NONE
+    elif isinstance(value, str):
+        data = value.encode()
+        out += _STRING.pack(b"s", len(data))
+        out += data
+    elif isinstance(value, int) and not isinstance(value, bool):
+        out += _INT.pack(b"i", value)
+    elif isinstance(value, float):
+        out += _FLOAT.pack(b"f", value)
+    else:
+        raise TypeError(f"{value!r} cannot be published to a replica.")
+
+
+def _decode_value(buffer, offset):
+    """
+    :return: (value, offset after it) of the value at an offset of a buffer
+    """
+    code = buffer[offset:offset + 1]
+    if code == _NONE:
+        return None, offset + 1
+    if code == b"s":
+        _, length = _STRING.unpack_from(buffer, offset)
+        start = offset + _STRING.size
+        return str(buffer[start:start + length], "utf-8"), start + length
+    if code == b"i":
+        return _INT.unpack_from(buffer, offset)[1], offset + _INT.size
+    return _FLOAT.unpack_from(buffer, offset)[1], offset + _FLOAT.size
+
+
+def encode_record(patient):
+    """
+    :param patient: the Patient object
+    :return: the patient's record in the binary layout of a replica
+    """
+    out = bytearray()
+    for value in (patient.id, patient.name, patient.age, patient.phone_number):
+        _encode_value(value, out)
+    out += _COUNT.pack(len(patient.medication))
+    for med in patient.medication.values():
+        for value in (med.name, med.dosage, med.frequency):
+            _encode_value(value, out)
+    out += _COUNT.pack(len(patient.test_results))
+    for (name, date), result in patient.test_results.items():
+        for value in (name, date, result):
+            _encode_value(value, out)
+    return out
+
+
+def decode_record(buffer, offset=0):
+    """
+    :param buffer: buffer holding a record written by encode_record
+    :param offset: offset of the record in the buffer
+    :return: a new Patient object with the record
+    """
+    values = []
+    for _ in range(4):
+        value, offset = _decode_value(buffer, offset)
+        values.append(value)
+    patient = Patient(*values)
+    count, = _COUNT.unpack_from(buffer, offset)
+    offset += _COUNT.size
+    for _ in range(count):
+        name, offset = _decode_value(buffer, offset)
+        dosage, offset = _decode_value(buffer, offset)
+        frequency, offset = _decode_value(buffer, offset)
+        patient.insert_medication(Medication(name, dosage, frequency))
+    count, = _COUNT.unpack_from(buffer, offset)
+    offset += _COUNT.size
+    results = []
+    for _ in range(count):
+        name, offset = _decode_value(buffer, offset)
+        date, offset = _decode_value(buffer, offset)
+        result, offset = _decode_value(buffer, offset)
+        results.append((name, date, result))
+    patient.add_test_results_bulk(results)
+    return patient
+
+
+def _attach(name):
+    """
+    Maps an existing shared memory segment read-only. On POSIX systems the segment is opened directly rather than
+    through SharedMemory, which before Python 3.13 registers it to be unlinked as soon as the reader exits.
+    :param name: name of the segment
+    :return: (buffer, function closing the mapping) pair
+    :raises FileNotFoundError: if the segment does not exist
+    """
+    if _posixshmem is None:
+        memory = shared_memory.SharedMemory(name)
+        return memory.buf, memory.close
+    fd = _posixshmem.shm_open("/" + name, os.O_RDONLY, mode=0o600)
+    try:
+        mapped = mmap.mmap(fd, os.fstat(fd).st_size, prot=mmap.PROT_READ)
+    finally:
+        os.close(fd)
+    return memoryview(mapped), mapped.close
+
+
+class ReplicaPublisher(IObserver):
+    """
+    Publishes snapshots of the patients in a Health Records System to shared memory, under a name that ReplicaReaders
+    attach to. The publisher observes the system, so publishing is skipped while nothing has changed. Snapshots are
+    removed when the publisher is closed or its process exits, but readers that have mapped one can keep reading it.
+    """
+
+    def __init__(self, system, name="health_records"):
+        """
+        :param system: the Health Records System
+        :param name: name of the replica, which must not be in use by another publisher
+        :raises ImportError: if shared memory segments are not supported
+        :raises FileExistsError: if the name is in use
+        """
+        if shared_memory is None:
+            raise ImportError("Shared memory replicas require Python 3.8 or later.")
+        self._system = system
+        self._name = name
+        self._lock = threading.Lock()  # one snapshot is published at a time
+        self._control = shared_memory.SharedMemory(name, create=True, size=_CONTROL.size)
+        _CONTROL.pack_into(self._control.buf, 0, _CONTROL_MAGIC, 0, 0, b"")
+        self._segment = None  # shared memory of the current snapshot
+        self._version = 0
+        self._changed = True  # whether the system has changed since the current snapshot was taken
+        system.attach(self)
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def version(self):
+        """
+        :return: version of the current snapshot, which counts up from 1, or 0 before the first is published
+        """
+        return self._version
+
+    def update(self, event, patient, *args):
+        self._changed = True
+
+    def publish(self):
+        """
+        Publishes a snapshot of every patient in the system, unless nothing has changed since the last one
+        :return: version of the current snapshot
+        """
+        with self._lock:
+            if not self._changed:
+                return self._version
+            self._changed = False  # changes made while the snapshot is written are published by the next one
+            version = self._version + 1
+            with self._system.snapshot() as snapshot:
+                data = self._encode(snapshot.patients(), version)
+            segment_name = f"{self._name}_{version}"
+            segment = shared_memory.SharedMemory(segment_name, create=True, size=len(data))
+            segment.buf[:len(data)] = data
+
+            buffer = self._control.buf
+            sequence = _SEQUENCE.unpack_from(buffer, 8)[0] + 1
+            _SEQUENCE.pack_into(buffer, 8, sequence)  # odd: readers wait until the change is complete
+            _CONTROL.pack_into(buffer, 0, _CONTROL_MAGIC, sequence, version, segment_name.encode())
+            _SEQUENCE.pack_into(buffer, 8, sequence + 1)
+
+            if self._segment is not None:
+                self._segment.close()
+                self._segment.unlink()
+            self._segment = segment
+            self._version = version
+            return version
+
+    def close(self):
+        """
+        Stops observing the system and removes the replica
+        """
+        self._system.detach(self)
+        with self._lock:
+            for memory in (self._segment, self._control):
+                if memory is not None:
+                    memory.close()
+                    memory.unlink()
+            self._segment = self._control = None
+
+    @staticmethod
+    def _encode(patients, version):
+        """
+        :return: the snapshot segment of the patients, as bytes
+        """
+        data = bytearray(_HEADER.size)
+        entries = []
+        for patient in patients:
+            record = encode_record(patient)
+            entries.append((_id_hash(patient.id), len(data), len(record)))
+            data += record
+        entries.sort()
+        index_offset = len(data)
+        data += b"".join(_ENTRY.pack(*entry) for entry in entries)
+        _HEADER.pack_into(data, 0, _MAGIC, version, len(entries), index_offset)
+        return data
+
+
+class ReplicaReader(object):
+    """
+    Read-only view of the patients in the latest snapshot published under a name, from any process. Lookups decode
+    the patient's record straight from shared memory, and keep reading the same snapshot until refresh() is called.
+    Patients returned are new objects, which are not part of any system.
+    """
+
+    def __init__(self, name="health_records"):
+        """
+        :param name: name of the replica given to the ReplicaPublisher
+        :raises FileNotFoundError: if there is no replica with the name
+        :raises LookupError: if no snapshot has been published yet
+        """
+        self._control, self._close_control = _attach(name)
+        self._buffer = None
+        self._close_buffer = None
+        self._version = 0
+        if not self.refresh():
+            self.close()
+            raise LookupError(f"No snapshot of replica {name} has been published yet.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def version(self):
+        """
+        :return: version of the snapshot being read
+        """
+        return self._version
+
+    def refresh(self):
+        """
+        Moves to the latest snapshot, if a newer one has been published
+        :return: True if the reader moved to a newer snapshot, otherwise False
+        """
+        while True:
+            magic, sequence, version, segment_name = _CONTROL.unpack_from(self._control)
+            if magic != _CONTROL_MAGIC:
+                raise ValueError("The shared memory segment is not a replica.")
+            if sequence % 2 or _SEQUENCE.unpack_from(self._control, 8)[0] != sequence:
+                continue  # the publisher is changing the control segment
+            if version <= self._version:
+                return False
+            try:
+                buffer, close = _attach(segment_name.rstrip(b"\0").decode())
+            except FileNotFoundError:
+                continue  # the snapshot was replaced by a newer one after the control segment was read
+            self._release_snapshot()
+            self._buffer, self._close_buffer = buffer, close
+            _, self._version, self._count, self._index_offset = _HEADER.unpack_from(buffer)
+            return True
+
+    def close(self):
+        """
+        Unmaps the replica. Patients already read remain valid.
+        """
+        self._release_snapshot()
+        if self._control is not None:
+            self._control.release()
+            self._close_control()
+            self._control = None
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, id):
+        return self._find(id) is not None
+
+    def find_patient(self, id):
+        """
+        Retrieves a patient by their ID number.
+        :param id: unique number given to patient upon creation
+        :return: new Patient object with the patient's record if it is in the snapshot, otherwise returns None
+        """
+        offset = self._find(id)
+        return None if offset is None else decode_record(self._buffer, offset)
+
+    def patients(self):
+        """
+        Iterates over every patient in the snapshot, decoding each in turn
+        :return: generator of new Patient objects
+        """
+        buffer, count, index_offset = self._buffer, self._count, self._index_offset
+        for i in range(count):
+            _, offset, _ = _ENTRY.unpack_from(buffer, index_offset + i * _ENTRY.size)
+            yield decode_record(buffer, offset)
+
+    def _find(self, id):
+        """
+        Looks up a patient's record by binary search of the index
+        :return: offset of the patient's record, or None if the snapshot does not contain it
+        """
+        buffer = self._buffer
+        key = _id_hash(id)
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if _ENTRY.unpack_from(buffer, self._index_offset + mid * _ENTRY.size)[0] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        # IDs with the same hash are next to each other in the index
+        for i in range(lo, self._count):
+            entry_key, offset, _ = _ENTRY.unpack_from(buffer, self._index_offset + i * _ENTRY.size)
+            if entry_key != key:
+                break
+            if _decode_value(buffer, offset)[0] == id:
+                return offset
+        return None
+
+    def _release_snapshot(self):
+        if self._buffer is not None:
+            self._buffer.release()
+            self._close_buffer()
+            self._buffer = self._close_buffer = None
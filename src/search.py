@@ -0,0 +1,234 @@
+"""
+Typeahead search over patient names and medication names: prefix matches of the words typed so far, and fuzzy matches
+that tolerate typos, both ranked and limited to the top k.
+"""
+import heapq
+import threading
+
+try:
+    from health_records_system import Event, IObserver
+    from indexes import HashIndex, SortedIndex
+except ImportError:
+    from src.health_records_system import Event, IObserver
+    from src.indexes import HashIndex, SortedIndex
+
+MIN_SIMILARITY = 0.3  # smallest trigram similarity of a fuzzy match
+_LAST_CHARACTER = "\U0010ffff"  # compares greater than any character a word can continue with
+
+
+def _words(text):
+    """
+    :return: set of the case-insensitive words of a text
+    """
+    return set(str(text).casefold().split())
+
+
+def _trigrams(word):
+    """
+    :return: set of the three-character sequences of a word, padded so that its start and end count as well
+    """
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _prefixes_all(prefixes, text):
+    """
+    :return: whether every prefix starts a word of the text, which is False if the text is None
+    """
+    if text is None:
+        return False
+    words = _words(text)
+    return all(any(word.startswith(prefix) for word in words) for prefix in prefixes)
+
+
+class TextIndex(object):
+    """
+    Maps the words of text values to the items that have them, and searches them by prefix and by similarity
+    """
+
+    def __init__(self, text_of=None):
+        """
+        :param text_of: function returning the current text of an item, which lets queries of several words check the
+                        other words against the text of each item found by one of them, rather than finding all the
+                        items of every word. Without it, texts are not looked up.
+        """
+        self._words = SortedIndex()  # word: items with the word, with the words kept sorted for prefix ranges
+        self._trigrams = HashIndex()  # trigram: words containing it
+        self._text_of = text_of
+
+    def add(self, text, item):
+        """
+        Records that an item has the words of a text
+        :param text: the indexed text
+        :param item: hashable item returned by searches
+        """
+        for word in _words(text):
+            if not self._words.get(word):
+                for trigram in _trigrams(word):
+                    self._trigrams.add(trigram, word)
+            self._words.add(word, item)
+
+    def remove(self, text, item):
+        """
+        Removes the record that an item has the words of a text, if it exists
+        :param text: the indexed text
+        :param item: the item given when the text was added
+        """
+        for word in _words(text):
+            self._words.remove(word, item)
+            if not self._words.get(word):
+                for trigram in _trigrams(word):
+                    self._trigrams.remove(trigram, word)
+
+    def prefix(self, query, k=10):
+        """
+        Finds the items with a word starting with each word of the query, e.g. "ja do" matches "Jane Doe"
+        :param query: the text typed so far
+        :param k: maximum number of items returned
+        :return: list of the items, in order of the matching words of the query's longest word
+        """
+        words = sorted(_words(query), key=len, reverse=True)
+        if not words:
+            return []
+        # the longest word of the query usually matches the fewest words, so it drives the search and the others
+        # only filter its items
+        if self._text_of is None:
+            others = [self._prefixed(word) for word in words[1:]]
+            matches = lambda item: all(item in items for items in others)
+        else:
+            matches = lambda item: _prefixes_all(words[1:], self._text_of(item))
+        found = []
+        seen = set()
+        for item in self._words.range(words[0], words[0] + _LAST_CHARACTER):
+            if item not in seen and matches(item):
+                seen.add(item)
+                found.append(item)
+                if len(found) == k:
+                    break
+        return found
+
+    def fuzzy(self, query, k=10):
+        """
+        Finds the items with the words most similar to the query, by the share of trigrams they have in common, which
+        tolerates typos
+        :param query: a word, possibly misspelled
+        :param k: maximum number of items returned
+        :return: list of the items, most similar first
+        """
+        words = _words(query)
+        if not words:
+            return []
+        trigrams = _trigrams(max(words, key=len))
+        shared = {}  # word: number of trigrams it has in common with the query
+        for trigram in trigrams:
+            for word in self._trigrams.get(trigram):
+                shared[word] = shared.get(word, 0) + 1
+
+        scored = ((2 * count / (len(trigrams) + len(_trigrams(word))), word) for word, count in shared.items())
+        found = []
+        seen = set()
+        for similarity, word in heapq.nlargest(k, (entry for entry in scored if entry[0] >= MIN_SIMILARITY)):
+            for item in heapq.nsmallest(k, self._words.get(word), key=str):
+                if item not in seen:
+                    seen.add(item)
+                    found.append(item)
+                    if len(found) == k:
+                        return found
+        return found
+
+    def _prefixed(self, prefix):
+        """
+        :return: set of the items with a word starting with the prefix
+        """
+        return set(self._words.range(prefix, prefix + _LAST_CHARACTER))
+
+
+class SearchIndex(IObserver):
+    """
+    Search over the names of the patients in a Health Records System and the names of the medication they take, kept
+    up to date with every change to the system, including undone commands
+    """
+
+    def __init__(self, system):
+        """
+        Indexes the patients in the system and observes it for changes
+        :param system: the Health Records System
+        """
+        self._system = system
+        self._names = TextIndex(self._name)  # items are patient IDs
+        self._medication = TextIndex()  # items are medication names
+        self._medication_counts = {}  # medication name: number of patients taking it
+        self._lock = threading.RLock()  # guards the indexes
+        with system.exclusive():
+            for patient in system.patients():
+                self._add_patient(patient)
+            system.attach(self)
+
+    def close(self):
+        """
+        Stops observing the system
+        """
+        self._system.detach(self)
+
+    def update(self, event, patient, *args):
+        with self._lock:
+            if event == Event.PATIENT_ADDED:
+                self._add_patient(patient)
+            elif event == Event.PATIENT_REMOVED:
+                self._names.remove(patient.name, patient.id)
+                for med_name in patient.medication:
+                    self._remove_medication(med_name)
+            elif event == Event.MEDICATION_SET:
+                if args[0].name not in patient.medication:
+                    self._add_medication(args[0].name)
+            elif event == Event.MEDICATION_REMOVED:
+                self._remove_medication(args[0])
+            elif event == Event.MEDICATION_CLEARED:
+                for med_name in patient.medication:
+                    self._remove_medication(med_name)
+
+    def patients(self, query, k=10, fuzzy=False):
+        """
+        Finds patients by name, for typeahead
+        :param query: the start of each word of the name typed so far, or a possibly misspelled word of it if fuzzy
+        :param k: maximum number of patients returned
+        :param fuzzy: whether to find the names most similar to the query rather than those starting with it
+        :return: list of the Patient objects
+        """
+        with self._lock:
+            ids = self._names.fuzzy(query, k) if fuzzy else self._names.prefix(query, k)
+        return [patient for patient in map(self._system.find_patient, ids) if patient is not None]
+
+    def medication(self, query, k=10, fuzzy=False):
+        """
+        Finds the names of the medication taken by any patient, for typeahead
+        :param query: the start of each word of the name typed so far, or a possibly misspelled word of it if fuzzy
+        :param k: maximum number of names returned
+        :param fuzzy: whether to find the names most similar to the query rather than those starting with it
+        :return: list of the medication names
+        """
+        with self._lock:
+            return self._medication.fuzzy(query, k) if fuzzy else self._medication.prefix(query, k)
+
+    def _name(self, id):
+        patient = self._system.find_patient(id)
+        return None if patient is None else patient.name
+
+    def _add_patient(self, patient):
+        self._names.add(patient.name, patient.id)
+        for med_name in patient.medication:
+            self._add_medication(med_name)
+
+    def _add_medication(self, med_name):
+        count = self._medication_counts.get(med_name, 0)
+        if not count:
+            self._medication.add(med_name, med_name)
+        self._medication_counts[med_name] = count + 1
+
+    def _remove_medication(self, med_name):
+        count = self._medication_counts.get(med_name, 0)
+        if count == 1:
+            del self._medication_counts[med_name]
+            self._medication.remove(med_name, med_name)
+        elif count:
+            self._medication_counts[med_name] = count - 1
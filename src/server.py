@@ -0,0 +1,251 @@
+"""
+Serves the Health Records System to many clients at once over a local socket.
+
+Clients send one JSON request per line and receive one JSON response per line, in the same order. Every request has an
+"op" field naming the operation; the other fields depend on the operation:
+
+    get_patient         id
+    add_patient         patient (as produced by Patient.to_dict, without medication or test results), on_conflict
+    remove_patient      id
+    add_medication      id, medication (name, dosage and frequency), on_conflict
+    remove_medication   id, name
+    add_test_results    id, name, date, result, on_conflict
+    undo, redo
+
+on_conflict is one of the ConflictPolicy values and defaults to "error". Responses have the form {"ok": true,
+"result": ...} or {"ok": false, "error": "..."}. Changes are made through commands, and each connection has its own
+undo and redo history.
+
+Run from the src directory with: python3 server.py [--host HOST] [--port PORT | --unix PATH] [--data DIRECTORY]
+                                                  [--metrics-port PORT]
+"""
+import argparse
+import asyncio
+import json
+import resource
+
+try:
+    from command import *
+    from health_records_system import *
+    from metrics import InvokerMetrics
+    from storage import Storage
+    from views import ViewCache
+except ImportError:
+    from src.command import *
+    from src.health_records_system import *
+    from src.metrics import InvokerMetrics
+    from src.storage import Storage
+    from src.views import ViewCache
+
+MAX_LINE = 1 << 20  # longest request accepted, in bytes
+
+
+class RequestError(Exception):
+    """
+    Raised when a request cannot be carried out, with a message for the client
+    """
+
+
+class Server(object):
+    """
+    Line-delimited JSON front end to the Health Records System, serving every connection from one asyncio event loop
+    """
+
+    def __init__(self, system, max_history=100, metrics=None, view_cache_size=10000):
+        """
+        :param system: the Health Records System to serve
+        :param max_history: maximum number of commands each connection can undo
+        :param metrics: InvokerMetrics recording the commands of every connection, or None
+        :param view_cache_size: number of patient records kept ready to be served
+        """
+        self._system = system
+        self.views = ViewCache(system, view_cache_size)
+        self._invoker = Invoker(max_history=max_history, verbose=False, metrics=metrics)
+        self._commands = {}  # (command class, ConflictPolicy value): command applying the policy without console I/O
+        for command_class in (AddPatientCommand, RemovePatientCommand, AddMedicationCommand, RemoveMedicationCommand,
+                              AddTestResultsCommand):
+            for policy in (ConflictPolicy.OVERWRITE, ConflictPolicy.SKIP, ConflictPolicy.ERROR):
+                command = command_class(system, policy)
+                self._commands[(command_class, policy)] = command
+                self._invoker.register(command)
+        self._operations = {
+            "get_patient": self._get_patient,
+            "add_patient": self._add_patient,
+            "remove_patient": self._remove_patient,
+            "add_medication": self._add_medication,
+            "remove_medication": self._remove_medication,
+            "add_test_results": self._add_test_results,
+            "undo": lambda session, request: session.undo(),
+            "redo": lambda session, request: session.redo(),
+        }
+        self._server = None
+        self.connections = 0  # number of open connections
+
+    async def start_tcp(self, host="127.0.0.1", port=0):
+        """
+        Starts accepting connections on a TCP socket
+        :param port: port to listen on, or 0 for any free port
+        :return: the (host, port) address the server is listening on
+        """
+        self._server = await asyncio.start_server(self._serve, host, port, limit=MAX_LINE, backlog=4096)
+        return self._server.sockets[0].getsockname()[:2]
+
+    async def start_unix(self, path):
+        """
+        Starts accepting connections on a Unix domain socket
+        :param path: path of the socket file
+        """
+        self._server = await asyncio.start_unix_server(self._serve, path, limit=MAX_LINE, backlog=4096)
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def close(self):
+        """
+        Stops accepting connections
+        """
+        self._server.close()
+        await self._server.wait_closed()
+
+    def handle(self, session, request):
+        """
+        Carries out one request
+        :param session: the Invoker of the connection making the request
+        :param request: the decoded request
+        :return: the response
+        """
+        try:
+            if not isinstance(request, dict):
+                raise RequestError("The request must be a JSON object.")
+            operation = self._operations.get(request.get("op"))
+            if operation is None:
+                raise RequestError(f"Unknown operation: {request.get('op')}")
+            return {"ok": True, "result": operation(session, request)}
+        except (RequestError, RecordConflictError) as error:
+            return {"ok": False, "error": str(error)}
+        except (KeyError, TypeError, ValueError) as error:
+            return {"ok": False, "error": f"Invalid request: {error!r}"}
+
+    async def _serve(self, reader, writer):
+        session = self._invoker.session()
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:  # the line is longer than the limit
+                    writer.write(b'{"ok": false, "error": "The request is too long."}\n')
+                    break
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    response = {"ok": False, "error": "The request is not valid JSON."}
+                else:
+                    response = self.handle(session, request)
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def _command(self, command_class, request):
+        policy = request.get("on_conflict", ConflictPolicy.ERROR)
+        command = self._commands.get((command_class, policy))
+        if command is None:
+            raise RequestError(f"Unknown conflict policy: {policy}")
+        return command
+
+    def _patient(self, request):
+        patient = self._system.find_patient(request["id"])
+        if patient is None:
+            raise RequestError(f"Patient #{request['id']} does not exist in the system.")
+        return patient
+
+    def _get_patient(self, session, request):
+        record = self.views.get(request["id"], "record")
+        if record is None:
+            raise RequestError(f"Patient #{request['id']} does not exist in the system.")
+        return record
+
+    def _add_patient(self, session, request):
+        record = request["patient"]
+        patient = Patient(record["id"], record["name"], record["age"], record["phone_number"])
+        session.execute(self._command(AddPatientCommand, request), patient)
+
+    def _remove_patient(self, session, request):
+        session.execute(self._commands[(RemovePatientCommand, ConflictPolicy.ERROR)], self._patient(request))
+
+    def _add_medication(self, session, request):
+        med = Medication.from_dict(request["medication"])
+        session.execute(self._command(AddMedicationCommand, request), self._patient(request), med)
+
+    def _remove_medication(self, session, request):
+        patient = self._patient(request)
+        med = patient.medication.get(request["name"])
+        if med is None:
+            raise RequestError(f"{request['name']} does not exist in the patient's record.")
+        session.execute(self._commands[(RemoveMedicationCommand, ConflictPolicy.ERROR)], patient, med)
+
+    def _add_test_results(self, session, request):
+        session.execute(self._command(AddTestResultsCommand, request), self._patient(request), request["name"],
+                        request["date"], request["result"])
+
+
+def raise_open_file_limit():
+    """
+    Raises the number of files the process may have open to the hard limit, since every connection uses one
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+async def _run(args):
+    system = HealthRecordsSystem.get_instance()
+    storage = None
+    if args.data is not None:
+        storage = Storage(args.data, sync_interval=0.01, sync_every=100)
+        storage.open(system)
+
+    metrics = None
+    if args.metrics_port is not None:
+        metrics = InvokerMetrics(slow_threshold=0.01)
+        metrics_server = metrics.serve(args.host, args.metrics_port)
+        print(f"Serving metrics on {args.host}:{metrics_server.server_address[1]}", flush=True)
+
+    server = Server(system, metrics=metrics)
+    if args.unix is not None:
+        await server.start_unix(args.unix)
+        print(f"Listening on {args.unix}", flush=True)
+    else:
+        host, port = await server.start_tcp(args.host, args.port)
+        print(f"Listening on {host}:{port}", flush=True)
+    try:
+        await server.serve_forever()
+    finally:
+        if storage is not None:
+            storage.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves the Health Records System over a local socket.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port, or 0 for any free port")
+    parser.add_argument("--unix", help="path of a Unix domain socket to listen on instead of TCP")
+    parser.add_argument("--data", help="directory to store patient records in, kept in memory only if not given")
+    parser.add_argument("--metrics-port", type=int, help="port to serve Prometheus metrics of the commands on")
+    args = parser.parse_args()
+
+    raise_open_file_limit()
+    try:
+        asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
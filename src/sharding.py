@@ -0,0 +1,390 @@
+"""
+Sharded Health Records System, which partitions patients by a hash of their ID across several worker processes.
+
+Each worker holds its own HealthRecordsSystem with the patients of its shard, so reads and changes to patients of
+different shards run on separate cores rather than in one process behind one global interpreter lock. A ShardedSystem
+routes every request to the worker owning the patient over a pipe. Patients it returns are copies, so records are
+changed by executing commands, which run in the owning worker and are undone and redone there. Requests for many
+patients are sent to every worker involved before any reply is awaited, so the workers serve them in parallel.
+"""
+import multiprocessing
+import os
+import threading
+import zlib
+
+try:
+    from command import (AddMedicationCommand, AddPatientCommand, AddTestResultsCommand, Invoker,
+                         RemoveMedicationCommand, RemovePatientCommand)
+    from health_records_system import ConflictPolicy, HealthRecordsSystem, Patient, RecordConflictError
+    from storage import Storage
+except ImportError:
+    from src.command import (AddMedicationCommand, AddPatientCommand, AddTestResultsCommand, Invoker,
+                             RemoveMedicationCommand, RemovePatientCommand)
+    from src.health_records_system import ConflictPolicy, HealthRecordsSystem, Patient, RecordConflictError
+    from src.storage import Storage
+
+_COMMANDS = {cls.__name__: cls for cls in (AddPatientCommand, RemovePatientCommand, AddMedicationCommand,
+                                           RemoveMedicationCommand, AddTestResultsCommand)}
+
+
+def shard_of(id, shards):
+    """
+    :param id: ID number of a patient
+    :param shards: number of shards
+    :return: number of the shard owning the patient, which unlike hash() is the same in every process
+    """
+    return zlib.crc32(str(id).encode()) % shards
+
+
+class _Shard(object):
+    """
+    The patients of one shard and the history of the commands executed on them, held by a worker process
+    """
+
+    def __init__(self, directory, max_history):
+        HealthRecordsSystem._reset()  # a forked worker starts with a copy of its parent's system
+        self._system = HealthRecordsSystem()
+        self._storage = None
+        if directory is not None:
+            self._storage = Storage(directory)
+            self._storage.open(self._system)
+        self._invoker = Invoker(max_history=max_history, verbose=False)
+        self._commands = {}  # (command class name, conflict policy): registered command
+
+    def close(self):
+        if self._storage is not None:
+            self._storage.close()
+
+    def count(self):
+        return len(self._system._patients)
+
+    def patients(self):
+        return list(self._system.patients())
+
+    def find_patient(self, id):
+        return self._system.find_patient(id)
+
+    def insert_patient(self, patient, on_conflict):
+        return self._system.insert_patient(patient, on_conflict)
+
+    def delete_patient(self, id):
+        return self._system.delete_patient(id)
+
+    def execute(self, name, on_conflict, args):
+        command = self._commands.get((name, on_conflict))
+        if command is None:
+            command = self._commands[(name, on_conflict)] = _COMMANDS[name](self._system, on_conflict)
+            self._invoker.register(command)
+        if name != AddPatientCommand.__name__:
+            # patients other than new ones are sent by ID, and resolved to the patient held by this shard
+            patient = self._system.find_patient(args[0])
+            if patient is None:
+                raise LookupError(f"Patient #{args[0]} does not exist in the system.")
+            args = (patient,) + tuple(args[1:])
+        self._invoker.execute(command, *args)
+
+    def undo(self):
+        return self._invoker.undo()
+
+    def redo(self):
+        return self._invoker.redo()
+
+
+def _serve(connection, directory, max_history):
+    """
+    Runs a worker process: receives lists of (method, args) requests for its _Shard, and replies to each list with a
+    list of (True, result) or (False, exception) pairs, until it receives None
+    """
+    shard = _Shard(directory, max_history)
+    try:
+        while True:
+            requests = connection.recv()
+            if requests is None:
+                break
+            replies = []
+            for method, args in requests:
+                try:
+                    replies.append((True, getattr(shard, method)(*args)))
+                except Exception as error:
+                    replies.append((False, error))
+            connection.send(replies)
+    finally:
+        shard.close()
+        connection.close()
+
+
+def _patient_id(arg):
+    return arg.id if isinstance(arg, Patient) else arg
+
+
+class ShardedSystem(object):
+    """
+    Router to the patients of a Health Records System split across worker processes, with the lookups and changes of
+    HealthRecordsSystem and the command execution, undo and redo of an Invoker.
+    A ShardedSystem can be shared between threads: requests to different shards are carried out in parallel, and
+    commands are executed one at a time, as by an Invoker.
+    """
+
+    def __init__(self, shards=None, directory=None, max_history=100):
+        """
+        Starts the worker processes
+        :param shards: number of worker processes, one per core if None
+        :param directory: directory in which each shard keeps its patients between runs, in a subdirectory of its own
+                          opened by a Storage, or None to keep them in memory only
+        :param max_history: maximum number of commands that can be undone, unlimited if None
+        """
+        shards = shards or os.cpu_count() or 1
+        self._connections = []
+        self._workers = []
+        self._locks = [threading.Lock() for _ in range(shards)]  # one request and its reply at a time per pipe
+        for number in range(shards):
+            parent_end, child_end = multiprocessing.Pipe()
+            shard_directory = None if directory is None else os.path.join(directory, f"shard-{number}")
+            worker = multiprocessing.Process(target=_serve, args=(child_end, shard_directory, max_history),
+                                             daemon=True)
+            worker.start()
+            child_end.close()
+            self._connections.append(parent_end)
+            self._workers.append(worker)
+        self._max_history = max_history
+        # shard of each executed command, in order; each shard also keeps the commands themselves in its own history,
+        # which is never shorter than its part of this one
+        self._history = []
+        self._position = -1
+        self._history_lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def shards(self):
+        return len(self._connections)
+
+    def shard_of(self, id):
+        """
+        :return: number of the shard owning a patient ID
+        """
+        return shard_of(id, len(self._connections))
+
+    def close(self):
+        """
+        Stops the worker processes, after each has saved its patients if it has a directory
+        """
+        for lock, connection in zip(self._locks, self._connections):
+            with lock:
+                if not connection.closed:
+                    connection.send(None)
+                    connection.close()
+        for worker in self._workers:
+            worker.join()
+
+    def __len__(self):
+        return sum(self._broadcast("count"))
+
+    def patients(self):
+        """
+        :return: iterator of copies of every patient in the system
+        """
+        return (patient for patients in self._broadcast("patients") for patient in patients)
+
+    def get_patient(self, id):
+        """
+        Retrieves a copy of a patient by their ID number.
+        :param id: unique number given to patient upon creation
+        :return: copy of the patient corresponding to the ID if it exists in the system, otherwise returns None
+        """
+        patient = self.find_patient(id)
+        if patient is None:
+            print(f"Patient #{id} does not exist in the System.")
+        return patient
+
+    def find_patient(self, id):
+        """
+        Retrieves a copy of a patient by their ID number without any console output.
+        :param id: unique number given to patient upon creation
+        :return: copy of the patient corresponding to the ID if it exists in the system, otherwise returns None
+        """
+        return self._request(self.shard_of(id), "find_patient", id)
+
+    def find_patients(self, ids):
+        """
+        Retrieves copies of many patients, from every shard in parallel
+        :param ids: ID numbers of the patients
+        :return: list of the copies of the patients, or None for those that do not exist in the system, in order of ids
+        """
+        return [self._result(reply) for reply in self._map("find_patient", [(id,) for id in ids])]
+
+    def add_patient(self, patient):
+        """
+        Adds a patient to the system if the ID does not already exist.
+        If it does exist, the patient's information will be overwritten upon the user's input of Y/N.
+        :param patient: the new patient to be added to the system
+        """
+        try:
+            self.insert_patient(patient)
+        except RecordConflictError:
+            overwrite = input(f"Patient #{patient.id} already exists. Overwrite? Y/N ")
+            if overwrite != "Y":
+                print(f"Failure: Patient #{patient.id} was not added to the system.")
+                return
+            self.insert_patient(patient, ConflictPolicy.OVERWRITE)
+        print(f"Patient #{patient.id} successfully added to the system.")
+
+    def insert_patient(self, patient, on_conflict=ConflictPolicy.ERROR):
+        """
+        Adds a patient to the system without any console input or output.
+        :param patient: the new patient to be added to the system
+        :param on_conflict: ConflictPolicy applied if a patient with the same ID already exists
+        :return: the WriteResult of the operation
+        """
+        return self._request(self.shard_of(patient.id), "insert_patient", patient, on_conflict)
+
+    def remove_patient(self, id):
+        """
+        Removes a patient from the system if the ID number exists, otherwise does nothing.
+        :param id: ID number of the patient to remove
+        :return: copy of the removed patient if removal is successful, otherwise returns None
+        """
+        patient = self.delete_patient(id)
+        if patient is None:
+            print(f"Patient #{id} does not exist in the system.")
+        else:
+            print(f"Patient #{id} successfully removed from the system.")
+        return patient
+
+    def delete_patient(self, id):
+        """
+        Removes a patient from the system without any console output.
+        :param id: ID number of the patient to remove
+        :return: copy of the removed patient if removal is successful, otherwise returns None
+        """
+        return self._request(self.shard_of(id), "delete_patient", id)
+
+    def execute(self, command_class, *args, on_conflict=ConflictPolicy.ERROR):
+        """
+        Executes a command on the shard owning its patient and adds it to the command history
+        :param command_class: one of the built-in command classes
+        :param args: the arguments of the command's execute method, where the patient can be given by ID, except for
+                     the new patient of an AddPatientCommand
+        :param on_conflict: ConflictPolicy of the command, which cannot ask for console input in a worker
+        :raises LookupError: if the patient does not exist in the system
+        """
+        self.execute_many(command_class, [args], on_conflict)
+
+    def execute_many(self, command_class, args_list, on_conflict=ConflictPolicy.ERROR):
+        """
+        Executes a command for each of many argument tuples, on every shard in parallel. The commands are added to the
+        command history in order, each undone on its own.
+        :param command_class: one of the built-in command classes
+        :param args_list: list of the arguments of each command, as for execute
+        :param on_conflict: ConflictPolicy of the commands
+        :raises: the exception raised by the first command that failed, in order of args_list, once every other command
+                 has been executed
+        """
+        if command_class.__name__ not in _COMMANDS:
+            raise TypeError(f"Command {command_class.__name__} cannot be executed by a ShardedSystem.")
+        if on_conflict is None:
+            raise ValueError("Commands executed by a ShardedSystem need a conflict policy.")
+        requests = []
+        for args in args_list:
+            if command_class is not AddPatientCommand:
+                args = (_patient_id(args[0]),) + tuple(args[1:])
+            requests.append((command_class.__name__, on_conflict, args))
+        with self._history_lock:
+            replies = self._map("execute", requests, key=lambda request: _patient_id(request[2][0]))
+            error = None
+            for (ok, result), request in zip(replies, requests):
+                if ok:
+                    self._record(self.shard_of(_patient_id(request[2][0])))
+                elif error is None:
+                    error = result
+            if error is not None:
+                raise error
+
+    def undo(self):
+        """
+        Undoes the last command executed through this system, on the shard that executed it
+        :return: True if a command was undone, otherwise False
+        """
+        with self._history_lock:
+            if self._position < 0:
+                return False
+            self._request(self._history[self._position], "undo")
+            self._position -= 1
+            return True
+
+    def redo(self):
+        """
+        Redoes the last undone command, on the shard that executed it
+        :return: True if a command was redone, otherwise False
+        """
+        with self._history_lock:
+            if self._position + 1 >= len(self._history):
+                return False
+            self._request(self._history[self._position + 1], "redo")
+            self._position += 1
+            return True
+
+    def _record(self, shard):
+        # a shard drops the commands undone after its own position when it executes a new one, and the commands of the
+        # other shards undone after this position are never redone once it is dropped here
+        del self._history[self._position + 1:]
+        self._history.append(shard)
+        if self._max_history is not None and len(self._history) > self._max_history:
+            del self._history[0]
+        self._position = len(self._history) - 1
+
+    def _call(self, batches):
+        """
+        Sends lists of requests to their shards, all before waiting for any reply, so that the shards serve them in
+        parallel
+        :param batches: dictionary of shard number: list of (method, args) requests
+        :return: dictionary of shard number: list of (ok, result) replies
+        """
+        shards = sorted(batches)
+        for shard in shards:  # taken in order, so that threads sending to several shards never wait on each other
+            self._locks[shard].acquire()
+        try:
+            for shard in shards:
+                self._connections[shard].send(batches[shard])
+            return {shard: self._connections[shard].recv() for shard in shards}
+        finally:
+            for shard in shards:
+                self._locks[shard].release()
+
+    def _request(self, shard, method, *args):
+        return self._result(self._call({shard: [(method, args)]})[shard][0])
+
+    def _broadcast(self, method):
+        """
+        :return: list of the results of a request to every shard
+        """
+        replies = self._call({shard: [(method, ())] for shard in range(len(self._connections))})
+        return [self._result(replies[shard][0]) for shard in range(len(self._connections))]
+
+    def _map(self, method, args_list, key=lambda args: args[0]):
+        """
+        Sends a request for each argument tuple to the shard owning the patient ID that key returns for it
+        :return: list of the (ok, result) replies, in order of args_list
+        """
+        batches = {}
+        positions = {}  # shard number: positions in args_list of its requests
+        for position, args in enumerate(args_list):
+            shard = self.shard_of(key(args))
+            batches.setdefault(shard, []).append((method, args))
+            positions.setdefault(shard, []).append(position)
+        replies = [None] * len(args_list)
+        for shard, shard_replies in self._call(batches).items():
+            for position, reply in zip(positions[shard], shard_replies):
+                replies[position] = reply
+        return replies
+
+    @staticmethod
+    def _result(reply):
+        ok, result = reply
+        if not ok:
+            raise result
+        return result
@@ -0,0 +1,248 @@
+import json
+import os
+import threading
+import time
+
+try:
+    from health_records_system import ConflictPolicy, Event, IObserver, Medication, Patient
+    from mapped_store import MappedPatients, encode_patient, write_store
+except ImportError:
+    from src.health_records_system import ConflictPolicy, Event, IObserver, Medication, Patient
+    from src.mapped_store import MappedPatients, encode_patient, write_store
+
+
+class Storage(IObserver):
+    """
+    Durable storage for the Health Records System.
+    Every change to the patients in the system is appended to a write-ahead log before it is applied in memory, so a
+    change that cannot be logged is never applied. The log is periodically compacted into a snapshot of all patients.
+    Opening the storage recovers the system by memory-mapping the last snapshot, from which patients are loaded as they
+    are used, and replaying the changes logged after it.
+    Changes may be logged from several threads. Snapshots are taken while all changes to the system are stopped.
+    """
+
+    SNAPSHOT_FILE = "patients.dat"
+    LOG_FILE = "wal.jsonl"
+
+    def __init__(self, directory, sync_every=1, sync_interval=None, checkpoint_every=None, cache_size=10000):
+        """
+        :param directory: directory holding the snapshot and log files, created if it does not exist
+        :param sync_every: number of changes buffered before they are written and synced to disk together
+        :param sync_interval: maximum number of seconds a buffered change waits before the buffer is synced, checked
+                              whenever a change is logged, or None for no limit
+        :param checkpoint_every: number of logged changes after which a new snapshot is written, once the change that
+                                 reaches the number has been applied, or None to only write snapshots on checkpoint()
+                                 and close()
+        :param cache_size: maximum number of unchanged patients from the snapshot kept in memory
+        """
+        self._directory = directory
+        self._sync_every = sync_every
+        self._sync_interval = sync_interval
+        self._checkpoint_every = checkpoint_every
+        self._cache_size = cache_size
+        self._system = None
+        self._log = None
+        self._buffer = []  # encoded changes that have not been written to the log yet
+        self._last_sync = time.monotonic()
+        self._logged = 0  # number of changes logged since the last snapshot
+        self._checkpoint_deferred = False  # whether a checkpoint will run once the change being logged is applied
+        self._lock = threading.RLock()  # guards the log and its buffer
+
+    @property
+    def snapshot_path(self):
+        return os.path.join(self._directory, self.SNAPSHOT_FILE)
+
+    @property
+    def log_path(self):
+        return os.path.join(self._directory, self.LOG_FILE)
+
+    def open(self, system):
+        """
+        Recovers the system from the last snapshot and the log, then starts logging every change made to it
+        :param system: the Health Records System to recover into, which must be empty if a snapshot exists
+        :return: the number of logged changes that were replayed
+        """
+        if self._log is not None:
+            raise Exception("Storage is already open.")
+
+        os.makedirs(self._directory, exist_ok=True)
+        self._system = system
+
+        if os.path.exists(self.snapshot_path):
+            system.mount(MappedPatients(self.snapshot_path, system, self._cache_size))
+
+        replayed = self._replay()
+        self._log = open(self.log_path, "a")
+        self._logged = replayed
+        system.attach(self)
+        return replayed
+
+    def update(self, event, patient, *args):
+        """
+        Logs a change before it is applied to the system, syncing the log to disk once enough changes have been
+        buffered. A change that cannot be serialized raises an exception and is therefore not applied.
+        """
+        record = json.dumps(_encode(event, patient, args)) + "\n"
+
+        with self._lock:
+            self._buffer.append(record)
+            self._logged += 1
+
+            if len(self._buffer) >= self._sync_every or (
+                    self._sync_interval is not None and time.monotonic() - self._last_sync >= self._sync_interval):
+                self.flush()
+
+            # the change being logged has not been applied yet, so the snapshot is taken once it has been
+            if self._checkpoint_every is not None and self._logged >= self._checkpoint_every and \
+                    not self._checkpoint_deferred:
+                self._checkpoint_deferred = True
+                self._system.defer(self._deferred_checkpoint)
+
+    def flush(self):
+        """
+        Writes all buffered changes to the log and syncs it to disk
+        """
+        with self._lock:
+            if self._buffer:
+                self._log.write("".join(self._buffer))
+                self._buffer = []
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._last_sync = time.monotonic()
+
+    def checkpoint(self):
+        """
+        Writes a snapshot of every patient in the system and empties the log
+        """
+        with self._system.exclusive(), self._lock:
+            self.flush()
+
+            # a mounted snapshot copies the records of unchanged patients from the previous snapshot
+            patients = self._system._patients
+            if isinstance(patients, MappedPatients):
+                records = patients.records()
+            else:
+                records = ((patient.id, encode_patient(patient)) for patient in self._system.patients())
+
+            temp_path = self.snapshot_path + ".tmp"
+            write_store(temp_path, records)
+            os.replace(temp_path, self.snapshot_path)
+            _sync_directory(self._directory)
+            if isinstance(patients, MappedPatients):
+                patients.reload(self.snapshot_path)
+
+            # replaying the log over the new snapshot is harmless, so a crash before the log is emptied loses nothing
+            self._log.seek(0)
+            self._log.truncate()
+            self.flush()
+            self._logged = 0
+
+    def close(self):
+        """
+        Writes a final snapshot and stops logging changes to the system
+        """
+        with self._system.exclusive(), self._lock:
+            self.checkpoint()
+            self._system.detach(self)
+            self._log.close()
+            self._log = None
+
+    def _deferred_checkpoint(self):
+        with self._lock:
+            self._checkpoint_deferred = False
+            if self._log is None or self._logged < self._checkpoint_every:
+                return
+        self.checkpoint()
+
+    def _replay(self):
+        """
+        Applies every complete change in the log to the system, discarding a partially written last change
+        :return: the number of changes replayed
+        """
+        if not os.path.exists(self.log_path):
+            return 0
+
+        replayed = 0
+        valid_end = 0  # offset just past the last complete change
+        log_end = os.path.getsize(self.log_path)  # changes are only read up to the size of the log when replay began
+        with open(self.log_path, "rb") as log:
+            for line in log:
+                if valid_end + len(line) > log_end or not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                _apply(self._system, record)
+                valid_end += len(line)
+                replayed += 1
+
+        if valid_end < log_end:
+            with open(self.log_path, "r+b") as log:
+                log.truncate(valid_end)
+        return replayed
+
+
+def _encode(event, patient, args):
+    """
+    Converts a change to the system into a log record
+    :return: dictionary of JSON-serializable values
+    """
+    record = {"op": event, "id": patient.id}
+    if event == Event.PATIENT_ADDED:
+        record["patient"] = patient.to_dict()
+    elif event == Event.MEDICATION_SET:
+        record["medication"] = args[0].to_dict()
+    elif event == Event.MEDICATION_REMOVED:
+        record["name"] = args[0]
+    elif event == Event.TEST_RESULTS_SET:
+        record["name"], record["date"], record["result"] = args
+    elif event == Event.TEST_RESULTS_REMOVED:
+        record["name"], record["date"] = args
+    return record
+
+
+def _apply(system, record):
+    """
+    Applies a log record to the system. Every record sets or removes an entry, so applying it again is harmless.
+    """
+    op = record["op"]
+    if op == Event.PATIENT_ADDED:
+        system.insert_patient(Patient.from_dict(record["patient"]), ConflictPolicy.OVERWRITE)
+        return
+    if op == Event.PATIENT_REMOVED:
+        system.delete_patient(record["id"])
+        return
+
+    patient = system.find_patient(record["id"])
+    if patient is None:  # the patient was removed after this change
+        return
+
+    if op == Event.MEDICATION_SET:
+        patient.insert_medication(Medication.from_dict(record["medication"]), ConflictPolicy.OVERWRITE)
+    elif op == Event.MEDICATION_REMOVED:
+        patient.delete_medication(record["name"])
+    elif op == Event.MEDICATION_CLEARED:
+        patient.clear_medication()
+    elif op == Event.TEST_RESULTS_SET:
+        patient.insert_test_results(record["name"], record["date"], record["result"], ConflictPolicy.OVERWRITE)
+    elif op == Event.TEST_RESULTS_REMOVED:
+        patient.delete_test_results(record["name"], record["date"])
+    elif op == Event.TEST_RESULTS_CLEARED:
+        patient.clear_test_results()
+
+
+def _sync_directory(directory):
+    """
+    Syncs a directory so that a file renamed into it survives a crash, on platforms that support it
+    """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,136 @@
+"""
+Rendered views of patients' records, and a cache that keeps the views of frequently read patients until they change.
+"""
+import collections
+import itertools
+import threading
+import time
+
+try:
+    from health_records_system import IObserver
+except ImportError:
+    from src.health_records_system import IObserver
+
+
+def render_summary(patient):
+    """
+    :return: the patient's information, one field per line
+    """
+    return f"Name: {patient.name}\nAge: {patient.age}\nPhone number: {patient.phone_number}\nID number: {patient.id}"
+
+
+def render_medication(patient):
+    """
+    :return: the patient's medication, one per line
+    """
+    if not patient.medication:
+        return "This patient is not taking any medication."
+    return "\n".join(f"Medication: {med_name}, Dosage: {med.dosage}, Frequency: {med.frequency}"
+                     for med_name, med in patient.medication.items())
+
+
+def render_test_results(patient):
+    """
+    :return: the patient's test results ordered by test name, then chronologically, separated by blank lines
+    """
+    if not patient.test_results:
+        return "This patient has no test results to display."
+    return "\n".join(f"Test: {name}, Date: {date}, Result: {result}\n"
+                     for name, date, result in patient.sorted_test_results())
+
+
+VIEWS = {
+    "summary": render_summary,
+    "medication": render_medication,
+    "test_results": render_test_results,
+    "record": lambda patient: patient.to_dict(),  # as served by the server, which must not be changed by callers
+}
+
+
+class ViewCache(IObserver):
+    """
+    Read-through cache of the rendered views of patients, keyed by patient ID and view.
+    Every patient has a version that changes whenever the patient is added, removed or has their record changed, which
+    the cache observes, so a cached view is only used while the patient's version is the one it was rendered at. The
+    least recently used views are evicted beyond max_size, and views older than ttl seconds are rendered again.
+    """
+
+    def __init__(self, system, max_size=10000, ttl=None):
+        """
+        :param system: the Health Records System, which the cache observes for changes
+        :param max_size: maximum number of views kept
+        :param ttl: number of seconds a view is kept for, or None to keep it until the patient changes
+        """
+        self._system = system
+        self._max_size = max_size
+        self._ttl = ttl
+        self._entries = collections.OrderedDict()  # (ID, view): (version, expiry time, view), least recently used first
+        self._versions = {}  # ID: version of a patient that has changed since the cache was created, 0 otherwise
+        self._counter = itertools.count(1)  # versions are never reused, even by a patient removed and added again
+        self._lock = threading.Lock()  # guards the entries, versions and counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        system.attach(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        """
+        Stops observing the system and empties the cache
+        """
+        self._system.detach(self)
+        with self._lock:
+            self._entries.clear()
+
+    def update(self, event, patient, *args):
+        # the change is applied while the patient's lock is held, and views are rendered with it held, so a view
+        # rendered at the previous version never reflects part of the change
+        with self._lock:
+            self._versions[patient.id] = next(self._counter)
+
+    def get(self, id, view="summary"):
+        """
+        Retrieves a view of a patient, rendering it if it is not cached
+        :param id: ID number of the patient
+        :param view: one of the VIEWS
+        :return: the view, or None if the patient does not exist in the system
+        """
+        render = VIEWS.get(view)
+        if render is None:
+            raise ValueError(f"Unknown view: {view}")
+        key = (id, view)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == self._versions.get(id, 0) and (
+                    entry[1] is None or time.monotonic() < entry[1]):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        with self._system.lock_patient(id):
+            patient = self._system.find_patient(id)
+            if patient is None:
+                return None
+            with self._lock:
+                version = self._versions.get(id, 0)
+            rendered = render(patient)
+
+        with self._lock:
+            # a view rendered before a change that happened since is stored with its old version, so it is never used
+            self._entries[key] = (version, None if self._ttl is None else time.monotonic() + self._ttl, rendered)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return rendered
+
+    def stats(self):
+        """
+        :return: dictionary of the number of "hits", "misses" and "evictions" since the cache was created, and the
+                 number of views cached ("size")
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._entries)}
@@ -0,0 +1,68 @@
+import unittest
+from unittest import TestCase
+from src.analytics import *
+from src.health_records_system import *
+
+
+@unittest.skipUnless(numpy, "NumPy is not installed")
+class TestResultColumns(TestCase):
+
+    def setUp(self):
+        self.system = HealthRecordsSystem()
+        self.jane = Patient(1, "Jane", 25, 123)
+        self.jane.insert_test_results("creatinine", "01/01/2021", "80")
+        self.jane.insert_test_results("creatinine", "01/02/2021", "110")
+        self.jane.insert_test_results("COVID", "01/02/2021", "Negative")
+        self.system.insert_patient(self.jane)
+        self.columns = ResultColumns(self.system)
+        self.john = Patient(2, "John", 38, 456)
+        self.system.insert_patient(self.john)
+        self.john.insert_test_results("creatinine", "01/01/2021", "100")
+        self.john.insert_test_results("creatinine", "01/03/2021", "90")
+        self.jack = Patient(3, "Jack", 31, 789)
+        self.jack.insert_test_results("creatinine", "15/01/2021", "60")
+        self.system.insert_patient(self.jack)
+
+    def tearDown(self):
+        HealthRecordsSystem._reset()
+
+    def test_loads_existing_and_observes_new_results(self):
+        self.assertEqual(len(self.columns), 5)  # the COVID result is not a number
+        ids, dates, values = self.columns.values("creatinine", start="01/01/2021", end="31/01/2021")
+        self.assertEqual(sorted(zip(ids, values.tolist())), [(1, 80.0), (2, 100.0), (3, 60.0)])
+        self.assertEqual(self.columns.values("HbA1c")[0], [])
+
+    def test_aggregate(self):
+        self.assertEqual(self.columns.aggregate("creatinine"), {20: 95.0, 30: 250 / 3})
+        self.assertEqual(self.columns.aggregate("creatinine", function="count", band=5), {25: 2, 30: 1, 35: 2})
+        self.assertEqual(self.columns.aggregate("creatinine", by="patient", function="max"), {1: 110, 2: 100, 3: 60})
+        self.assertEqual(self.columns.aggregate("creatinine", function="min", start="01/02/2021"), {20: 110, 30: 90})
+        with self.assertRaises(ValueError):
+            self.columns.aggregate("creatinine", function="median")
+
+    def test_rising_and_patients_where(self):
+        self.assertEqual(self.columns.rising("creatinine", 0.3), [1])
+        self.assertEqual(self.columns.rising("creatinine", 0.5), [])
+        self.assertEqual(sorted(self.columns.patients_where("creatinine", lo=90)), [1, 2])
+        self.assertEqual(self.columns.patients_where("creatinine", hi=70, end="31/01/2021"), [3])
+
+    def test_follows_updates_and_removals(self):
+        self.jane.insert_test_results("creatinine", "01/02/2021", "70", ConflictPolicy.OVERWRITE)
+        self.assertEqual(self.columns.rising("creatinine", 0.3), [])
+        self.john.delete_test_results("creatinine", "01/01/2021")
+        self.assertEqual(self.columns.aggregate("creatinine", by="patient", function="count"), {1: 2, 2: 1, 3: 1})
+        self.system.delete_patient(self.jane.id)
+        self.jack.clear_test_results()
+        self.assertEqual(self.columns.aggregate("creatinine", by="patient"), {2: 90.0})
+        self.assertEqual(len(self.columns), 1)
+        self.john.insert_test_results("creatinine", "01/04/2021", "pending")
+        self.john.insert_test_results("creatinine", "01/03/2021", "n/a", ConflictPolicy.OVERWRITE)
+        self.assertEqual(len(self.columns), 0)
+
+    def test_grows_past_initial_capacity(self):
+        patients = [Patient(i, f"Patient {i}", i % 90, i) for i in range(10, 1500)]
+        for patient in patients:
+            patient.insert_test_results("glucose", "01/01/2021", str(patient.age))
+        self.system.add_patients_bulk(patients)
+        self.assertEqual(self.columns.aggregate("glucose", function="count", band=90), {0: 1490})
+        self.assertEqual(self.columns.aggregate("glucose", function="max", band=90), {0: 89})
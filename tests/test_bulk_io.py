@@ -0,0 +1,151 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import ANY
+from src.bulk_io import *
+from src.health_records_system import *
+
+
+class TestBulkIO(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.system = HealthRecordsSystem()
+
+    def tearDown(self):
+        HealthRecordsSystem._reset()
+        self.directory.cleanup()
+
+    def write(self, name, contents):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as output:
+            output.write(contents)
+        return path
+
+    def test_import_patients_from_csv(self):
+        path = self.write("patients.csv", "id,name,age,phone_number\n1,Jane,20,123\n2,John,old,456\n3,,40,789\n"
+                                          "4,Jack,40,789\n")
+        report = import_patients(self.system, path, chunk_size=2)
+        self.assertEqual((report.rows, report.counts[WriteResult.ADDED], report.rejected), (4, 2, 2))
+        self.assertEqual([line for line, _ in report.errors], [3, 4])
+        self.assertEqual(self.system.find_patient("1").age, 20)
+        self.assertEqual(self.system.find_patient("4").name, "Jack")
+
+    def test_import_patients_from_jsonl_with_records(self):
+        patient = Patient(1, "Jane", 20, 123)
+        patient.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        patient.insert_test_results("COVID", "26/06/2021", "Negative")
+        rows = [json.dumps(patient.to_dict()), "not json", json.dumps({"id": 2, "name": "John", "age": 30,
+                                                                       "phone_number": 456,
+                                                                       "test_results": [["COVID", "today", "?"]]})]
+        report = import_patients(self.system, self.write("patients.jsonl", "\n".join(rows) + "\n"))
+        self.assertEqual((report.rows, report.rejected), (3, 2))
+        imported = self.system.find_patient(1)
+        self.assertEqual(imported.to_dict(), patient.to_dict())
+
+    def test_import_patients_conflict_policy(self):
+        self.system.insert_patient(Patient("1", "Jane", 20, 123))
+        path = self.write("patients.csv", "id,name,age,phone_number\n1,John,30,456\n2,Jack,40,789\n")
+        with self.assertRaises(RecordConflictError):
+            import_patients(self.system, path)
+        report = import_patients(self.system, path, ConflictPolicy.SKIP)
+        self.assertEqual((report.counts[WriteResult.ADDED], report.counts[WriteResult.SKIPPED]), (1, 1))
+        self.assertEqual(self.system.find_patient("1").name, "Jane")
+
+    def test_import_medication_and_test_results(self):
+        self.system.insert_patient(Patient("1", "Jane", 20, 123))
+        path = self.write("medication.csv", "patient_id,name,dosage,frequency\n1,Advil,1 tablet,once a day\n"
+                                            "2,Advil,1 tablet,once a day\n")
+        report = import_medication(self.system, path)
+        self.assertEqual((report.counts[WriteResult.ADDED], report.rejected), (1, 1))
+        path = self.write("results.csv", "patient_id,name,date,result\n1,COVID,26/06/2021,Negative\n"
+                                         "1,COVID,27/06/2021,Positive\n1,COVID,31/06/2021,Positive\n")
+        report = import_test_results(self.system, path)
+        self.assertEqual((report.counts[WriteResult.ADDED], report.rejected), (2, 1))
+        patient = self.system.find_patient("1")
+        self.assertEqual(patient.get_medication("Advil").dosage, "1 tablet")
+        self.assertEqual(len(patient.test_results), 2)
+
+    def test_import_csv_missing_columns(self):
+        with self.assertRaises(ValueError):
+            import_patients(self.system, self.write("patients.csv", "id,name\n1,Jane\n"))
+
+    def test_export_and_import_round_trip(self):
+        for i in range(5):
+            patient = Patient(i, f"Patient {i}", 20 + i, 5550000 + i)
+            patient.insert_medication(Medication("Advil", f"{i} tablets", "once a day"))
+            patient.insert_test_results("COVID", f"{i + 1:02}/06/2021", "Negative")
+            self.system.insert_patient(patient)
+        records = sorted((patient.to_dict() for patient in self.system.patients()), key=lambda record: record["id"])
+
+        jsonl = os.path.join(self.directory.name, "patients.jsonl")
+        self.assertEqual(export(self.system, "patients", jsonl).rows, 5)
+        paths = {kind: os.path.join(self.directory.name, f"{kind}.csv") for kind in COLUMNS}
+        for kind, path in paths.items():
+            self.assertEqual(export(self.system, kind, path).rows, 5)
+
+        HealthRecordsSystem._reset()
+        self.system = HealthRecordsSystem()
+        import_patients(self.system, jsonl)
+        self.assertEqual(sorted((patient.to_dict() for patient in self.system.patients()),
+                                key=lambda record: record["id"]), records)
+
+        HealthRecordsSystem._reset()
+        self.system = HealthRecordsSystem()
+        import_patients(self.system, paths["patients"])
+        import_medication(self.system, paths["medication"])
+        import_test_results(self.system, paths["test_results"])
+        patient = self.system.find_patient("3")
+        self.assertEqual((patient.name, patient.age), ("Patient 3", 23))
+        self.assertEqual(patient.get_medication("Advil").dosage, "3 tablets")
+        self.assertEqual(patient.test_results, {("COVID", "04/06/2021"): "Negative"})
+
+
+class TestImportParallel(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.patients_path = os.path.join(self.directory.name, "patients.csv")
+        with open(self.patients_path, "w") as output:
+            output.write("id,name,age,phone_number\n")
+            for i in range(200):
+                output.write(f"{i},Patient {i},{'old' if i % 50 == 7 else 20 + i % 80},{5550000 + i}\n")
+            output.write("5,Duplicate,30,123\n")
+        self.results_path = os.path.join(self.directory.name, "test_results.jsonl")
+        with open(self.results_path, "w") as output:
+            for i in range(300):
+                date = "31/02/2021" if i % 100 == 42 else f"{i // 200 + 1:02}/01/2021"
+                output.write(json.dumps({"patient_id": str(i % 200), "name": "glucose", "date": date,
+                                         "result": str(i)}) + "\n")
+
+    def tearDown(self):
+        HealthRecordsSystem._reset()
+        self.directory.cleanup()
+
+    def imported(self, importer):
+        HealthRecordsSystem._reset()
+        system = HealthRecordsSystem()
+        reports = importer(system)
+        records = sorted((patient.to_dict() for patient in system.patients()), key=lambda record: int(record["id"]))
+        # the counts are left out, since a duplicate is counted as UPDATED or not depending on whether it is in the
+        # same chunk as the original, and so is the order in which parsing and loading errors are found
+        return records, [(report.rows, report.rejected, sorted(report.errors)) for report in reports]
+
+    def test_same_outcome_as_sequential_import(self):
+        sequential = self.imported(lambda system: [
+            import_patients(system, self.patients_path, ConflictPolicy.OVERWRITE),
+            import_test_results(system, self.results_path, ConflictPolicy.OVERWRITE)])
+        parallel = self.imported(lambda system: [
+            import_parallel(system, "patients", self.patients_path, ConflictPolicy.OVERWRITE, 2, shard_size=300),
+            import_parallel(system, "test_results", self.results_path, ConflictPolicy.OVERWRITE, 2, shard_size=500)])
+        self.assertEqual(parallel, sequential)
+        records, reports = parallel
+        self.assertEqual(records[5]["name"], "Duplicate")
+        self.assertEqual(reports[0][1:], (4, [(9, "'old' is not a whole, non-negative number."), (59, ANY),
+                                              (109, ANY), (159, ANY)]))
+        self.assertEqual([line for line, _ in reports[1][2]], [8, 43, 58, 108, 143, 158, 208, 243, 258])
+
+    def test_error_policy_raises(self):
+        with self.assertRaises(RecordConflictError):
+            import_parallel(HealthRecordsSystem(), "patients", self.patients_path, workers=2, shard_size=300)
@@ -1,6 +1,9 @@
 from unittest import TestCase
 from unittest.mock import Mock
 from src.command import *
+import contextlib
+import io
+import sys
 from src.health_records_system import *
 import mock
 import builtins
@@ -20,7 +23,7 @@ class TestInvoker(TestCase):
         command_stub = Mock(ICommand)
         self.invoker.register(command_stub)
         self.invoker.execute(command_stub, "arg")
-        self.assertEqual(self.invoker._history, [(command_stub, ("arg",))])
+        self.assertEqual(self.invoker._history, [(command_stub, ("arg",), command_stub.execute.return_value)])
 
     def test_execute_for_some_undone(self):
         command_stub1 = Mock(ICommand)
@@ -31,7 +34,43 @@ class TestInvoker(TestCase):
         self.invoker.execute(command_stub1, "command_1_second")
         self.invoker.undo()
         self.invoker.execute(command_stub2, "command_2_first")
-        self.assertEqual(self.invoker._history, [(command_stub1, ("command_1_first",)), (command_stub2, ("command_2_first",))])
+        self.assertEqual(self.invoker._history, [(command_stub1, ("command_1_first",), command_stub1.execute.return_value),
+                                                 (command_stub2, ("command_2_first",), command_stub2.execute.return_value)])
+
+    def test_execute_for_max_history_exceeded(self):
+        invoker = Invoker(max_history=2)
+        command_stub = Mock(ICommand)
+        invoker.register(command_stub)
+        for arg in ["first", "second", "third"]:
+            invoker.execute(command_stub, arg)
+        self.assertEqual([args for _, args, _ in invoker._history], [("second",), ("third",)])
+        self.assertEqual(invoker._position, 1)
+
+    def test_execute_for_max_history_bytes_exceeded(self):
+        command_stub = Mock(ICommand)
+        command_stub.execute.return_value = None
+        self.invoker.register(command_stub)
+        self.invoker.execute(command_stub, "first")
+        invoker = Invoker(max_history_bytes=self.invoker.history_bytes)
+        invoker.register(command_stub)
+        invoker.execute(command_stub, "first")
+        invoker.execute(command_stub, "second")
+        self.assertEqual([args for _, args, _ in invoker._history], [("second",)])
+        self.assertEqual(invoker._position, 0)
+
+    def test_execute_for_max_history_bytes_counts_removed_patients(self):
+        system = HealthRecordsSystem()
+        add_patient = AddPatientCommand(system)
+        remove_patient = RemovePatientCommand(system)
+        self.invoker.register(add_patient)
+        self.invoker.register(remove_patient)
+        patient = Patient(1, "Jane", 20, 123)
+        patient.add_test_results_bulk(("glucose", f"{day:02d}/01/2021", "5.4") for day in range(1, 29))
+        self.invoker.execute(add_patient, patient)
+        added_bytes = self.invoker.history_bytes
+        self.invoker.execute(remove_patient, patient)
+        self.assertGreater(self.invoker.history_bytes - added_bytes, 28 * sys.getsizeof("5.4"))
+        HealthRecordsSystem._reset()
 
     def test_execute_for_command_not_registered(self):
         command_stub = Mock(ICommand)
@@ -47,7 +86,7 @@ class TestInvoker(TestCase):
             def execute(self, *args):
                 self.executed = True
 
-            def undo(self, *args):
+            def undo(self, *args, state=None):
                 self.undone = True
 
         command_stub = MockCommand()
@@ -67,7 +106,7 @@ class TestInvoker(TestCase):
             def execute(self, *args):
                 self.executed = True
 
-            def undo(self, *args):
+            def undo(self, *args, state=None):
                 self.undone = True
 
         command_stub = MockCommand()
@@ -91,7 +130,7 @@ class TestInvoker(TestCase):
                 if self.count > 1:
                     self.redone = True
 
-            def undo(self, *args):
+            def undo(self, *args, state=None):
                 self.undone = True
 
         command_stub = MockCommand()
@@ -103,6 +142,28 @@ class TestInvoker(TestCase):
         self.assertEqual(command_stub.redone, True)
         self.assertEqual(self.invoker._position, prev_position+1)
 
+    def test_redo_for_all_commands_undone(self):
+        command_stub = Mock(ICommand)
+        self.invoker.register(command_stub)
+        self.invoker.execute(command_stub, "first")
+        self.invoker.execute(command_stub, "second")
+        self.invoker.undo()
+        self.invoker.undo()
+        self.invoker.redo()
+        command_stub.execute.assert_called_with("first")
+        self.assertEqual(self.invoker._position, 0)
+
+    def test_redo_evicts_when_over_max_history_bytes(self):
+        command_stub = Mock(ICommand)
+        command_stub.execute.return_value = None
+        invoker = Invoker(max_history_bytes=1000)
+        invoker.register(command_stub)
+        invoker.execute(command_stub, "arg")
+        command_stub.execute.return_value = "x" * 2000
+        invoker.redo()
+        self.assertEqual(invoker._history, [])
+        self.assertEqual(invoker.history_bytes, 0)
+
     def test_redo_for_last_command_not_undone(self):
         class MockCommand(ICommand):
             def __init__(self):
@@ -117,7 +178,7 @@ class TestInvoker(TestCase):
                 if self.count > 1:
                     self.redone = True
 
-            def undo(self, *args):
+            def undo(self, *args, state=None):
                 self.undone = True
 
         command_stub = MockCommand()
@@ -195,11 +256,61 @@ class TestAddMedicationCommand(TestCase):
         med2 = Medication("Advil", "2 tablet", "once a day")
 
         with mock.patch.object(builtins, 'input', lambda _: 'Y'):
-            self.command.execute(patient, med2)
-            self.command.undo(patient)
+            state = self.command.execute(patient, med2)
+            self.command.undo(patient, state=state)
             cur_med = patient.get_medication("Advil")
             self.assertEqual(cur_med.dosage, "1 tablet")
 
+    def test_undo_for_new_medication(self):
+        patient = Patient(1, "Jane", 20, 123)
+        med1 = Medication("Advil", "1 tablet", "once a day")
+        self.command.execute(patient, med1)
+        med2 = Medication("Tylenol", "2 tablets", "twice a day")
+        state = self.command.execute(patient, med2)
+        self.command.undo(patient, state=state)
+        self.assertEqual(patient.medication, {"Advil": med1})
+
+    def test_undo_is_silent(self):
+        patient = Patient(1, "Jane", 20, 123)
+        state = self.command.execute(patient, Medication("Advil", "1 tablet", "once a day"))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.command.undo(patient, state=state)
+        self.assertEqual(output.getvalue(), "")
+        self.assertEqual(patient.medication, {})
+
+    def test_undo_for_invoker_history(self):
+        invoker = Invoker()
+        invoker.register(self.command)
+        patient = Patient(1, "Jane", 20, 123)
+        med1 = Medication("Advil", "1 tablet", "once a day")
+        med2 = Medication("Tylenol", "2 tablets", "twice a day")
+        invoker.execute(self.command, patient, med1)
+        invoker.execute(self.command, patient, med2)
+        invoker.undo()
+        self.assertEqual(patient.medication, {"Advil": med1})
+        invoker.undo()
+        self.assertEqual(patient.medication, {})
+
+
+    def test_medication_index_after_undo_and_redo(self):
+        invoker = Invoker()
+        remove = RemoveMedicationCommand(self.system)
+        invoker.register(self.command)
+        invoker.register(remove)
+        patient = Patient(1, "Jane", 20, 123)
+        self.system.insert_patient(patient)
+        med = Medication("Advil", "1 tablet", "once a day")
+        invoker.execute(self.command, patient, med)
+        self.assertEqual(self.system.find_by_medication("Advil"), [patient])
+        invoker.undo()
+        self.assertEqual(self.system.find_by_medication("Advil"), [])
+        invoker.redo()
+        invoker.execute(remove, patient, med)
+        self.assertEqual(self.system.find_by_medication("Advil"), [])
+        invoker.undo()
+        self.assertEqual(self.system.find_by_medication("Advil"), [patient])
+
 
 class TestRemoveMedicationCommand(TestCase):
 
@@ -245,7 +356,95 @@ class TestAddTestResultsCommand(TestCase):
         self.command.execute(patient, "COVID", "June 26, 2021", "Negative")
 
         with mock.patch.object(builtins, 'input', lambda _: 'Y'):
-            self.command.execute(patient, "COVID", "June 26, 2021", "Positive")
-            self.command.undo(patient)
+            state = self.command.execute(patient, "COVID", "June 26, 2021", "Positive")
+            self.command.undo(patient, state=state)
             self.assertEqual(patient.test_results, {("COVID", "June 26, 2021"): "Negative"})
 
+    def test_undo_for_new_test_results(self):
+        patient = Patient(1, "Jane", 20, 123)
+        self.command.execute(patient, "COVID", "June 26, 2021", "Negative")
+        state = self.command.execute(patient, "COVID", "July 2, 2021", "Positive")
+        self.command.undo(patient, state=state)
+        self.assertEqual(patient.test_results, {("COVID", "June 26, 2021"): "Negative"})
+
+    def test_undo_is_silent(self):
+        patient = Patient(1, "Jane", 20, 123)
+        state = self.command.execute(patient, "COVID", "June 26, 2021", "Negative")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            self.command.undo(patient, state=state)
+        self.assertEqual(output.getvalue(), "")
+        self.assertEqual(patient.test_results, {})
+
+
+class TestCompositeCommand(TestCase):
+
+    def setUp(self):
+        self.system = HealthRecordsSystem()
+        self.add_patient = AddPatientCommand(self.system, ConflictPolicy.ERROR)
+        self.add_medication = AddMedicationCommand(self.system, ConflictPolicy.ERROR)
+        self.add_test_results = AddTestResultsCommand(self.system, ConflictPolicy.ERROR)
+        self.invoker = Invoker(verbose=False)
+        for command in (self.add_patient, self.add_medication, self.add_test_results):
+            self.invoker.register(command)
+        self.patient = Patient(1, "Jane", 20, 123)
+
+    def tearDown(self):
+        HealthRecordsSystem._reset()
+
+    def admit(self):
+        self.invoker.execute(self.add_patient, self.patient)
+        for i in range(20):
+            self.invoker.execute(self.add_medication, self.patient, Medication(f"Drug {i}", "1 tablet", "once a day"))
+        for i in range(50):
+            date = f"{i % 28 + 1:02}/{i // 28 + 1:02}/2021"
+            self.invoker.execute(self.add_test_results, self.patient, "glucose", date, "5.4")
+
+    def test_execute_rolls_back_on_failure(self):
+        command = CompositeCommand()
+        steps = ((self.add_patient, (self.patient,)),
+                 (self.add_test_results, (self.patient, "COVID", "26/06/2021", "Negative")),
+                 (self.add_test_results, (self.patient, "COVID", "26/06/2021", "Positive")))
+        with self.assertRaises(RecordConflictError):
+            command.execute(*steps)
+        self.assertIsNone(self.system.find_patient(1))
+        self.assertEqual(self.patient.test_results, {})
+
+        state = command.execute(*steps[:2])
+        self.assertEqual(self.patient.test_results, {("COVID", "26/06/2021"): "Negative"})
+        command.undo(*steps[:2], state=state)
+        self.assertIsNone(self.system.find_patient(1))
+        self.assertEqual(self.patient.test_results, {})
+
+    def test_transaction_is_one_history_entry(self):
+        with self.invoker.transaction():
+            self.admit()
+        self.assertEqual(len(self.invoker.history), 1)
+        self.assertEqual((len(self.patient.medication), len(self.patient.test_results)), (20, 50))
+
+        self.assertTrue(self.invoker.undo())
+        self.assertIsNone(self.system.find_patient(1))
+        self.assertEqual((self.patient.medication, self.patient.test_results), ({}, {}))
+        self.assertTrue(self.invoker.redo())
+        self.assertIs(self.system.find_patient(1), self.patient)
+        self.assertEqual((len(self.patient.medication), len(self.patient.test_results)), (20, 50))
+
+    def test_transaction_rolls_back_on_exception(self):
+        self.invoker.execute(self.add_test_results, self.patient, "COVID", "26/06/2021", "Negative")
+        with self.assertRaises(RecordConflictError):
+            with self.invoker.transaction():
+                self.admit()
+                with self.invoker.transaction():  # nested transactions are part of the outer one
+                    self.invoker.execute(self.add_test_results, self.patient, "COVID", "26/06/2021", "Positive")
+        self.assertIsNone(self.system.find_patient(1))
+        self.assertEqual(self.patient.test_results, {("COVID", "26/06/2021"): "Negative"})
+        self.assertEqual(self.patient.medication, {})
+        self.assertEqual(len(self.invoker.history), 1)
+
+    def test_transaction_history_size_counts_batch(self):
+        with self.invoker.transaction():
+            self.admit()
+        single = Invoker(verbose=False)
+        single.register(self.add_test_results)
+        single.execute(self.add_test_results, self.patient, "COVID", "26/06/2021", "Negative")
+        self.assertGreater(self.invoker.history_bytes, 71 * single.history_bytes // 2)
@@ -0,0 +1,134 @@
+import os
+import tempfile
+import threading
+from unittest import TestCase
+from src.command import *
+from src.concurrency import *
+from src.health_records_system import *
+from src.storage import Storage
+
+THREADS = 8
+
+
+def _run_threads(target, count=THREADS):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class TestStripedLock(TestCase):
+
+    def setUp(self):
+        self.locks = StripedLock(8)
+
+    def test_same_key_same_lock(self):
+        self.assertIs(self.locks(42), self.locks(42))
+        self.assertEqual(len({self.locks(key) for key in range(100)}), 8)
+
+    def test_acquire_all_waits_for_key(self):
+        acquired = threading.Event()
+        self.locks(42).acquire()
+
+        def acquire_all():
+            self.locks.acquire_all()
+            acquired.set()
+            self.locks.release_all()
+
+        thread = threading.Thread(target=acquire_all)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        self.locks(42).release()
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+
+
+class TestConcurrentSystem(TestCase):
+
+    def setUp(self):
+        self.system = HealthRecordsSystem()
+
+    def tearDown(self):
+        HealthRecordsSystem._reset()
+
+    def test_exclusive_while_holding_patient_lock(self):
+        with self.system.lock_patient(1):
+            with self.assertRaises(RuntimeError):
+                with self.system.exclusive():
+                    pass
+        with self.system.exclusive(), self.system.lock_patient(1), self.system.exclusive():
+            self.assertEqual(self.system._held.depth, 3)
+        self.assertEqual(self.system._held.depth, 0)
+
+    def test_concurrent_changes_to_one_patient(self):
+        patient = Patient(1, "Jane", 20, 123)
+        self.system.insert_patient(patient)
+
+        def add_results(i):
+            for day in range(1, 29):
+                patient.insert_test_results(f"test-{i}", f"{day:02d}/01/2021", "5.4")
+
+        _run_threads(add_results)
+        self.assertEqual(len(patient.test_results), THREADS * 28)
+        self.assertEqual(len(patient.latest("test-0", 100)), 28)
+
+    def test_concurrent_adds_and_removes(self):
+        def add_and_remove(i):
+            for id in range(i * 100, (i + 1) * 100):
+                self.system.insert_patient(Patient(id, "Jane", 20 + id % 50, id))
+            for id in range(i * 100, (i + 1) * 100, 2):
+                self.system.delete_patient(id)
+
+        _run_threads(add_and_remove)
+        self.assertEqual(len(list(self.system.patients())), THREADS * 50)
+        self.assertEqual(len(self.system.find_by_name("Jane")), THREADS * 50)
+
+    def test_shared_invoker(self):
+        invoker = Invoker()
+        command = AddTestResultsCommand(self.system)
+        invoker.register(command)
+        patient = Patient(1, "Jane", 20, 123)
+        self.system.insert_patient(patient)
+
+        def execute(i):
+            for day in range(1, 11):
+                invoker.execute(command, patient, f"test-{i}", f"{day:02d}/01/2021", "5.4")
+
+        _run_threads(execute)
+        self.assertEqual(len(invoker.history), THREADS * 10)
+        self.assertEqual(invoker._position, THREADS * 10 - 1)
+
+    def test_sessions_undo_their_own_commands(self):
+        invoker = Invoker()
+        command = AddTestResultsCommand(self.system)
+        invoker.register(command)
+        patient = Patient(1, "Jane", 20, 123)
+        self.system.insert_patient(patient)
+        session1, session2 = invoker.session(), invoker.session()
+        session1.execute(command, patient, "COVID", "26/06/2021", "Negative")
+        session2.execute(command, patient, "glucose", "26/06/2021", "5.4")
+        session1.undo()
+        self.assertEqual(patient.test_results, {("glucose", "26/06/2021"): "5.4"})
+        self.assertEqual(invoker.history, [])
+
+    def test_concurrent_changes_are_stored(self):
+        with tempfile.TemporaryDirectory() as directory:
+            storage = Storage(directory, checkpoint_every=50)
+            storage.open(self.system)
+
+            def add_patients(i):
+                for id in range(i * 100, (i + 1) * 100):
+                    self.system.insert_patient(Patient(id, "Jane", 20, id))
+                    self.system.find_patient(id).insert_test_results("COVID", "26/06/2021", "Negative")
+
+            _run_threads(add_patients)
+            storage.flush()
+            self.assertTrue(os.path.exists(storage.snapshot_path))
+
+            HealthRecordsSystem._reset()
+            self.system = HealthRecordsSystem()
+            Storage(directory).open(self.system)
+            self.assertEqual(len(list(self.system.patients())), THREADS * 100)
+            self.assertEqual(self.system.find_patient(THREADS * 100 - 1).test_results,
+                             {("COVID", "26/06/2021"): "Negative"})
@@ -0,0 +1,131 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+from src.command import *
+from src.disk_history import *
+from src.health_records_system import *
+from src.storage import Storage
+
+
+class TestDiskHistory(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.system = HealthRecordsSystem()
+        self.storage = Storage(self.directory.name)
+        self.storage.open(self.system)
+        self.history = None
+        self.invoker = self._invoker()
+
+    def tearDown(self):
+        self.history.close()
+        self.storage.close()
+        HealthRecordsSystem._reset()
+        self.directory.cleanup()
+
+    def _invoker(self, **kwargs):
+        self.history = DiskHistory(self.directory.name, self.system, **kwargs)
+        invoker = Invoker(verbose=False)
+        self.commands = {cls: cls(self.system, ConflictPolicy.ERROR) for cls in (
+            AddPatientCommand, RemovePatientCommand, AddMedicationCommand, RemoveMedicationCommand,
+            AddTestResultsCommand)}
+        for command in self.commands.values():
+            invoker.register(command)
+        invoker.use_history(self.history)
+        return invoker
+
+    def _restart(self, **kwargs):
+        """
+        Simulates a restart by recovering a new system and history from the directory
+        """
+        self.history.close()
+        self.storage.close()
+        HealthRecordsSystem._reset()
+        self.system = HealthRecordsSystem()
+        self.storage = Storage(self.directory.name)
+        self.storage.open(self.system)
+        self.invoker = self._invoker(**kwargs)
+
+    def _execute(self, cls, *args):
+        self.invoker.execute(self.commands[cls], *args)
+
+    def _admit(self):
+        patient = Patient(1, "Jane", 20, 123)
+        self._execute(AddPatientCommand, patient)
+        self._execute(AddMedicationCommand, patient, Medication("Advil", "1 tablet", "once a day"))
+        self._execute(AddTestResultsCommand, patient, "COVID", "26/06/2021", "Negative")
+        return patient
+
+    def test_undo_and_redo_after_restart(self):
+        self._admit()
+        self._restart()
+        self.assertEqual((len(self.invoker.history), self.history.position), (3, 2))
+        self.assertTrue(self.invoker.undo())
+        self.assertTrue(self.invoker.undo())
+        self.assertEqual((self.system.find_patient(1).medication, self.system.find_patient(1).test_results), ({}, {}))
+        self.assertTrue(self.invoker.undo())
+        self.assertIsNone(self.system.find_patient(1))
+        self.assertFalse(self.invoker.undo())
+
+        self._restart()
+        self.assertEqual(self.history.position, -1)
+        self.assertTrue(self.invoker.redo())
+        self.assertTrue(self.invoker.redo())
+        patient = self.system.find_patient(1)
+        self.assertEqual((list(patient.medication), patient.test_results), (["Advil"], {}))
+        self._execute(AddTestResultsCommand, patient, "COVID", "27/06/2021", "Positive")
+        self.assertEqual(len(self.invoker.history), 3)  # the undone test result is dropped
+        self._restart()
+        self.assertEqual(self.system.find_patient(1).test_results, {("COVID", "27/06/2021"): "Positive"})
+        self.assertEqual(self.history.position, 2)
+
+    def test_undo_patient_removed_before_restart(self):
+        patient = self._admit()
+        self._execute(RemovePatientCommand, patient)
+        self._restart()
+        self.assertIsNone(self.system.find_patient(1))
+        self.invoker.undo()
+        restored = self.system.find_patient(1)
+        self.assertEqual(list(restored.medication), ["Advil"])
+        self.assertEqual(list(restored.test_results), [("COVID", "26/06/2021")])
+        self.invoker.undo()
+        self.assertEqual(restored.test_results, {})
+
+    def test_transaction_after_restart(self):
+        with self.invoker.transaction():
+            self._admit()
+        self._restart()
+        self.assertEqual(len(self.invoker.history), 1)
+        self.invoker.undo()
+        self.assertIsNone(self.system.find_patient(1))
+        self.invoker.redo()  # the patient is added back as it was before the other commands of the transaction
+        self.assertEqual(len(self.system.find_patient(1).medication), 1)
+
+    def test_evicts_and_compacts(self):
+        self._restart(max_entries=5, cache_size=2)
+        patient = self._admit()
+        for i in range(10):
+            self._execute(AddTestResultsCommand, patient, "glucose", f"{i + 1:02}/01/2021", "5.4")
+        size = os.path.getsize(self.history.path)
+        with mock.patch("src.disk_history._COMPACT_SLACK", 0):
+            self.invoker.undo()  # 14 lines for 5 entries
+        self.assertLess(os.path.getsize(self.history.path), size / 2)
+        self.invoker.undo()
+        self.invoker.undo()
+        self._restart(max_entries=5)
+        self.assertEqual((len(self.invoker.history), self.history.position), (5, 1))
+        self.assertEqual(len(self.system.find_patient(1).test_results), 8)
+        while self.invoker.undo():
+            pass
+        self.assertEqual(len(self.system.find_patient(1).test_results), 6)
+
+    def test_discards_partially_written_line(self):
+        self._admit()
+        self.history.close()
+        with open(self.history.path, "ab") as log:
+            log.write(b'{"op": "execute", "number": 3, "ent')
+        self._restart()
+        self.assertEqual(len(self.invoker.history), 3)
+        self.invoker.undo()
+        self._restart()
+        self.assertEqual((len(self.invoker.history), self.history.position), (3, 1))
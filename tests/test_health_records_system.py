@@ -1,6 +1,11 @@
+import copy
+import datetime
 import mock
 import builtins
+import pickle
+import threading
 from unittest import TestCase
+from unittest.mock import Mock
 from src.health_records_system import *
 
 
@@ -47,6 +52,153 @@ class TestHealthRecordsSystem(TestCase):
         self.system.add_patient(patient)
         self.assertEqual(self.system._patients, {1: patient})
 
+    def test_insert_patient_new(self):
+        patient = Patient(1, "Jane", 20, 123)
+        self.assertEqual(self.system.insert_patient(patient), WriteResult.ADDED)
+        self.assertEqual(self.system._patients, {1: patient})
+
+    def test_insert_patient_already_exists_overwrite(self):
+        patient1 = Patient(1, "Jane", 20, 123)
+        patient2 = Patient(1, "John", 20, 123)
+        self.system.insert_patient(patient1)
+        self.assertEqual(self.system.insert_patient(patient2, ConflictPolicy.OVERWRITE), WriteResult.UPDATED)
+        self.assertEqual(self.system._patients, {1: patient2})
+
+    def test_insert_patient_already_exists_skip(self):
+        patient1 = Patient(1, "Jane", 20, 123)
+        patient2 = Patient(1, "John", 20, 123)
+        self.system.insert_patient(patient1)
+        self.assertEqual(self.system.insert_patient(patient2, ConflictPolicy.SKIP), WriteResult.SKIPPED)
+        self.assertEqual(self.system._patients, {1: patient1})
+
+    def test_insert_patient_already_exists_error(self):
+        patient1 = Patient(1, "Jane", 20, 123)
+        self.system.insert_patient(patient1)
+        with self.assertRaises(RecordConflictError):
+            self.system.insert_patient(Patient(1, "John", 20, 123))
+        self.assertEqual(self.system._patients, {1: patient1})
+
+    def test_add_patients_bulk(self):
+        patient1 = Patient(1, "Jane", 20, 123)
+        patient2 = Patient(2, "John", 30, 456)
+        patient3 = Patient(1, "Jack", 40, 789)
+        self.system.insert_patient(patient1)
+        counts = self.system.add_patients_bulk([patient2, patient3], ConflictPolicy.SKIP)
+        self.assertEqual(counts, {WriteResult.ADDED: 1, WriteResult.UPDATED: 0, WriteResult.SKIPPED: 1})
+        self.assertEqual(self.system._patients, {1: patient1, 2: patient2})
+
+    def test_add_patients_bulk_counts_duplicates_in_batch_once(self):
+        patient1 = Patient(1, "Jane", 20, 123)
+        patient2 = Patient(1, "Jack", 40, 789)
+        counts = self.system.add_patients_bulk([patient1, patient2], ConflictPolicy.OVERWRITE)
+        self.assertEqual(counts, {WriteResult.ADDED: 1, WriteResult.UPDATED: 0, WriteResult.SKIPPED: 0})
+        self.assertEqual(self.system._patients, {1: patient2})
+        self.assertEqual(self.system.find_by_name("Jack"), [patient2])
+
+    def test_add_patients_bulk_error_adds_nothing(self):
+        patients = [Patient(1, "Jane", 20, 123), Patient(2, "John", 30, 456), Patient(1, "Jack", 40, 789)]
+        with self.assertRaises(RecordConflictError):
+            self.system.add_patients_bulk(patients)
+        self.assertEqual(self.system._patients, {})
+
+    def test_find_by_name(self):
+        patient1 = Patient(1, "Jane", 20, 123)
+        patient2 = Patient(2, "John", 30, 456)
+        self.system.add_patients_bulk([patient1, patient2])
+        self.assertEqual(self.system.find_by_name("Jane"), [patient1])
+        self.assertEqual(self.system.find_by_name("Jack"), [])
+
+    def test_find_by_phone(self):
+        patient1 = Patient(1, "Jane", 20, 123)
+        patient2 = Patient(2, "John", 30, 123)
+        self.system.add_patient(patient1)
+        self.system.add_patient(patient2)
+        self.assertCountEqual(self.system.find_by_phone(123), [patient1, patient2])
+
+    def test_patients_in_age_range(self):
+        patient1 = Patient(1, "Jane", "20", 123)
+        patient2 = Patient(2, "John", "9", 456)
+        patient3 = Patient(3, "Jack", 45, 789)
+        self.system.add_patients_bulk([patient1, patient2, patient3])
+        self.assertEqual(self.system.patients_in_age_range(5, 20), [patient2, patient1])
+
+    def test_indexes_after_overwrite_and_remove(self):
+        self.system.add_patient(Patient(1, "Jane", 20, 123))
+        patient2 = Patient(1, "John", 30, 456)
+        self.system.insert_patient(patient2, ConflictPolicy.OVERWRITE)
+        self.assertEqual(self.system.find_by_name("Jane"), [])
+        self.assertEqual(self.system.find_by_name("John"), [patient2])
+        self.system.remove_patient(1)
+        self.assertEqual(self.system.find_by_phone(456), [])
+        self.assertEqual(self.system.patients_in_age_range(0, 100), [])
+
+    def test_find_by_medication(self):
+        patient1 = Patient(1, "Jane", 20, 123)
+        patient2 = Patient(2, "John", 30, 456)
+        patient1.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        self.system.add_patients_bulk([patient1, patient2])
+        for patient in (patient1, patient2):
+            patient.insert_medication(Medication("Warfarin", "5 mg", "once a day"))
+        self.assertEqual(self.system.find_by_medication("Advil", "Warfarin"), [patient1])
+        self.assertCountEqual(self.system.find_by_medication("Warfarin"), [patient1, patient2])
+        self.assertEqual(self.system.find_by_medication("Advil", "Tylenol"), [])
+        self.assertEqual(self.system.find_by_medication(), [])
+
+    def test_medication_index_after_changes(self):
+        patient = Patient(1, "Jane", 20, 123)
+        self.system.insert_patient(patient)
+        patient.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        patient.insert_medication(Medication("Advil", "2 tablets", "once a day"), ConflictPolicy.OVERWRITE)
+        patient.insert_medication(Medication("Warfarin", "5 mg", "once a day"))
+        patient.delete_medication("Advil")
+        self.assertEqual(self.system.find_by_medication("Advil"), [])
+        patient.clear_medication()
+        self.assertEqual(self.system.find_by_medication("Warfarin"), [])
+        patient.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        self.system.delete_patient(1)
+        self.assertEqual(self.system.find_by_medication("Advil"), [])
+
+    def test_notify_for_patient_changes(self):
+        observer = Mock(IObserver)
+        self.system.attach(observer)
+        patient = Patient(1, "Jane", 20, 123)
+        med = Medication("Advil", "1 tablet", "once a day")
+        self.system.insert_patient(patient)
+        patient.insert_medication(med)
+        patient.insert_test_results("COVID", "26/06/2021", "Negative")
+        patient.delete_medication("Advil")
+        self.system.delete_patient(1)
+        patient.insert_medication(med)  # no longer in the system, so observers are not notified
+        self.assertEqual(observer.update.call_args_list, [
+            mock.call(Event.PATIENT_ADDED, patient),
+            mock.call(Event.MEDICATION_SET, patient, med),
+            mock.call(Event.TEST_RESULTS_SET, patient, "COVID", "26/06/2021", "Negative"),
+            mock.call(Event.MEDICATION_REMOVED, patient, "Advil"),
+            mock.call(Event.PATIENT_REMOVED, patient)])
+
+    def test_notify_for_overwrite(self):
+        observer = Mock(IObserver)
+        self.system.attach(observer)
+        patient1 = Patient(1, "Jane", 20, 123)
+        patient2 = Patient(1, "John", 20, 123)
+        self.system.insert_patient(patient1)
+        self.system.insert_patient(patient2, ConflictPolicy.OVERWRITE)
+        self.assertEqual(observer.update.call_args_list[1:], [mock.call(Event.PATIENT_REMOVED, patient1),
+                                                              mock.call(Event.PATIENT_ADDED, patient2)])
+
+    def test_detach(self):
+        observer = Mock(IObserver)
+        self.system.attach(observer)
+        self.system.detach(observer)
+        self.system.insert_patient(Patient(1, "Jane", 20, 123))
+        observer.update.assert_not_called()
+
+    def test_find_patient(self):
+        patient = Patient(1, "Jane", 20, 123)
+        self.system.insert_patient(patient)
+        self.assertEqual(self.system.find_patient(1), patient)
+        self.assertEqual(self.system.find_patient(2), None)
+
     def test_remove_patient_for_valid_id(self):
         patient = Patient(1, "Jane", 20, 123)
         self.system.add_patient(patient)
@@ -63,6 +215,51 @@ class TestPatient(TestCase):
     def setUp(self):
         self.patient = Patient(1, "Jane", 20, 123)
 
+    def test_age_is_int(self):
+        self.assertEqual(Patient(2, "John", "35", 456).age, 35)
+
+    def test_age_for_invalid_age(self):
+        with self.assertRaises(ValueError):
+            Patient(2, "John", "unknown", 456)
+
+    def test_age_for_fractional_or_negative_age(self):
+        for age in [20.9, -1, "-1", "20.5", True]:
+            with self.assertRaises(ValueError):
+                Patient(2, "John", age, 456)
+        self.assertEqual(Patient(2, "John", 20.0, 456).age, 20)
+
+    def test_empty_records_are_not_shared_once_written(self):
+        patient = pickle.loads(pickle.dumps(Patient(2, "John", 35, 456)))
+        patient.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        patient.insert_test_results("COVID", "26/06/2021", "Negative")
+        self.assertEqual(self.patient.medication, {})
+        self.assertEqual(self.patient.test_results, {})
+        self.assertEqual(self.patient.latest("COVID"), [])
+
+    def test_to_dict_and_from_dict(self):
+        self.patient.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        self.patient.insert_test_results("COVID", "26/06/2021", "Negative")
+        patient = Patient.from_dict(self.patient.to_dict())
+        self.assertEqual((patient.id, patient.name, patient.age, patient.phone_number), (1, "Jane", 20, 123))
+        self.assertEqual(patient.get_medication("Advil").to_dict(), self.patient.get_medication("Advil").to_dict())
+        self.assertEqual(patient.test_results, {("COVID", "26/06/2021"): "Negative"})
+
+    def test_copies_leave_system_behind(self):
+        system = HealthRecordsSystem.get_instance()
+        system.insert_patient(self.patient)
+        self.patient.insert_test_results("COVID", "26/06/2021", "Negative")
+        for patient in [copy.deepcopy(self.patient), pickle.loads(pickle.dumps(self.patient))]:
+            self.assertEqual(patient._system, None)
+            self.assertEqual(patient.test_results, {("COVID", "26/06/2021"): "Negative"})
+            self.assertEqual(patient.latest("COVID"), [("26/06/2021", "Negative")])
+        HealthRecordsSystem._reset()
+
+    def test_medication_strings_are_interned(self):
+        med1 = Medication("".join(["Ad", "vil"]), "1 tablet", "".join(["once ", "a day"]))
+        med2 = Medication("Advil", "2 tablets", "once a day")
+        self.assertIs(med1.name, med2.name)
+        self.assertIs(med1.frequency, med2.frequency)
+
     def test_get_medication_for_valid_name(self):
         med = Medication("Advil", "1 tablet", "once a day")
         self.patient.add_medication(med)
@@ -94,6 +291,23 @@ class TestPatient(TestCase):
         self.patient.add_medication(med)
         self.assertEqual(self.patient.medication, {"Advil": med})
 
+    def test_insert_medication_already_exists(self):
+        med1 = Medication("Advil", "1 tablet", "once a day")
+        med2 = Medication("Advil", "1 tablet", "twice a day")
+        self.assertEqual(self.patient.insert_medication(med1), WriteResult.ADDED)
+        self.assertEqual(self.patient.insert_medication(med2, ConflictPolicy.SKIP), WriteResult.SKIPPED)
+        self.assertEqual(self.patient.medication, {"Advil": med1})
+        self.assertEqual(self.patient.insert_medication(med2, ConflictPolicy.OVERWRITE), WriteResult.UPDATED)
+        self.assertEqual(self.patient.medication, {"Advil": med2})
+        with self.assertRaises(RecordConflictError):
+            self.patient.insert_medication(med1)
+
+    def test_delete_medication(self):
+        med = Medication("Advil", "1 tablet", "once a day")
+        self.patient.insert_medication(med)
+        self.assertEqual(self.patient.delete_medication("Advil"), med)
+        self.assertEqual(self.patient.delete_medication("Advil"), None)
+
     def test_remove_medication_for_valid_name(self):
         med = Medication("Advil", "1 tablet", "once a day")
         self.patient.add_medication(med)
@@ -135,7 +349,162 @@ class TestPatient(TestCase):
         self.patient.add_test_results("COVID", "June 26, 2021", "Negative")
         self.assertEqual(self.patient.test_results, {("COVID", "June 26, 2021"): "Negative"})
 
+    def test_insert_test_results_already_exists(self):
+        self.assertEqual(self.patient.insert_test_results("COVID", "26/06/2021", "Negative"), WriteResult.ADDED)
+        self.assertEqual(self.patient.insert_test_results("COVID", "26/06/2021", "Positive", ConflictPolicy.SKIP),
+                         WriteResult.SKIPPED)
+        self.assertEqual(self.patient.insert_test_results("COVID", "26/06/2021", "Positive", ConflictPolicy.OVERWRITE),
+                         WriteResult.UPDATED)
+        self.assertEqual(self.patient.test_results, {("COVID", "26/06/2021"): "Positive"})
+        with self.assertRaises(RecordConflictError):
+            self.patient.insert_test_results("COVID", "26/06/2021", "Negative")
+
+    def test_add_test_results_bulk(self):
+        self.patient.insert_test_results("COVID", "26/06/2021", "Negative")
+        counts = self.patient.add_test_results_bulk([("COVID", "26/06/2021", "Positive"),
+                                                     ("COVID", "02/07/2021", "Negative")], ConflictPolicy.OVERWRITE)
+        self.assertEqual(counts, {WriteResult.ADDED: 1, WriteResult.UPDATED: 1, WriteResult.SKIPPED: 0})
+        self.assertEqual(self.patient.test_results, {("COVID", "26/06/2021"): "Positive",
+                                                     ("COVID", "02/07/2021"): "Negative"})
+
+    def test_test_results_is_read_only(self):
+        self.patient.insert_test_results("COVID", "26/06/2021", "Negative")
+        with self.assertRaises(TypeError):
+            self.patient.test_results[("COVID", "02/07/2021")] = "Positive"
+        with self.assertRaises(TypeError):
+            self.patient.medication["Advil"] = Medication("Advil", "1 tablet", "once a day")
+
+    def test_delete_test_results_keeps_other_dates_indexed(self):
+        self.patient.add_test_results_bulk([("glucose", "02/01/2025", "5.4"), ("glucose", "15/03/2025", "5.1")])
+        self.patient._unindex_test_date("glucose", "01/01/2025")
+        self.patient._unindex_test_date("cholesterol", "02/01/2025")
+        self.patient.delete_test_results("glucose", "15/03/2025")
+        self.assertEqual(self.patient.latest("glucose", 5), [("02/01/2025", "5.4")])
+
+    def test_add_test_results_bulk_counts_duplicates_in_batch_once(self):
+        self.patient.insert_test_results("COVID", "26/06/2021", "Negative")
+        counts = self.patient.add_test_results_bulk([("COVID", "26/06/2021", "Positive"),
+                                                     ("COVID", "26/06/2021", "Negative"),
+                                                     ("COVID", "02/07/2021", "Negative"),
+                                                     ("COVID", "02/07/2021", "Positive")], ConflictPolicy.OVERWRITE)
+        self.assertEqual(counts, {WriteResult.ADDED: 1, WriteResult.UPDATED: 1, WriteResult.SKIPPED: 0})
+
+    def test_add_test_results_bulk_error_adds_nothing(self):
+        with self.assertRaises(RecordConflictError):
+            self.patient.add_test_results_bulk([("COVID", "26/06/2021", "Positive"),
+                                                ("COVID", "26/06/2021", "Negative")])
+        self.assertEqual(self.patient.test_results, {})
+
+    def test_remove_test_results_for_valid_name_date(self):
+        self.patient.add_test_results("COVID", "June 26, 2021", "Negative")
+        self.patient.remove_test_results("COVID", "June 26, 2021")
+        self.assertEqual(self.patient.test_results, {})
+
+    def test_remove_test_results_for_invalid_name_date(self):
+        result = self.patient.remove_test_results("COVID", "June 26, 2021")
+        self.assertEqual(result, None)
+
     def test_clear_test_results(self):
         self.patient.add_test_results("COVID", "June 26, 2021", "Negative")
         self.patient.clear_test_results()
         self.assertEqual(self.patient.test_results, {})
+
+    def test_get_test_results_range(self):
+        self.patient.add_test_results_bulk([("glucose", "15/03/2025", "5.1"), ("glucose", "02/01/2025", "5.4"),
+                                            ("glucose", "31/12/2024", "6.0"), ("glucose", "01/01/2026", "5.8"),
+                                            ("HbA1c", "15/03/2025", "6.1")])
+        self.assertEqual(self.patient.get_test_results_range("glucose", "01/01/2025", "31/12/2025"),
+                         [("02/01/2025", "5.4"), ("15/03/2025", "5.1")])
+        self.assertEqual(self.patient.get_test_results_range("glucose", datetime.date(2024, 12, 31),
+                                                             datetime.date(2025, 1, 2)),
+                         [("31/12/2024", "6.0"), ("02/01/2025", "5.4")])
+
+    def test_get_test_results_range_for_invalid_date(self):
+        with self.assertRaises(ValueError):
+            self.patient.get_test_results_range("glucose", "June 26, 2021", "31/12/2025")
+
+    def test_latest(self):
+        self.patient.add_test_results_bulk([("glucose", "15/03/2025", "5.1"), ("glucose", "02/01/2025", "5.4"),
+                                            ("glucose", "June 26, 2021", "6.0"), ("glucose", "01/01/2026", "5.8")])
+        self.assertEqual(self.patient.latest("glucose", 2), [("01/01/2026", "5.8"), ("15/03/2025", "5.1")])
+        self.assertEqual(self.patient.latest("HbA1c", 2), [])
+
+    def test_latest_after_delete(self):
+        self.patient.insert_test_results("glucose", "15/03/2025", "5.1")
+        self.patient.insert_test_results("glucose", "01/01/2026", "5.8")
+        self.patient.delete_test_results("glucose", "01/01/2026")
+        self.assertEqual(self.patient.latest("glucose"), [("15/03/2025", "5.1")])
+
+    def test_sorted_test_results(self):
+        self.patient.insert_test_results("glucose", "June 26, 2021", "6.0")
+        self.patient.insert_test_results("glucose", "15/03/2025", "5.1")
+        self.patient.insert_test_results("HbA1c", "15/03/2025", "6.1")
+        self.patient.insert_test_results("glucose", "02/01/2025", "5.4")
+        self.assertEqual(list(self.patient.sorted_test_results()),
+                         [("HbA1c", "15/03/2025", "6.1"), ("glucose", "02/01/2025", "5.4"),
+                          ("glucose", "15/03/2025", "5.1"), ("glucose", "June 26, 2021", "6.0")])
+
+
+class TestSnapshot(TestCase):
+
+    def setUp(self):
+        self.system = HealthRecordsSystem()
+        self.jane = Patient(1, "Jane", 20, 123)
+        self.jane.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        self.jane.insert_test_results("glucose", "02/01/2025", "5.4")
+        self.system.insert_patient(self.jane)
+        self.system.insert_patient(Patient(2, "John", 30, 456))
+
+    def tearDown(self):
+        HealthRecordsSystem._reset()
+
+    def test_reads_are_point_in_time(self):
+        with self.system.snapshot() as snapshot:
+            self.jane.insert_test_results("glucose", "15/03/2025", "5.1")
+            self.jane.delete_medication("Advil")
+            self.system.delete_patient(2)
+            self.system.insert_patient(Patient(3, "Jack", 40, 789))
+            self.system.insert_patient(Patient(1, "Jane Doe", 21, 123), ConflictPolicy.OVERWRITE)
+
+            jane = snapshot.find_patient(1)
+            self.assertEqual((jane.name, list(jane.medication)), ("Jane", ["Advil"]))
+            self.assertEqual(jane.latest("glucose", 5), [("02/01/2025", "5.4")])
+            self.assertIsNone(snapshot.find_patient(3))
+            self.assertEqual(sorted(patient.name for patient in snapshot.patients()), ["Jane", "John"])
+        self.assertEqual(len(self.jane.test_results), 2)
+        self.assertEqual(sorted(patient.name for patient in self.system.patients()), ["Jack", "Jane Doe"])
+        with self.assertRaises(ValueError):
+            snapshot.find_patient(1)
+
+    def test_copies_record_on_first_change(self):
+        snapshot = self.system.snapshot()
+        frozen = snapshot.find_patient(1)
+        self.assertIs(frozen._test_results, self.jane._test_results)  # shared until one of them changes
+        self.jane.insert_test_results("glucose", "15/03/2025", "5.1")
+        self.assertIsNot(frozen._test_results, self.jane._test_results)
+        self.assertEqual(list(frozen.test_results), [("glucose", "02/01/2025")])
+        self.assertEqual(self.jane.latest("glucose", 5), [("15/03/2025", "5.1"), ("02/01/2025", "5.4")])
+        self.assertIs(snapshot._preserved[1]._test_results, frozen._test_results)  # one copy for both
+        snapshot.close()
+
+        self.jane.insert_test_results("glucose", "16/03/2025", "5.0")
+        self.assertFalse(self.jane._shared)
+        self.assertEqual(self.system._observers, [])
+
+    def test_iterates_while_patients_change(self):
+        patients = [Patient(i, f"Patient {i}", 20, i) for i in range(10, 1010)]
+        self.system.add_patients_bulk(patients)
+        snapshot = self.system.snapshot()
+
+        def write():
+            for patient in patients:
+                patient.insert_test_results("glucose", "02/01/2025", "5.4")
+                self.system.delete_patient(patient.id - 5)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        read = [(patient.id, len(patient.test_results)) for patient in snapshot.patients()]
+        writer.join()
+        snapshot.close()
+        self.assertEqual(sorted(read), [(1, 1), (2, 0)] + [(i, 0) for i in range(10, 1010)])
+        self.assertEqual(self.system.find_patient(1005).latest("glucose"), [("02/01/2025", "5.4")])
@@ -0,0 +1,53 @@
+from unittest import TestCase
+from src.indexes import *
+
+
+class TestHashIndex(TestCase):
+
+    def setUp(self):
+        self.index = HashIndex()
+
+    def test_get_for_valid_key(self):
+        self.index.add("Jane", 1)
+        self.index.add("Jane", 2)
+        self.assertEqual(self.index.get("Jane"), {1, 2})
+
+    def test_get_for_invalid_key(self):
+        self.assertEqual(self.index.get("Jane"), set())
+
+    def test_remove(self):
+        self.index.add("Jane", 1)
+        self.index.remove("Jane", 1)
+        self.assertEqual(self.index.get("Jane"), set())
+        self.assertEqual(len(self.index), 0)
+
+    def test_remove_for_invalid_key(self):
+        self.index.remove("Jane", 1)
+        self.assertEqual(len(self.index), 0)
+
+
+class TestSortedIndex(TestCase):
+
+    def setUp(self):
+        self.index = SortedIndex()
+        for id, age in [(1, 20), (2, 35), (3, 20), (4, 70)]:
+            self.index.add(age, id)
+
+    def test_range(self):
+        self.assertEqual(set(self.index.range(20, 35)), {1, 2, 3})
+
+    def test_add_many(self):
+        self.index.add_many([(50, 5), (20, 6), (10, 7)])
+        self.assertEqual(list(self.index.range(0, 10)), [7])
+        self.assertEqual(set(self.index.range(20, 50)), {1, 2, 3, 5, 6})
+
+    def test_range_is_sorted_by_key(self):
+        self.assertEqual(list(self.index.range(30, 100)), [2, 4])
+
+    def test_range_for_no_keys(self):
+        self.assertEqual(list(self.index.range(40, 60)), [])
+
+    def test_remove(self):
+        self.index.remove(35, 2)
+        self.assertEqual(self.index._keys, [20, 70])
+        self.assertEqual(set(self.index.range(0, 100)), {1, 3, 4})
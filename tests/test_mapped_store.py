@@ -0,0 +1,95 @@
+import os
+import tempfile
+from unittest import TestCase
+from src.health_records_system import *
+from src.mapped_store import *
+
+
+class TestMappedPatients(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "patients.dat")
+        patient = Patient(1, "Jane", 20, 123)
+        patient.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        patient.insert_test_results("COVID", "26/06/2021", "Negative")
+        patients = [patient, Patient(2, "John", 30, 456), Patient("3", "Jack", 40, 789)]
+        write_store(self.path, ((patient.id, encode_patient(patient)) for patient in patients))
+        self.system = HealthRecordsSystem()
+        self.patients = MappedPatients(self.path, self.system, cache_size=1)
+
+    def tearDown(self):
+        self.patients.close()
+        HealthRecordsSystem._reset()
+        self.directory.cleanup()
+
+    def test_get_for_valid_id(self):
+        patient = self.patients[1]
+        self.assertEqual((patient.name, patient.age), ("Jane", 20))
+        self.assertEqual(patient.get_medication("Advil").dosage, "1 tablet")
+        self.assertEqual(patient.test_results, {("COVID", "26/06/2021"): "Negative"})
+        self.assertIs(patient._system, self.system)
+        self.assertEqual(self.patients["3"].name, "Jack")
+
+    def test_get_for_invalid_id(self):
+        with self.assertRaises(KeyError):
+            self.patients["1"]
+        self.assertNotIn(4, self.patients)
+
+    def test_cache_keeps_recently_used_patients(self):
+        patient = self.patients[1]
+        self.assertIs(self.patients[1], patient)
+        self.patients[2]
+        self.assertIsNot(self.patients[1], patient)
+
+    def test_changed_patients_stay_in_memory(self):
+        self.system.mount(self.patients)
+        patient = self.system.find_patient(1)
+        patient.insert_test_results("COVID", "02/07/2021", "Positive")
+        self.system.find_patient(2)
+        self.assertIs(self.system.find_patient(1), patient)
+
+    def test_add_and_remove(self):
+        self.patients[4] = Patient(4, "Jill", 50, 999)
+        del self.patients[2]
+        self.assertEqual(len(self.patients), 3)
+        self.assertCountEqual(list(self.patients), [1, "3", 4])
+        with self.assertRaises(KeyError):
+            del self.patients[2]
+
+    def test_reload_from_records(self):
+        self.patients[4] = Patient(4, "Jill", 50, 999)
+        del self.patients[2]
+        new_path = os.path.join(self.directory.name, "new.dat")
+        write_store(new_path, self.patients.records())
+        self.patients.reload(new_path)
+        self.assertEqual(len(MappedPatients(new_path)), 3)
+        self.assertEqual(self.patients[4].name, "Jill")
+        self.assertNotIn(2, self.patients)
+
+    def test_mount_builds_indexes_when_queried(self):
+        self.system.mount(self.patients)
+        self.assertFalse(self.system._indexed)
+        self.system.insert_patient(Patient(4, "Jane", 50, 999))
+        self.assertCountEqual([patient.id for patient in self.system.find_by_name("Jane")], [1, 4])
+        self.assertEqual([patient.id for patient in self.system.patients_in_age_range(25, 45)], [2, "3"])
+
+    def test_mount_indexes_medication(self):
+        self.system.mount(self.patients)
+        self.system.find_patient(2).insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        self.assertCountEqual([patient.id for patient in self.system.find_by_medication("Advil")], [1, 2])
+        self.system.find_patient(1).delete_medication("Advil")
+        self.assertEqual([patient.id for patient in self.system.find_by_medication("Advil")], [2])
+
+    def test_mount_into_system_with_patients(self):
+        self.system.insert_patient(Patient(4, "Jill", 50, 999))
+        with self.assertRaises(Exception):
+            self.system.mount(self.patients)
+
+    def test_open_for_invalid_file(self):
+        path = os.path.join(self.directory.name, "invalid.dat")
+        for contents in [b"", b"not a store"]:
+            with open(path, "wb") as store:
+                store.write(contents)
+            with self.assertRaises(ValueError):
+                MappedPatients(path)
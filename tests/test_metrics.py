@@ -0,0 +1,92 @@
+import os
+import tempfile
+import urllib.request
+from unittest import TestCase
+from src.command import *
+from src.health_records_system import *
+from src.metrics import *
+
+
+class TestHistogram(TestCase):
+
+    def test_observe(self):
+        histogram = Histogram((1, 10))
+        for value in [0.5, 1, 5, 50]:
+            histogram.observe(value)
+        self.assertEqual(histogram.cumulative(), [(1, 2), (10, 3), (float("inf"), 4)])
+        self.assertEqual((histogram.count, histogram.sum), (4, 56.5))
+
+
+class TestInvokerMetrics(TestCase):
+
+    def setUp(self):
+        self.system = HealthRecordsSystem()
+        self.patient = Patient(1, "Jane", 20, 123)
+        self.system.insert_patient(self.patient)
+        self.slow = []
+        self.metrics = InvokerMetrics(slow_threshold=0, profile_every=2, on_slow=self.slow.append)
+        self.command = AddTestResultsCommand(self.system, ConflictPolicy.ERROR)
+        self.invoker = Invoker(verbose=False, metrics=self.metrics)
+        self.invoker.register(self.command)
+
+    def tearDown(self):
+        HealthRecordsSystem._reset()
+
+    def test_counts_commands_and_history(self):
+        self.invoker.execute(self.command, self.patient, "COVID", "26/06/2021", "Negative")
+        self.invoker.execute(self.command, self.patient, "COVID", "27/06/2021", "Negative")
+        self.invoker.undo()
+        self.invoker.redo()
+        session = self.invoker.session()
+        session.execute(self.command, self.patient, "COVID", "28/06/2021", "Positive")
+
+        snapshot = self.metrics.snapshot()
+        commands = snapshot["commands"]
+        self.assertEqual(commands[("execute", "AddTestResultsCommand")]["count"], 3)
+        self.assertEqual(commands[("undo", "AddTestResultsCommand")]["count"], 1)
+        self.assertEqual(commands[("redo", "AddTestResultsCommand")]["count"], 1)
+        self.assertEqual((snapshot["invokers"], snapshot["history_depth"]), (2, 3))
+        self.assertEqual(snapshot["history_bytes"], self.invoker.history_bytes + session.history_bytes)
+
+    def test_counts_errors(self):
+        self.invoker.execute(self.command, self.patient, "COVID", "26/06/2021", "Negative")
+        with self.assertRaises(RecordConflictError):
+            self.invoker.execute(self.command, self.patient, "COVID", "26/06/2021", "Positive")
+        counts = self.metrics.snapshot()["commands"][("execute", "AddTestResultsCommand")]
+        self.assertEqual((counts["count"], counts["errors"]), (2, 1))
+
+    def test_profiles_sample_of_slow_commands(self):
+        for day in range(10, 14):
+            self.invoker.execute(self.command, self.patient, "COVID", f"{day}/06/2021", "Negative")
+        self.assertEqual(len(self.metrics.slow), 4)
+        self.assertEqual(self.slow, self.metrics.slow)
+        self.assertEqual([record.profile is not None for record in self.slow], [False, True, False, True])
+        self.assertEqual(self.metrics.snapshot()["commands"][("execute", "AddTestResultsCommand")]["slow"], 4)
+
+    def test_prometheus_text(self):
+        self.invoker.execute(self.command, self.patient, "COVID", "26/06/2021", "Negative")
+        text = self.metrics.to_prometheus()
+        self.assertIn('health_records_command_seconds_count{operation="execute",command="AddTestResultsCommand"} 1',
+                      text)
+        self.assertIn('le="+Inf"} 1', text)
+        self.assertIn("# TYPE health_records_history_depth gauge\nhealth_records_history_depth 1", text)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.prom")
+            self.metrics.write(path)
+            with open(path) as metrics_file:
+                self.assertEqual(metrics_file.read(), text)
+
+        server = self.metrics.serve(port=0)
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+                self.assertEqual(response.read().decode(), text)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_disabled_by_default(self):
+        invoker = Invoker(verbose=False)
+        invoker.register(self.command)
+        invoker.execute(self.command, self.patient, "COVID", "26/06/2021", "Negative")
+        self.assertEqual(self.metrics.snapshot()["commands"], {})
@@ -0,0 +1,70 @@
+import multiprocessing
+import os
+import unittest
+from unittest import TestCase
+from src.health_records_system import *
+from src.replica import *
+from src.replica import shared_memory
+
+
+def _read_name(name, id, queue):
+    with ReplicaReader(name) as reader:
+        queue.put(reader.find_patient(id).name)
+
+
+@unittest.skipUnless(shared_memory, "shared memory requires Python 3.8 or later")
+class TestReplica(TestCase):
+
+    def setUp(self):
+        self.system = HealthRecordsSystem()
+        patient = Patient(1, "Jane", 20, "555-0100")
+        patient.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        patient.insert_test_results("HbA1c", "26/06/2021", 5.5)
+        self.system.add_patients_bulk([patient, Patient("2", "John", 30, 456)])
+        self.publisher = ReplicaPublisher(self.system, f"test_replica_{os.getpid()}")
+
+    def tearDown(self):
+        self.publisher.close()
+        HealthRecordsSystem._reset()
+
+    def test_record_round_trip(self):
+        patient = self.system.find_patient(1)
+        copy = decode_record(encode_record(patient))
+        self.assertEqual(copy.to_dict(), patient.to_dict())
+
+    def test_read_published_patients(self):
+        self.assertEqual(self.publisher.publish(), 1)
+        with ReplicaReader(self.publisher.name) as reader:
+            self.assertEqual(len(reader), 2)
+            self.assertEqual(reader.find_patient(1).to_dict(), self.system.find_patient(1).to_dict())
+            self.assertEqual(reader.find_patient("2").name, "John")
+            self.assertIsNone(reader.find_patient(2))
+            self.assertNotIn(3, reader)
+            self.assertCountEqual([patient.id for patient in reader.patients()], [1, "2"])
+
+    def test_refresh_after_change(self):
+        self.publisher.publish()
+        with ReplicaReader(self.publisher.name) as reader:
+            self.assertEqual(self.publisher.publish(), 1)  # nothing has changed
+            self.assertFalse(reader.refresh())
+            self.system.insert_patient(Patient(3, "Jack", 40, 789))
+            self.assertEqual(self.publisher.publish(), 2)
+            self.assertIsNone(reader.find_patient(3))
+            self.assertTrue(reader.refresh())
+            self.assertEqual((reader.version, reader.find_patient(3).name), (2, "Jack"))
+
+    def test_read_from_another_process(self):
+        self.publisher.publish()
+        queue = multiprocessing.Queue()
+        reader = multiprocessing.Process(target=_read_name, args=(self.publisher.name, 1, queue))
+        reader.start()
+        self.assertEqual(queue.get(timeout=30), "Jane")
+        reader.join()
+        with ReplicaReader(self.publisher.name) as reader:  # the reader exiting does not remove the replica
+            self.assertEqual(reader.find_patient(1).name, "Jane")
+
+    def test_reader_before_publish(self):
+        with self.assertRaises(LookupError):
+            ReplicaReader(self.publisher.name)
+        with self.assertRaises(FileNotFoundError):
+            ReplicaReader(f"missing_replica_{os.getpid()}")
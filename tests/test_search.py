@@ -0,0 +1,72 @@
+from unittest import TestCase
+from src.health_records_system import *
+from src.search import *
+
+
+class TestTextIndex(TestCase):
+
+    def setUp(self):
+        self.index = TextIndex()
+        for item, text in enumerate(["Jane Doe", "John Doe", "Janet Smith", "Jack Jones", "Jane Jones"]):
+            self.index.add(text, item)
+
+    def test_prefix(self):
+        self.assertEqual(sorted(self.index.prefix("ja")), [0, 2, 3, 4])
+        self.assertEqual(sorted(self.index.prefix("JANE")), [0, 2, 4])
+        self.assertEqual(sorted(self.index.prefix("ja do")), [0])
+        self.assertEqual(sorted(self.index.prefix("jo")), [1, 3, 4])
+        self.assertEqual(len(self.index.prefix("j", k=2)), 2)
+        self.assertEqual(self.index.prefix("x"), [])
+        self.assertEqual(self.index.prefix(" "), [])
+
+    def test_fuzzy(self):
+        self.assertEqual(self.index.fuzzy("jnoes")[:2], [3, 4])
+        self.assertEqual(self.index.fuzzy("Smiht"), [2])
+        self.assertEqual(self.index.fuzzy("janet", k=1), [2])
+        self.assertEqual(self.index.fuzzy("xyz"), [])
+
+    def test_remove(self):
+        self.index.remove("Janet Smith", 2)
+        self.assertEqual(self.index.fuzzy("Smith"), [])
+        self.assertEqual(sorted(self.index.prefix("jane")), [0, 4])
+        self.index.remove("Jane Doe", 0)
+        self.assertEqual(self.index.prefix("doe"), [1])
+
+
+class TestSearchIndex(TestCase):
+
+    def setUp(self):
+        self.system = HealthRecordsSystem()
+        self.jane = Patient(1, "Jane Doe", 20, 123)
+        self.jane.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        self.system.insert_patient(self.jane)
+        self.search = SearchIndex(self.system)
+
+    def tearDown(self):
+        HealthRecordsSystem._reset()
+
+    def test_follows_changes(self):
+        john = Patient(2, "John Doe", 30, 456)
+        john.insert_medication(Medication("Amoxicillin", "500 mg", "three times a day"))
+        self.system.insert_patient(john)
+        self.assertEqual([patient.id for patient in self.search.patients("doe")], [1, 2])
+        self.assertEqual([patient.id for patient in self.search.patients("do JO")], [2])
+        self.assertEqual(sorted(self.search.medication("a")), ["Advil", "Amoxicillin"])
+
+        self.jane.insert_medication(Medication("Amoxicillin", "250 mg", "twice a day"))
+        self.system.delete_patient(2)
+        self.assertEqual([patient.id for patient in self.search.patients("jo")], [])
+        self.assertEqual(sorted(self.search.medication("a")), ["Advil", "Amoxicillin"])
+        self.jane.delete_medication("Amoxicillin")
+        self.jane.insert_medication(Medication("Advil", "2 tablets", "once a day"), ConflictPolicy.OVERWRITE)
+        self.assertEqual(self.search.medication("a"), ["Advil"])
+        self.jane.clear_medication()
+        self.assertEqual(self.search.medication("a"), [])
+        self.assertEqual(self.search.medication("advl", fuzzy=True), [])
+
+    def test_fuzzy_patients(self):
+        self.assertEqual(self.search.patients("Jame", fuzzy=True), [self.jane])
+        self.assertEqual(self.search.medication("Advli", fuzzy=True), ["Advil"])
+        self.search.close()
+        self.system.delete_patient(1)
+        self.assertEqual(self.search.patients("jane"), [])  # the ID is no longer in the system
@@ -0,0 +1,89 @@
+import asyncio
+import json
+from unittest import TestCase
+from src.health_records_system import *
+from src.server import *
+
+
+class TestServer(TestCase):
+
+    def setUp(self):
+        self.system = HealthRecordsSystem()
+        self.system.insert_patient(Patient(1, "Jane", 20, 123))
+        self.server = Server(self.system)
+        self.session = self.server._invoker.session()
+
+    def tearDown(self):
+        HealthRecordsSystem._reset()
+
+    def request(self, **request):
+        return self.server.handle(self.session, request)
+
+    def test_get_patient(self):
+        response = self.request(op="get_patient", id=1)
+        self.assertTrue(response["ok"])
+        self.assertEqual(response["result"]["name"], "Jane")
+        self.assertFalse(self.request(op="get_patient", id=2)["ok"])
+
+    def test_add_patient_with_conflict_policy(self):
+        patient = {"id": 1, "name": "John", "age": 30, "phone_number": 456}
+        self.assertFalse(self.request(op="add_patient", patient=patient)["ok"])
+        self.assertTrue(self.request(op="add_patient", patient=patient, on_conflict="skip")["ok"])
+        self.assertEqual(self.system.find_patient(1).name, "Jane")
+        self.assertTrue(self.request(op="add_patient", patient=patient, on_conflict="overwrite")["ok"])
+        self.assertEqual(self.system.find_patient(1).name, "John")
+        self.assertFalse(self.request(op="add_patient", patient=patient, on_conflict="ask")["ok"])
+
+    def test_medication_and_test_results(self):
+        med = {"name": "Advil", "dosage": "1 tablet", "frequency": "once a day"}
+        self.assertTrue(self.request(op="add_medication", id=1, medication=med)["ok"])
+        self.assertTrue(self.request(op="add_test_results", id=1, name="COVID", date="26/06/2021",
+                                     result="Negative")["ok"])
+        patient = self.system.find_patient(1)
+        self.assertEqual(patient.test_results, {("COVID", "26/06/2021"): "Negative"})
+        self.assertTrue(self.request(op="remove_medication", id=1, name="Advil")["ok"])
+        self.assertFalse(self.request(op="remove_medication", id=1, name="Advil")["ok"])
+        self.assertEqual(len(patient.medication), 0)
+
+    def test_undo_and_redo(self):
+        self.request(op="remove_patient", id=1)
+        self.assertIsNone(self.system.find_patient(1))
+        self.assertEqual(self.request(op="undo"), {"ok": True, "result": True})
+        self.assertEqual(self.system.find_patient(1).name, "Jane")
+        self.assertEqual(self.request(op="undo"), {"ok": True, "result": False})
+        self.assertEqual(self.request(op="redo"), {"ok": True, "result": True})
+        self.assertIsNone(self.system.find_patient(1))
+
+    def test_invalid_requests(self):
+        for request in [[], {"op": "drop"}, {"op": "get_patient"}, {"op": "add_patient", "patient": {"id": 2}}]:
+            response = self.server.handle(self.session, request)
+            self.assertFalse(response["ok"])
+            self.assertIn("error", response)
+
+    def test_connections_have_own_history(self):
+        async def send(reader, writer, request):
+            writer.write(json.dumps(request).encode() + b"\n")
+            await writer.drain()
+            return json.loads(await reader.readline())
+
+        async def run():
+            host, port = await self.server.start_tcp()
+            first = await asyncio.open_connection(host, port)
+            second = await asyncio.open_connection(host, port)
+            med = {"name": "Advil", "dosage": "1 tablet", "frequency": "once a day"}
+            await send(*first, {"op": "add_medication", "id": 1, "medication": med})
+            await send(*second, {"op": "add_test_results", "id": 1, "name": "COVID", "date": "26/06/2021",
+                                 "result": "Negative"})
+            undone = await send(*first, {"op": "undo"})
+            invalid = await send(*second, "not a request")
+            for _, writer in (first, second):
+                writer.close()
+            await self.server.close()
+            return undone, invalid
+
+        undone, invalid = asyncio.run(run())
+        self.assertEqual(undone, {"ok": True, "result": True})
+        self.assertFalse(invalid["ok"])
+        patient = self.system.find_patient(1)
+        self.assertEqual(len(patient.medication), 0)
+        self.assertEqual(len(patient.test_results), 1)
@@ -0,0 +1,73 @@
+import tempfile
+from unittest import TestCase
+from src.command import *
+from src.health_records_system import *
+from src.sharding import *
+
+
+class TestShardedSystem(TestCase):
+
+    def setUp(self):
+        self.system = ShardedSystem(shards=2)
+
+    def tearDown(self):
+        self.system.close()
+
+    def test_patients_are_spread_across_shards(self):
+        self.system.execute_many(AddPatientCommand, [(Patient(id, "Jane", 20, 123),) for id in range(20)])
+        self.assertEqual(len(self.system), 20)
+        self.assertEqual({self.system.shard_of(id) for id in range(20)}, {0, 1})
+        self.assertEqual(self.system.shard_of(7), shard_of(7, 2))
+        found = self.system.find_patients([3, 20, 11])
+        self.assertEqual([found[0].id, found[1], found[2].id], [3, None, 11])
+        self.assertCountEqual([patient.id for patient in self.system.patients()], range(20))
+
+    def test_insert_and_delete_patient(self):
+        self.assertEqual(self.system.insert_patient(Patient(1, "Jane", 20, 123)), WriteResult.ADDED)
+        with self.assertRaises(RecordConflictError):
+            self.system.insert_patient(Patient(1, "John", 30, 456))
+        self.system.insert_patient(Patient(1, "John", 30, 456), ConflictPolicy.OVERWRITE)
+        self.assertEqual(self.system.find_patient(1).name, "John")
+        self.assertEqual(self.system.delete_patient(1).name, "John")
+        self.assertIsNone(self.system.find_patient(1))
+        self.assertIsNone(self.system.delete_patient(1))
+
+    def test_undo_and_redo_across_shards(self):
+        ids = [id for id in range(10) if self.system.shard_of(id) == 0][:1] + \
+            [id for id in range(10) if self.system.shard_of(id) == 1][:1]
+        for id in ids:
+            self.system.execute(AddPatientCommand, Patient(id, "Jane", 20, 123))
+        med = Medication("Advil", "1 tablet", "once a day")
+        self.system.execute(AddMedicationCommand, ids[0], med)
+        self.system.execute(RemovePatientCommand, ids[1])
+        self.assertTrue(self.system.undo())
+        self.assertEqual(self.system.find_patient(ids[1]).name, "Jane")
+        self.assertTrue(self.system.undo())
+        self.assertEqual(self.system.find_patient(ids[0]).medication, {})
+        self.assertTrue(self.system.redo())
+        self.assertEqual(self.system.find_patient(ids[0]).get_medication("Advil").dosage, "1 tablet")
+        self.system.execute(AddTestResultsCommand, ids[1], "COVID", "26/06/2021", "Negative")
+        self.assertFalse(self.system.redo())
+        self.assertEqual(self.system.find_patient(ids[1]).test_results, {("COVID", "26/06/2021"): "Negative"})
+
+    def test_failed_commands_are_not_recorded(self):
+        with self.assertRaises(LookupError):
+            self.system.execute(AddMedicationCommand, 1, Medication("Advil", "1 tablet", "once a day"))
+        patients = [(Patient(id, "Jane", 20, 123),) for id in range(3)]
+        self.system.execute(AddPatientCommand, *patients[1])
+        with self.assertRaises(RecordConflictError):
+            self.system.execute_many(AddPatientCommand, patients)
+        self.assertEqual(len(self.system), 3)
+        self.assertTrue(self.system.undo())
+        self.assertTrue(self.system.undo())
+        self.assertTrue(self.system.undo())
+        self.assertFalse(self.system.undo())
+        self.assertEqual(len(self.system), 0)
+
+    def test_shards_keep_patients_in_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with ShardedSystem(shards=2, directory=directory) as system:
+                system.execute_many(AddPatientCommand, [(Patient(id, "Jane", 20, 123),) for id in range(10)])
+            with ShardedSystem(shards=2, directory=directory) as system:
+                self.assertEqual(len(system), 10)
+                self.assertEqual(system.find_patient(4).name, "Jane")
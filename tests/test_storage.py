@@ -0,0 +1,121 @@
+import os
+import tempfile
+from unittest import TestCase
+from src.health_records_system import *
+from src.mapped_store import MappedPatients
+from src.storage import *
+
+
+class TestStorage(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.system = HealthRecordsSystem()
+
+    def tearDown(self):
+        HealthRecordsSystem._reset()
+        self.directory.cleanup()
+
+    def _recover(self, **kwargs):
+        """
+        Simulates a restart by recovering a new system from the storage directory
+        :return: the number of logged changes that were replayed
+        """
+        HealthRecordsSystem._reset()
+        self.system = HealthRecordsSystem()
+        return Storage(self.directory.name, **kwargs).open(self.system)
+
+    def _make_changes(self):
+        patient = Patient(1, "Jane", 20, 123)
+        self.system.insert_patient(patient)
+        self.system.insert_patient(Patient(2, "John", 30, 456))
+        patient.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        patient.insert_medication(Medication("Tylenol", "2 tablets", "twice a day"))
+        patient.delete_medication("Tylenol")
+        patient.insert_test_results("COVID", "26/06/2021", "Negative")
+        self.system.delete_patient(2)
+
+    def _assert_recovered(self):
+        patient = self.system.find_patient(1)
+        self.assertEqual(list(patient.medication), ["Advil"])
+        self.assertEqual(patient.test_results, {("COVID", "26/06/2021"): "Negative"})
+        self.assertEqual(self.system.find_patient(2), None)
+        self.assertEqual(self.system.find_by_name("Jane"), [patient])
+
+    def test_recover_from_log(self):
+        Storage(self.directory.name).open(self.system)
+        self._make_changes()
+        self.assertEqual(self._recover(), 7)
+        self._assert_recovered()
+
+    def test_recover_from_snapshot_and_log(self):
+        storage = Storage(self.directory.name)
+        storage.open(self.system)
+        self._make_changes()
+        storage.checkpoint()
+        self.assertEqual(os.path.getsize(storage.log_path), 0)
+        self.system.find_patient(1).insert_test_results("COVID", "02/07/2021", "Positive")
+        self.assertEqual(self._recover(), 1)
+        self.assertEqual(self.system.find_patient(1).latest("COVID"), [("02/07/2021", "Positive")])
+
+    def test_recover_after_close(self):
+        storage = Storage(self.directory.name)
+        storage.open(self.system)
+        self._make_changes()
+        storage.close()
+        self._recover()
+        self._assert_recovered()
+
+    def test_recover_ignores_partial_change(self):
+        storage = Storage(self.directory.name)
+        storage.open(self.system)
+        self._make_changes()
+        with open(storage.log_path, "a") as log:
+            log.write('{"op": "patient_removed", "id"')
+        self._recover()
+        self._assert_recovered()
+
+    def test_recovered_changes_are_logged(self):
+        Storage(self.directory.name).open(self.system)
+        self._make_changes()
+        self._recover()
+        self.system.find_patient(1).delete_medication("Advil")
+        self._recover()
+        self.assertEqual(self.system.find_patient(1).medication, {})
+
+    def test_open_when_already_open(self):
+        storage = Storage(self.directory.name)
+        storage.open(self.system)
+        with self.assertRaises(Exception):
+            storage.open(self.system)
+
+    def test_change_not_applied_when_it_cannot_be_logged(self):
+        Storage(self.directory.name).open(self.system)
+        patient = Patient(1, "Jane", 20, 123)
+        self.system.insert_patient(patient)
+        with self.assertRaises(TypeError):
+            patient.insert_test_results("COVID", "26/06/2021", object())
+        self.assertEqual(patient.test_results, {})
+        self.assertEqual(self._recover(), 1)
+
+    def test_sync_every(self):
+        storage = Storage(self.directory.name, sync_every=3)
+        storage.open(self.system)
+        self.system.insert_patient(Patient(1, "Jane", 20, 123))
+        self.system.insert_patient(Patient(2, "John", 30, 456))
+        self.assertEqual(os.path.getsize(storage.log_path), 0)
+        self.system.insert_patient(Patient(3, "Jack", 40, 789))
+        with open(storage.log_path) as log:
+            self.assertEqual(len(log.readlines()), 3)
+
+    def test_checkpoint_every(self):
+        storage = Storage(self.directory.name, checkpoint_every=2)
+        storage.open(self.system)
+        self.system.insert_patient(Patient(1, "Jane", 20, 123))
+        self.system.insert_patient(Patient(2, "John", 30, 456))
+        self.system.insert_patient(Patient(3, "Jack", 40, 789))
+        self.assertEqual(len(MappedPatients(storage.snapshot_path)), 2)
+        with open(storage.log_path) as log:
+            self.assertEqual(len(log.readlines()), 1)
+        self._recover()
+        self.assertEqual(len(list(self.system.patients())), 3)
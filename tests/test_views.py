@@ -0,0 +1,70 @@
+from unittest import TestCase, mock
+from src.health_records_system import *
+from src.views import *
+
+
+class TestRender(TestCase):
+
+    def test_render(self):
+        patient = Patient(1, "Jane", 20, 123)
+        self.assertEqual(render_summary(patient), "Name: Jane\nAge: 20\nPhone number: 123\nID number: 1")
+        self.assertEqual(render_medication(patient), "This patient is not taking any medication.")
+        self.assertEqual(render_test_results(patient), "This patient has no test results to display.")
+        patient.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        patient.insert_test_results("glucose", "15/03/2025", "5.1")
+        patient.insert_test_results("glucose", "02/01/2025", "5.4")
+        self.assertEqual(render_medication(patient), "Medication: Advil, Dosage: 1 tablet, Frequency: once a day")
+        self.assertEqual(render_test_results(patient), "Test: glucose, Date: 02/01/2025, Result: 5.4\n\n"
+                                                       "Test: glucose, Date: 15/03/2025, Result: 5.1\n")
+
+
+class TestViewCache(TestCase):
+
+    def setUp(self):
+        self.system = HealthRecordsSystem()
+        self.patient = Patient(1, "Jane", 20, 123)
+        self.system.insert_patient(self.patient)
+        self.cache = ViewCache(self.system, max_size=3)
+
+    def tearDown(self):
+        HealthRecordsSystem._reset()
+
+    def test_hits_until_patient_changes(self):
+        self.assertEqual(self.cache.get(1, "medication"), "This patient is not taking any medication.")
+        self.assertIs(self.cache.get(1, "record"), self.cache.get(1, "record"))
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 2, "evictions": 0, "size": 2})
+
+        self.patient.insert_medication(Medication("Advil", "1 tablet", "once a day"))
+        self.assertEqual(self.cache.get(1, "medication"), "Medication: Advil, Dosage: 1 tablet, Frequency: once a day")
+        self.assertEqual(self.cache.get(1, "record")["medication"], [self.patient.get_medication("Advil").to_dict()])
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 4))
+
+    def test_patient_removed_and_added_again(self):
+        self.assertEqual(self.cache.get(1), "Name: Jane\nAge: 20\nPhone number: 123\nID number: 1")
+        self.system.delete_patient(1)
+        self.assertIsNone(self.cache.get(1))
+        self.system.insert_patient(Patient(1, "John", 30, 456))
+        self.assertEqual(self.cache.get(1), "Name: John\nAge: 30\nPhone number: 456\nID number: 1")
+        self.assertIsNone(self.cache.get(2))
+        with self.assertRaises(ValueError):
+            self.cache.get(1, "history")
+
+    def test_lru_eviction_and_ttl(self):
+        for id in range(2, 5):
+            self.system.insert_patient(Patient(id, f"Patient {id}", 20, id))
+        for id in (1, 2, 3, 1, 4):
+            self.cache.get(id)
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 4, "evictions": 1, "size": 3})
+        self.cache.get(2)  # evicted as the least recently used
+        self.assertEqual(self.cache.misses, 5)
+
+        cache = ViewCache(self.system, ttl=60)
+        with mock.patch("src.views.time.monotonic", return_value=1000):
+            cache.get(1)
+            cache.get(1)
+        with mock.patch("src.views.time.monotonic", return_value=1060):
+            cache.get(1)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        cache.close()
+        self.assertEqual(len(cache), 0)
+        self.assertNotIn(cache, self.system._observers)